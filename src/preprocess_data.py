@@ -1,44 +1,84 @@
+import sys
 import cv2
-import numpy as np
 from pathlib import Path
-from data_load import load_data, load_params
+
+# The stage modules import each other by name, so make them importable from here
+sys.path.insert(0, str(Path(__file__).resolve().parent / "stages"))
+from data_load import load_params
+from catalog import Catalog
+from image_io import decode_image, letterbox_image, letterbox_labels
+from yolo_labels import load_yolo_labels, save_yolo_labels
+from instrument import configure, instrument
 
 def preprocess_image(image, target_size):
     return cv2.resize(image, target_size)
 
-def preprocess_data(params):
-    image_files, label_files = load_data(params)
+def preprocess_data(params, catalog=None):
+    """
+    Resize every source image to the model input size and write it with its label.
+
+    Args:
+        params (dict): Parameters from params.yaml. Uses data.source_dir, images_dir,
+                       labels_dir, processed_* and the preprocessing section.
+        catalog (Catalog): Dataset catalog to list files from. Default scans into a new in-memory catalog.
+    """
+    source_dir = Path(params['data']['source_dir'])
+    catalog = catalog or Catalog()
+    pairs = catalog.pairs(source_dir / params['data']['images_dir'], source_dir / params['data']['labels_dir'])
+
     processed_dir = Path(params['data']['processed_dir'])
-    processed_dir.mkdir(parents=True, exist_ok=True)
-    
+    processed_image_dir = processed_dir / params['data']['processed_image']
+    processed_label_dir = processed_dir / params['data']['processed_labels']
+    processed_image_dir.mkdir(parents=True, exist_ok=True)
+    processed_label_dir.mkdir(parents=True, exist_ok=True)
 
     target_size = tuple(params['preprocessing']['resize'])
+    letterbox = params['preprocessing']['letterbox']
+    reduced = params['preprocessing']['reduced_decode']
+
+    with instrument("preprocess_data", total=len(pairs)) as metrics:
+        for idx, (image_path, label_path) in enumerate(pairs):
+            # load image, decoding only as many pixels as the target size needs
+            with metrics.phase("decode"):
+                image = decode_image(image_path, target_size, reduced=reduced)
+            if image is None:
+                print(f"Warning: Unable to read image at {image_path}. Skipping...")
+                metrics.count("skipped")
+                continue
 
-    for idx, (image_path, label_path) in enumerate(zip(image_files, label_files)):
-        # load image
-        image = cv2.imread(str(image_path))
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            output_image_path = processed_image_dir / f"processed_{idx}.jpg"
+            output_label_path = processed_label_dir / f"processed_{idx}.txt"
 
-        # preprocess the image
-        preprocessed_image = preprocess_image(image, target_size)
+            # preprocess the image (and labels, when the aspect ratio is preserved)
+            with metrics.phase("transform"):
+                if letterbox:
+                    decoded_size = (image.shape[1], image.shape[0])
+                    preprocessed_image, scale, pad = letterbox_image(image, target_size)
+                    labels = letterbox_labels(load_yolo_labels(label_path), decoded_size, scale, pad, target_size)
+                else:
+                    preprocessed_image = preprocess_image(image, target_size)
 
-        # save the processed image
-        output_image_path = processed_dir /params['processed_image']/ f"processed_{idx}.jpg"
-        cv2.imwrite(str(output_image_path), cv2.cvtColor(preprocessed_image, cv2.COLOR_RGB2BGR))
+            with metrics.phase("copy"):
+                if letterbox:
+                    save_yolo_labels(output_label_path, labels)
+                else:
+                    # copy the label files
+                    with open(label_path, "r") as src, open(output_label_path, "w") as dest:
+                        dest.write(src.read())
 
-        # copy the label files
-        output_label_path = processed_dir /params['processed_labels'] /f"processed_{idx}.txt"
-        with open(label_path, "r") as src, open(output_label_path, "w") as dest:
-            dest.write(src.read())
+            # save the processed image
+            with metrics.phase("encode"):
+                cv2.imwrite(str(output_image_path), preprocessed_image)
 
-        print(f"Saved processed data: {output_image_path}, {output_label_path}")
+            metrics.item(image_path.stat().st_size)
 
-    def main():
-        # load the parameters
-        params = load_params()
+def main():
+    # load the parameters
+    params = load_params()
+    configure(params['instrumentation'])
 
-        # preprocess the data
-        preprocess_data(params)
+    # preprocess the data
+    preprocess_data(params, catalog=Catalog(params['catalog']['path']))
 
-    if __name__ == "__main__":
-        main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
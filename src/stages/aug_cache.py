@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import albumentations as A
+
+CACHE_FILE = ".aug_cache.json"
+
+def file_digest(path):
+    """Return the BLAKE2b hex digest of a file's contents."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def pipeline_fingerprint(augmentations, **config):
+    """
+    Fingerprint a list of augmentation pipelines plus any extra settings that
+    change the outputs (seed, target size, output prefix, ...).
+    """
+    payload = {
+        "pipelines": [A.to_dict(pipeline) for pipeline in augmentations],
+        "config": config,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def _stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+class AugmentationCache:
+    """
+    Content-addressed record of which augmented outputs were produced from which source pair.
+
+    Entries are keyed by the output stem of a source pair (aug_{prefix}_{source stem}). Each entry
+    stores the hash of the source image+label contents and the names it produced. The hash
+    is only recomputed when the size or mtime of a source file changed.
+    """
+
+    def __init__(self, cache_path, fingerprint):
+        self.cache_path = Path(cache_path)
+        self.fingerprint = fingerprint
+        self.entries = {}
+        if self.cache_path.exists():
+            try:
+                data = json.loads(self.cache_path.read_text())
+            except (OSError, ValueError) as e:
+                print(f"Warning: Ignoring unreadable augmentation cache {self.cache_path}: {e}")
+                data = {}
+            self.entries = data.get("entries", {})
+            self._valid = data.get("fingerprint") == fingerprint
+        else:
+            self._valid = False
+
+    def source_key(self, stem, image_path, label_path):
+        """Return the content hash of a source pair, reusing the cached hash when the files are untouched."""
+        image_stat, label_stat = _stat(image_path), _stat(label_path)
+        entry = self.entries.get(stem)
+        if (entry and entry["image"] == str(image_path) and entry["label"] == str(label_path)
+                and entry["image_stat"] == image_stat and entry["label_stat"] == label_stat):
+            return entry["key"], image_stat, label_stat
+
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(file_digest(image_path).encode())
+        digest.update(file_digest(label_path).encode())
+        return digest.hexdigest(), image_stat, label_stat
+
+    def is_fresh(self, stem, key, output_paths):
+        """Check whether the outputs recorded for stem were built from key with the current pipelines."""
+        entry = self.entries.get(stem)
+        return (self._valid and entry is not None and entry["key"] == key
+                and entry["outputs"] == [str(path) for path in output_paths]
+                and all(path.exists() for path in output_paths))
+
+    def update(self, new_entries):
+        """
+        Replace the cache contents and delete outputs that are no longer produced.
+
+        Args:
+            new_entries (dict): stem -> entry for every source pair in the current run.
+
+        Returns:
+            int: Number of stale output files removed.
+        """
+        keep = {output for entry in new_entries.values() for output in entry["outputs"]}
+        pruned = 0
+        for entry in self.entries.values():
+            for output in entry["outputs"]:
+                if output not in keep and os.path.exists(output):
+                    os.remove(output)
+                    pruned += 1
+
+        self.entries = new_entries
+        self._valid = True
+        tmp_path = self.cache_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"fingerprint": self.fingerprint, "entries": new_entries}, indent=1))
+        os.replace(tmp_path, self.cache_path)
+        return pruned
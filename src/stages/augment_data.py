@@ -1,7 +1,19 @@
+import contextlib
+import hashlib
+import os
+import random
+import threading
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import albumentations as A
 import numpy as np
 from pathlib import Path
+from data_load import load_params
+from catalog import Catalog
+from encoder import DEFAULT_OUTPUT, ImageWriter, output_extension
+from aug_cache import CACHE_FILE, AugmentationCache, pipeline_fingerprint
+from instrument import StageMetrics, configure, instrument
+from yolo_labels import load_yolo_labels, save_yolo_labels, yolo_to_pascal_voc, pascal_voc_to_yolo
 
 def read_yolo_label(label_path, image_width, image_height):
     """
@@ -9,48 +21,23 @@ def read_yolo_label(label_path, image_width, image_height):
     YOLO format: [class_id, x_center, y_center, width, height] (normalized)
     Albumentations format: [x_min, y_min, x_max, y_max] (unnormalized)
     """
-    if not label_path.exists():
-        raise FileNotFoundError(f"Label file not found at {label_path}. Check the file path.")
-
-    with open(label_path, 'r') as file:
-        lines = file.readlines()
-    
-    boxes = []
-    class_ids = []
-    for line in lines:
-        class_id, x_center, y_center, width, height = map(float, line.strip().split())
-        
-        # Convert YOLO format to Albumentations format
-        x_min = (x_center - width / 2) * image_width
-        y_min = (y_center - height / 2) * image_height
-        x_max = (x_center + width / 2) * image_width
-        y_max = (y_center + height / 2) * image_height
-        
-        boxes.append([x_min, y_min, x_max, y_max])
-        class_ids.append(class_id)
-    
+    boxes, class_ids = yolo_to_pascal_voc(load_yolo_labels(label_path), image_width, image_height)
     return boxes, class_ids
 
 def write_yolo_label(label_path, boxes, class_ids, image_width, image_height):
     """
     Convert bounding boxes back to YOLO format and save to a label file.
     """
-    with open(label_path, 'w') as file:
-        for box, class_id in zip(boxes, class_ids):
-            x_min, y_min, x_max, y_max = box
-            
-            # Convert Albumentations format to YOLO format
-            x_center = ((x_min + x_max) / 2) / image_width
-            y_center = ((y_min + y_max) / 2) / image_height
-            width = (x_max - x_min) / image_width
-            height = (y_max - y_min) / image_height
-            
-            file.write(f"{int(class_id)} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
+    save_yolo_labels(label_path, pascal_voc_to_yolo(boxes, class_ids, image_width, image_height))
 
 def apply_augmentation(image, boxes, class_ids, augmentation_pipeline):
     """
     Apply augmentations to the image and bounding boxes.
+
+    Pixel-only pipelines (built without bbox_params) leave the boxes untouched.
     """
+    if "bboxes" not in augmentation_pipeline.processors:
+        return augmentation_pipeline(image=image)['image'], boxes, class_ids
     transformed = augmentation_pipeline(image=image, bboxes=boxes, class_labels=class_ids)
     transformed_image = transformed['image']
     transformed_boxes = transformed['bboxes']
@@ -58,96 +45,302 @@ def apply_augmentation(image, boxes, class_ids, augmentation_pipeline):
     
     return transformed_image, transformed_boxes, transformed_class_ids
 
-def augment_data(source_images_dir, source_labels_dir, augmented_images_dir, augmented_labels_dir, prefix):
+def build_augmentations():
     """
-    Apply augmentations to images and labels and save the augmented data.
+    Build the list of branch pipelines applied to every source image.
 
-    Args:
-        source_images_dir (Path): Directory containing the source images.
-        source_labels_dir (Path): Directory containing the source labels.
-        augmented_images_dir (Path): Directory to save the augmented images.
-        augmented_labels_dir (Path): Directory to save the augmented labels.
-        prefix (str): Prefix for the augmented files (e.g., "large" or "normal").
-    """
-    # Create augmented directories if they don't exist
-    augmented_images_dir.mkdir(parents=True, exist_ok=True)
-    augmented_labels_dir.mkdir(parents=True, exist_ok=True)
+    The branches do not resize: every image goes through load_resized() once
+    and all branches reuse that single resized buffer.
+
+    Images stay in OpenCV's BGR order end to end. Flip, rotate, brightness/contrast
+    and noise don't depend on channel order. Swapping R and B mirrors the hue circle
+    and leaves saturation and value unchanged, so a hue shift of +d on BGR data is a
+    shift of -d on RGB data. With the symmetric hue_shift_limit, the HSV branch
+    samples from the same distribution as on RGB input.
 
-    # Define individual augmentation pipelines
-    augmentations = [
+    Only the spatial branches get bbox_params; the pixel-only ones can't move boxes, and
+    Albumentations warns about a bbox processor with no transform to use it.
+    """
+    return [
         A.Compose([
-            A.Resize(640, 640),  # Resize to YOLOv8 input size
             A.HorizontalFlip(p=1.0),  # Always apply horizontal flip
         ], bbox_params=A.BboxParams(format='pascal_voc', label_fields=['class_labels'])),
         
         A.Compose([
-            A.Resize(640, 640),
             A.Rotate(limit=15, p=1.0),  # Always apply rotation
         ], bbox_params=A.BboxParams(format='pascal_voc', label_fields=['class_labels'])),
         
         A.Compose([
-            A.Resize(640, 640),
             A.RandomBrightnessContrast(brightness_limit=0.2, contrast_limit=0.2, p=1.0),  # Always adjust brightness/contrast
-        ], bbox_params=A.BboxParams(format='pascal_voc', label_fields=['class_labels'])),
+        ]),
         
         A.Compose([
-            A.Resize(640, 640),
             A.HueSaturationValue(hue_shift_limit=20, sat_shift_limit=30, val_shift_limit=20, p=1.0),  # Always adjust hue/saturation
-        ], bbox_params=A.BboxParams(format='pascal_voc', label_fields=['class_labels'])),
+        ]),
         
         A.Compose([
-            A.Resize(640, 640),
             A.GaussNoise(var_limit=(10, 50), p=1.0, per_channel=False),  # Always add Gaussian noise
-        ], bbox_params=A.BboxParams(format='pascal_voc', label_fields=['class_labels'])),
+        ]),
     ]
 
-    # Get all image and label files
-    image_files = sorted(source_images_dir.glob("*.jpg"))
-    label_files = sorted(source_labels_dir.glob("*.txt"))
+def item_seed(seed, name, aug_idx):
+    """
+    Derive a deterministic seed for one (source image name, pipeline index) pair.
+
+    The seed only depends on its inputs, so an image gets the same random
+    parameters no matter which worker process handles it, in what order, or
+    which other images are in the folder.
+    """
+    digest = hashlib.blake2b(f"{seed}:{name}:{aug_idx}".encode(), digest_size=4).digest()
+    return int.from_bytes(digest, "little")
+
+def seed_pipeline(augmentation_pipeline, seed):
+    """
+    Seed an augmentation pipeline.
+
+    Albumentations versions with set_random_seed() sample from the pipeline's own generators,
+    so concurrent runs in one process (e.g. two pipeline stages) don't disturb each other.
+    Older versions sample from the global generators, which are seeded instead; that
+    fallback is only deterministic when one augment_data() runs per process.
+    """
+    if hasattr(augmentation_pipeline, "set_random_seed"):
+        augmentation_pipeline.set_random_seed(seed)
+    else:
+        random.seed(seed)
+        np.random.seed(seed)
+
+def load_resized(image_path, label_path, target_size=(640, 640)):
+    """
+    Shared front stage: decode and resize an image once (kept in BGR).
+
+    Args:
+        image_path (Path): Path to the source image.
+        label_path (Path): Path to the YOLO label file of the image.
+        target_size (tuple): (width, height) to resize to (YOLOv8 input size).
+
+    Returns:
+        tuple: (image, boxes, class_ids) in resized pixel coordinates, or None if
+               the image could not be read.
+    """
+    image = cv2.imread(str(image_path))
+    if image is None:
+        return None
+    image = cv2.resize(image, target_size, interpolation=cv2.INTER_LINEAR)
+
+    # YOLO labels are normalized, so they map straight onto the resized frame
+    boxes, class_ids = read_yolo_label(label_path, target_size[0], target_size[1])
+    return image, boxes, class_ids
+
+def source_stem(prefix, name):
+    """Output stem of a source image: named after the source, so adding images never renames existing outputs."""
+    return f"aug_{prefix}_{name}"
+
+def output_paths(augmented_images_dir, augmented_labels_dir, prefix, name, num_augmentations, extension=".jpg"):
+    """
+    Return the (image, label) output paths produced for the source image named name (its stem).
+    """
+    stems = [f"{source_stem(prefix, name)}_{aug_idx + 1:03d}" for aug_idx in range(num_augmentations)]
+    return ([augmented_images_dir / f"{stem}{extension}" for stem in stems],
+            [augmented_labels_dir / f"{stem}.txt" for stem in stems])
 
-    # Ensure the number of images and labels match
-    if len(image_files) != len(label_files):
-        raise ValueError(f"Mismatch between number of images ({len(image_files)}) and labels ({len(label_files)})")
+# Pipelines are built once per thread (serial run, pool worker, or concurrent pipeline
+# stage) and reused. Seeding mutates them, so threads must not share them.
+_augmentations = threading.local()
 
-    # Process each image and label pair
-    for idx, (image_path, label_path) in enumerate(zip(image_files, label_files)):
-        # Debug: Print the paths
-        print(f"Processing image: {image_path}")
-        print(f"Processing label: {label_path}")
+def _get_augmentations():
+    if not hasattr(_augmentations, "pipelines"):
+        _augmentations.pipelines = build_augmentations()
+    return _augmentations.pipelines
 
-        # Load the image
-        image = cv2.imread(str(image_path))
-        if image is None:
-            print(f"Warning: Unable to read image at {image_path}. Skipping...")
+def augment_item(name, image_path, label_path, options, writer, metrics):
+    """
+    Augment a single image/label pair with every pipeline and queue the results for writing.
+
+    Args:
+        name (str): Stem of the source image, which names the outputs and seeds the branches.
+        image_path (Path): Source image.
+        label_path (Path): Source label.
+        options (dict): Settings shared by every item of a run (see augment_data).
+        writer (ImageWriter): Write-behind encoder the augmented images are submitted to.
+        metrics (StageMetrics): Counters and phase timers of the worker.
+
+    Returns:
+        list: Paths of the augmented images and labels written.
+    """
+    # Decode and resize once; every branch reads the same buffer
+    target_size = options["target_size"]
+    with metrics.phase("decode"):
+        loaded = load_resized(image_path, label_path, target_size)
+    if loaded is None:
+        print(f"Warning: Unable to read image at {image_path}. Skipping...")
+        metrics.count("skipped")
+        return []
+    image, boxes, class_ids = loaded
+    image_width, image_height = target_size
+
+    augmentations = _get_augmentations()
+    image_paths, label_paths = output_paths(options["augmented_images_dir"], options["augmented_labels_dir"],
+                                            options["prefix"], name, len(augmentations), writer.extension)
+
+    # Apply each augmentation independently
+    written = []
+    for aug_idx, augmentation_pipeline in enumerate(augmentations):
+        # Apply augmentation
+        seed_pipeline(augmentation_pipeline, item_seed(options["seed"], name, aug_idx))
+        with metrics.phase("transform"):
+            augmented_image, augmented_boxes, augmented_class_ids = apply_augmentation(image, boxes, class_ids,
+                                                                                       augmentation_pipeline)
+
+        # Save the augmented image and labels
+        output_image_path = image_paths[aug_idx]
+        output_label_path = label_paths[aug_idx]
+
+        # Ensure the augmented image is a NumPy array
+        if not isinstance(augmented_image, np.ndarray):
+            print(f"Warning: Augmented image is not a NumPy array. Skipping {image_path}...")
+            metrics.count("failed")
             continue
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)  # Convert to RGB
-        image_height, image_width, _ = image.shape
 
-        # Load and convert bounding boxes
-        boxes, class_ids = read_yolo_label(label_path, image_width, image_height)
+        # Queue the augmented image for encoding; the label is tiny, write it inline
+        with metrics.phase("queue_wait"):
+            writer.submit(output_image_path, augmented_image)
+        with metrics.phase("write"):
+            write_yolo_label(output_label_path, augmented_boxes, augmented_class_ids, image_width, image_height)
+        written += [str(output_image_path), str(output_label_path)]
+        metrics.count("augmented")
+
+    metrics.item(os.path.getsize(image_path))
+    return written
+
+def augment_chunk(chunk):
+    """
+    Augment a chunk of (name, image_path, label_path) items with one write-behind encoder.
+
+    Args:
+        chunk (tuple): (items, options)
 
-        # Apply each augmentation independently
-        for aug_idx, augmentation_pipeline in enumerate(augmentations):
-            # Apply augmentation
-            augmented_image, augmented_boxes, augmented_class_ids = apply_augmentation(image, boxes, class_ids, augmentation_pipeline)
+    Returns:
+        tuple: (one list of written paths per item, StageMetrics.snapshot() of the chunk)
+    """
+    items, options = chunk
+    metrics = StageMetrics("augment_data")
+    with ImageWriter(options["output"], options["encoder_threads"], options["queue_size"], metrics=metrics) as writer:
+        results = [augment_item(name, image_path, label_path, options, writer, metrics)
+                   for name, image_path, label_path in items]
+    return results, metrics.snapshot()
 
-            # Save the augmented image and labels
-            output_image_path = augmented_images_dir / f"aug_{prefix}_{idx + 1:03d}_{aug_idx + 1:03d}.jpg"
-            output_label_path = augmented_labels_dir / f"aug_{prefix}_{idx + 1:03d}_{aug_idx + 1:03d}.txt"
+def augment_data(source_images_dir, source_labels_dir, augmented_images_dir, augmented_labels_dir, prefix,
+                 num_workers=1, chunksize=None, seed=0, target_size=(640, 640), use_cache=True,
+                 catalog=None, output=None, encoder_threads=2, queue_size=32):
+    """
+    Apply augmentations to images and labels and save the augmented data.
 
-            # Ensure the augmented image is a NumPy array
-            if not isinstance(augmented_image, np.ndarray):
-                print(f"Warning: Augmented image is not a NumPy array. Skipping {image_path}...")
+    Args:
+        source_images_dir (Path): Directory containing the source images.
+        source_labels_dir (Path): Directory containing the source labels.
+        augmented_images_dir (Path): Directory to save the augmented images.
+        augmented_labels_dir (Path): Directory to save the augmented labels.
+        prefix (str): Prefix for the augmented files (e.g., "large" or "normal").
+        num_workers (int): Number of worker processes. 1 runs in-process, None uses every core.
+        chunksize (int): Number of images handed to a worker at a time. Default picks
+                         roughly four chunks per worker.
+        seed (int): Base seed. Outputs are identical for any num_workers given the same seed.
+        target_size (tuple): (width, height) every image is resized to before augmentation.
+        use_cache (bool): Skip source pairs whose content and pipeline config are unchanged
+                          since the last run, and delete outputs whose source disappeared.
+        catalog (Catalog): Dataset catalog to list files from. Default scans into a new in-memory catalog.
+        output (dict): Output codec settings (params.yaml augmentation.output): format
+                       ("jpg", "png" or "webp"), jpeg_quality, png_compression, webp_quality.
+        encoder_threads (int): Write-behind encoder threads per worker process.
+        queue_size (int): Maximum augmented images waiting to be encoded per worker process.
+
+    Returns:
+        int: Number of augmented images written.
+    """
+    # Create augmented directories if they don't exist
+    augmented_images_dir.mkdir(parents=True, exist_ok=True)
+    augmented_labels_dir.mkdir(parents=True, exist_ok=True)
+
+    # Pair every image with its label (raises if any of them is unmatched)
+    catalog = catalog or Catalog()
+    pairs = catalog.pairs(source_images_dir, source_labels_dir)
+
+    target_size = tuple(target_size)
+    output = {**DEFAULT_OUTPUT, **(output or {})}
+    extension = output_extension(output)
+    augmentations = _get_augmentations()
+    cache = None
+    if use_cache:
+        fingerprint = pipeline_fingerprint(augmentations, seed=seed, target_size=target_size, prefix=prefix,
+                                           output=output)
+        cache = AugmentationCache(augmented_images_dir / CACHE_FILE, fingerprint)
+
+    tasks = []
+    new_entries = {}
+    for image_path, label_path in pairs:
+        # Keyed by the source name, not its position, so a new image doesn't invalidate the ones after it
+        name = Path(image_path).stem
+        if cache is not None:
+            image_outputs, label_outputs = output_paths(augmented_images_dir, augmented_labels_dir, prefix, name,
+                                                        len(augmentations), extension)
+            outputs = [path for pair in zip(image_outputs, label_outputs) for path in pair]
+            stem = source_stem(prefix, name)
+            key, image_stat, label_stat = cache.source_key(stem, image_path, label_path)
+            new_entries[stem] = {
+                "key": key, "image": str(image_path), "label": str(label_path),
+                "image_stat": image_stat, "label_stat": label_stat,
+                "outputs": [str(path) for path in outputs],
+            }
+            if cache.is_fresh(stem, key, outputs):
                 continue
+        tasks.append((name, image_path, label_path))
 
-            # Save the augmented image
-            cv2.imwrite(str(output_image_path), cv2.cvtColor(augmented_image, cv2.COLOR_RGB2BGR))
-            write_yolo_label(output_label_path, augmented_boxes, augmented_class_ids, image_width, image_height)
+    if cache is not None:
+        print(f"Augmentation cache: {len(pairs) - len(tasks)} up to date, {len(tasks)} to augment")
+
+    options = {
+        "augmented_images_dir": augmented_images_dir, "augmented_labels_dir": augmented_labels_dir,
+        "prefix": prefix, "seed": seed, "target_size": target_size,
+        "output": output, "encoder_threads": encoder_threads, "queue_size": queue_size,
+    }
+
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    num_workers = max(1, min(num_workers, len(tasks)))
 
-            print(f"Augmented image saved to: {output_image_path}")
-            print(f"Augmented label saved to: {output_label_path}")
+    # Process each image and label pair; worker counters are merged as chunks complete
+    if chunksize is None:
+        chunksize = max(1, len(tasks) // (num_workers * 4))
+    chunks = [(tasks[i:i + chunksize], options) for i in range(0, len(tasks), chunksize)]
+    results = []
+    pool = ProcessPoolExecutor(max_workers=num_workers) if num_workers > 1 else contextlib.nullcontext()
+    with instrument("augment_data", total=len(tasks)) as metrics, pool as executor:
+        for written, snapshot in (executor.map if executor else map)(augment_chunk, chunks):
+            results += written
+            metrics.merge(snapshot)
+
+    if cache is not None:
+        # Only record what was actually written so failed pairs are retried next run
+        for task, written in zip(tasks, results):
+            new_entries[source_stem(prefix, task[0])]["outputs"] = written
+        pruned = cache.update(new_entries)
+        if pruned:
+            print(f"Removed {pruned} stale augmented files")
+
+    catalog.invalidate(augmented_images_dir)
+    catalog.invalidate(augmented_labels_dir)
+
+    return sum(len(written) for written in results) // 2
 
 def main():
+    params = load_params()
+    configure(params['instrumentation'])
+    aug_params = params['augmentation']
+    settings = {
+        "num_workers": aug_params['num_workers'], "seed": aug_params['seed'], "output": aug_params['output'],
+        "encoder_threads": aug_params['encoder_threads'], "queue_size": aug_params['queue_size'],
+    }
+
     # Define source and destination directories for large data
     source_large_images_dir = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/demo_test_large_image").resolve()
     source_large_labels_dir = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/demo_test_large_label").resolve()
@@ -162,11 +355,11 @@ def main():
 
     # Apply augmentations to large data
     print("Augmenting large data...")
-    augment_data(source_large_images_dir, source_large_labels_dir, augmented_large_images_dir, augmented_large_labels_dir, prefix="large")
+    augment_data(source_large_images_dir, source_large_labels_dir, augmented_large_images_dir, augmented_large_labels_dir, prefix="large", **settings)
 
     # Apply augmentations to normal data
     print("Augmenting normal data...")
-    augment_data(source_norm_image_dir, source_norm_label_dir, augmented_norm_image_dir, augmented_norm_label_dir, prefix="normal")
+    augment_data(source_norm_image_dir, source_norm_label_dir, augmented_norm_image_dir, augmented_norm_label_dir, prefix="normal", **settings)
 
     print("All augmentations completed!")
 
@@ -0,0 +1,224 @@
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+from pathlib import Path
+from data_load import load_params, rename_files
+from catalog import Catalog
+from augment_data import augment_data, read_yolo_label, write_yolo_label
+from train_test_split import consolidate_data, split_data
+from inference import iter_predictions, load_backend, resolve_model
+from synthetic_data import generate_dataset
+from instrument import PeakMemory
+
+# preprocess_data lives in src/, one level above the stage modules
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from preprocess_data import preprocess_data
+
+# Throughput metrics regress when they drop, memory when it grows
+HIGHER_IS_BETTER = ("images_per_sec", "mb_per_sec")
+LOWER_IS_BETTER = ("peak_rss_mb",)
+
+def directory_bytes(*paths):
+    """Total size of the files directly in the given directories."""
+    return sum(entry.stat().st_size for path in paths for entry in os.scandir(path) if entry.is_file())
+
+def run_benchmark(name, fn, images, nbytes):
+    """
+    Time fn() and record throughput and peak memory.
+
+    Args:
+        name (str): Benchmark name.
+        fn (callable): Work to measure.
+        images (int): Images (or files) processed, for images/sec.
+        nbytes (int): Bytes of input processed, for MB/s.
+
+    Returns:
+        dict: seconds, images, images_per_sec, mb_per_sec, peak_rss_mb.
+    """
+    with PeakMemory() as memory:
+        started = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - started
+    result = {
+        "seconds": round(seconds, 4),
+        "images": images,
+        "images_per_sec": round(images / seconds, 2) if seconds > 0 else 0.0,
+        "mb_per_sec": round(nbytes / 1e6 / seconds, 2) if seconds > 0 else 0.0,
+        "peak_rss_mb": round(memory.peak / 1e6, 1),
+    }
+    print(f"{name:<24}{result['seconds']:>9.2f}s{result['images_per_sec']:>10.1f} img/s"
+          f"{result['mb_per_sec']:>9.1f} MB/s{result['peak_rss_mb']:>9.0f} MB peak")
+    return result
+
+def _fresh(path):
+    shutil.rmtree(path, ignore_errors=True)
+    Path(path).mkdir(parents=True)
+    return Path(path)
+
+def bench_label_codec(images_dir, labels_dir, work_dir, resolution):
+    """read_yolo_label + write_yolo_label round trip over every label file."""
+    label_paths = sorted(labels_dir.glob("*.txt"))
+    out_dir = _fresh(work_dir / "labels")
+    width, height = resolution
+
+    def run():
+        for label_path in label_paths:
+            boxes, class_ids = read_yolo_label(label_path, width, height)
+            write_yolo_label(out_dir / label_path.name, boxes, class_ids, width, height)
+
+    return run_benchmark("label_codec", run, len(label_paths), directory_bytes(labels_dir))
+
+def bench_augment(images_dir, labels_dir, work_dir, options):
+    out_dir = _fresh(work_dir / "augment")
+
+    def run():
+        augment_data(images_dir, labels_dir, out_dir / "images", out_dir / "labels", "bench", use_cache=False,
+                     **options)
+
+    return run_benchmark("augment_data", run, len(list(images_dir.glob("*.jpg"))), directory_bytes(images_dir, labels_dir))
+
+def bench_rename(images_dir, labels_dir, work_dir, mode, workers):
+    out_dir = _fresh(work_dir / f"rename_{mode}")
+
+    def run():
+        rename_files(images_dir, out_dir / "images", prefix="bench", mode=mode, workers=workers)
+        rename_files(labels_dir, out_dir / "labels", prefix="bench", mode=mode, workers=workers)
+
+    # Labels are renamed too, but throughput is per image like the other benchmarks (MB/s covers both)
+    return run_benchmark(f"rename_files[{mode}]", run, len(os.listdir(images_dir)), directory_bytes(images_dir, labels_dir))
+
+def bench_consolidate_split(images_dir, labels_dir, work_dir, mode, workers):
+    out_dir = _fresh(work_dir / f"split_{mode}")
+
+    def run():
+        catalog = Catalog()
+        consolidate_data([(images_dir, labels_dir, "bench")], out_dir / "consolidated", mode=mode, catalog=catalog,
+                         workers=workers)
+        split_data(out_dir / "consolidated", out_dir / "split_data", mode=mode, catalog=catalog, workers=workers)
+
+    return run_benchmark(f"consolidate_split[{mode}]", run, len(os.listdir(images_dir)),
+                         directory_bytes(images_dir, labels_dir))
+
+def bench_preprocess(images_dir, labels_dir, work_dir, preprocessing):
+    out_dir = _fresh(work_dir / "preprocess")
+    params = {
+        "data": {"source_dir": str(images_dir.parent), "images_dir": images_dir.name, "labels_dir": labels_dir.name,
+                 "processed_dir": str(out_dir), "processed_image": "images", "processed_labels": "labels"},
+        "preprocessing": preprocessing,
+    }
+    return run_benchmark("preprocess_data", lambda: preprocess_data(params), len(os.listdir(images_dir)),
+                         directory_bytes(images_dir))
+
+def bench_inference(images_dir, backend_kind, model_path, batch_size, prefetch_threads):
+    backend = load_backend(backend_kind, model_path, device="cpu")
+    image_paths = sorted(images_dir.glob("*.jpg"))
+    # Warm up outside the measurement (model load, first-call allocations)
+    for _ in iter_predictions(backend, image_paths[:batch_size], batch_size, prefetch_threads):
+        pass
+
+    def run():
+        for _ in iter_predictions(backend, image_paths, batch_size, prefetch_threads):
+            pass
+
+    return run_benchmark(f"inference[{backend_kind}]", run, len(image_paths), directory_bytes(images_dir))
+
+def run_suite(bench, params):
+    """
+    Generate (or reuse) the synthetic dataset and run every enabled benchmark.
+
+    Returns:
+        dict: meta (machine and dataset description) and results (benchmark name -> metrics).
+    """
+    work_dir = Path(bench['dir'])
+    dataset = bench['dataset']
+    images_dir, labels_dir = generate_dataset(
+        work_dir / "synthetic", num_images=dataset['num_images'], resolution=tuple(dataset['resolution']),
+        boxes_per_image=tuple(dataset['boxes_per_image']), empty_fraction=dataset['empty_fraction'],
+        seed=dataset['seed'])
+    runs_dir = work_dir / "runs"
+    workers = params['storage']['transfer_workers']
+    selected = set(bench['benchmarks'])
+    augmentation = params['augmentation']
+
+    results = {}
+    if "label_codec" in selected:
+        results["label_codec"] = bench_label_codec(images_dir, labels_dir, runs_dir, dataset['resolution'])
+    if "augment_data" in selected:
+        results["augment_data"] = bench_augment(images_dir, labels_dir, runs_dir, {
+            "num_workers": augmentation['num_workers'], "seed": augmentation['seed'],
+            "target_size": tuple(params['preprocessing']['resize']), "output": augmentation['output'],
+            "encoder_threads": augmentation['encoder_threads'], "queue_size": augmentation['queue_size']})
+    for mode in bench['materialize_modes']:
+        if "rename_files" in selected:
+            results[f"rename_files[{mode}]"] = bench_rename(images_dir, labels_dir, runs_dir, mode, workers)
+        if "consolidate_split" in selected:
+            results[f"consolidate_split[{mode}]"] = bench_consolidate_split(images_dir, labels_dir, runs_dir, mode, workers)
+    if "preprocess_data" in selected:
+        results["preprocess_data"] = bench_preprocess(images_dir, labels_dir, runs_dir, params['preprocessing'])
+    if "inference" in selected:
+        model_path = resolve_model(params, weights=bench['model']) if bench['model'] else None
+        if model_path and Path(model_path).exists():
+            inference = params['inference']
+            results[f"inference[{inference['backend']}]"] = bench_inference(
+                images_dir, inference['backend'], model_path, inference['batch_size'], inference['prefetch_threads'])
+        else:
+            print(f"Skipping inference: model {model_path!r} not found")
+
+    meta = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "dataset": dataset,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    return {"meta": meta, "results": results}
+
+def compare_to_baseline(results, baseline, tolerance=0.1):
+    """
+    Flag metrics that got worse than the baseline by more than tolerance (relative).
+
+    Returns:
+        list of str: One message per regression. Benchmarks missing from either run are ignored.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in HIGHER_IS_BETTER:
+            if previous[metric] and current[metric] < previous[metric] * (1 - tolerance):
+                regressions.append(f"{name}: {metric} {current[metric]} < baseline {previous[metric]}")
+        for metric in LOWER_IS_BETTER:
+            if previous[metric] and current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {current[metric]} > baseline {previous[metric]}")
+    return regressions
+
+def main():
+    params = load_params()
+    bench = params['benchmark']
+
+    report = run_suite(bench, params)
+    output_path = Path(bench['output'])
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(report, indent=1))
+    print(f"Benchmark results written to {output_path}")
+
+    baseline_path = Path(bench['baseline'])
+    if bench['update_baseline'] or not baseline_path.exists():
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=1))
+        print(f"Baseline saved to {baseline_path}")
+        return
+
+    regressions = compare_to_baseline(report["results"], json.loads(baseline_path.read_text())["results"], bench['tolerance'])
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        raise SystemExit(1)
+    print(f"No regressions against {baseline_path} (tolerance {bench['tolerance']:.0%})")
+
+if __name__ == "__main__":
+    main()
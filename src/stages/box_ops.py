@@ -0,0 +1,161 @@
+import numpy as np
+
+def box_area(boxes):
+    """Return the area of (N, 4) [x_min, y_min, x_max, y_max] boxes."""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+def box_iou(boxes_a, boxes_b):
+    """
+    Pairwise IoU of two sets of [x_min, y_min, x_max, y_max] boxes.
+
+    Returns:
+        np.ndarray: (N, M) float32 IoU matrix.
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    union = box_area(boxes_a)[:, None] + box_area(boxes_b)[None, :] - inter
+    return inter / np.maximum(union, 1e-9)
+
+def paired_iou(boxes_a, boxes_b):
+    """
+    Element-wise IoU of two equally long box arrays (box i of a against box i of b).
+
+    Returns:
+        np.ndarray: (N,) float32 IoU.
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, :2], boxes_b[:, :2])
+    bottom_right = np.minimum(boxes_a[:, 2:], boxes_b[:, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+    union = box_area(boxes_a) + box_area(boxes_b) - inter
+    return inter / np.maximum(union, 1e-9)
+
+def box_ios(boxes_a, boxes_b):
+    """
+    Pairwise intersection over the smaller box's area.
+
+    Unlike IoU, this stays high when one box is a clipped part of the other, e.g. a lump
+    cut in half at a tile edge next to the full detection from the neighbouring tile.
+
+    Returns:
+        np.ndarray: (N, M) float32 matrix.
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    smaller = np.minimum(box_area(boxes_a)[:, None], box_area(boxes_b)[None, :])
+    return inter / np.maximum(smaller, 1e-9)
+
+OVERLAP_METRICS = {
+    "iou": box_iou,
+    "ios": box_ios,
+}
+
+# Above this many boxes nms() compares one kept box at a time instead of building the
+# full N x N overlap matrix (8400 low-confidence anchors would need gigabytes)
+MATRIX_NMS_LIMIT = 2048
+
+def nms(boxes, scores, iou_threshold=0.7, metric="iou"):
+    """
+    Greedy non-maximum suppression.
+
+    For up to MATRIX_NMS_LIMIT boxes the overlap matrix is computed in one vectorized call
+    and the greedy pass only walks boolean rows of it.
+
+    Args:
+        metric (str): "iou", or "ios" (intersection over the smaller box).
+
+    Returns:
+        np.ndarray: Indices of the kept boxes, highest score first.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    overlap = OVERLAP_METRICS[metric]
+    if len(order) > MATRIX_NMS_LIMIT:
+        keep = []
+        while len(order):
+            keep.append(order[0])
+            order = order[1:][overlap(boxes[order[0]], boxes[order[1:]])[0] <= iou_threshold]
+        return np.array(keep, dtype=np.int64)
+
+    suppresses = overlap(boxes[order], boxes[order]) > iou_threshold
+    removed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for i in range(len(order)):
+        if removed[i]:
+            continue
+        keep.append(order[i])
+        removed |= suppresses[i]
+    return np.array(keep, dtype=np.int64)
+
+def fast_nms(boxes, scores, iou_threshold=0.7, metric="iou"):
+    """
+    Fully vectorized NMS without the greedy pass.
+
+    A box is removed when it overlaps any higher-scoring box, even one that was removed
+    itself, so it may suppress slightly more than nms(), but runs as a single matrix op.
+
+    Returns:
+        np.ndarray: Indices of the kept boxes, highest score first.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    overlaps = np.triu(OVERLAP_METRICS[metric](boxes[order], boxes[order]), k=1)
+    return order[overlaps.max(axis=0, initial=0) <= iou_threshold]
+
+def weighted_boxes_fusion(boxes, scores, class_ids, iou_threshold=0.55, metric="iou"):
+    """
+    Merge overlapping boxes of the same class into their score-weighted average.
+
+    Boxes are clustered greedily around the highest-scoring unassigned box. Each cluster
+    becomes one box whose coordinates are the confidence-weighted mean of its members and
+    whose confidence is their mean.
+
+    Returns:
+        np.ndarray: (K, 6) float32 [x_min, y_min, x_max, y_max, confidence, class_id].
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    class_ids = np.asarray(class_ids, dtype=np.float32).reshape(-1)
+    order = np.argsort(-scores, kind="stable")
+    boxes, scores, class_ids = boxes[order], scores[order], class_ids[order]
+    same = (OVERLAP_METRICS[metric](boxes, boxes) > iou_threshold) & (class_ids[:, None] == class_ids[None, :])
+
+    fused = []
+    assigned = np.zeros(len(boxes), dtype=bool)
+    for i in range(len(boxes)):
+        if assigned[i]:
+            continue
+        members = same[i] & ~assigned
+        members[i] = True
+        assigned |= members
+        weights = scores[members]
+        box = (boxes[members] * weights[:, None]).sum(axis=0) / weights.sum()
+        fused.append([*box, weights.mean(), class_ids[i]])
+    return np.array(fused, dtype=np.float32).reshape(-1, 6)
+
+def batched_nms(boxes, scores, class_ids, iou_threshold=0.7, metric="iou"):
+    """
+    Class-aware NMS: boxes only suppress boxes of the same class.
+
+    Each class is shifted to its own disjoint region of coordinate space, so a single
+    nms() pass never sees overlaps between classes.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    if not len(boxes):
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.asarray(class_ids, dtype=np.float32).reshape(-1, 1) * (boxes.max() + 1)
+    return nms(boxes + offsets, scores, iou_threshold, metric)
+
+def xywh_to_xyxy(boxes):
+    """Convert (N, 4) [x_center, y_center, width, height] boxes to [x_min, y_min, x_max, y_max]."""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    half_sizes = boxes[:, 2:] / 2
+    return np.concatenate([boxes[:, :2] - half_sizes, boxes[:, :2] + half_sizes], axis=1)
@@ -0,0 +1,224 @@
+import os
+import sqlite3
+import struct
+from pathlib import Path
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+LABEL_SUFFIXES = (".txt",)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    stem TEXT NOT NULL,
+    suffix TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    boxes INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_directory ON files (directory, suffix);
+"""
+
+def image_size(path):
+    """
+    Read (width, height) from a JPEG or PNG header without decoding the image.
+
+    Returns:
+        tuple: (width, height), or (None, None) if the file can't be read or the header
+               can't be parsed (e.g. a truncated file).
+    """
+    try:
+        with open(path, 'rb') as file:
+            return _header_size(file)
+    except (OSError, struct.error):
+        return None, None
+
+def _header_size(file):
+    head = file.read(24)
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return struct.unpack(">II", head[16:24])
+    if head[:2] != b"\xff\xd8":
+        return None, None
+
+    # Walk the JPEG segments until a start-of-frame marker
+    file.seek(2)
+    while True:
+        marker = file.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None, None
+        while marker[1] == 0xFF:  # fill bytes
+            marker = marker[1:] + file.read(1)
+        code = marker[1]
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:  # markers without a length
+            continue
+        length_bytes = file.read(2)
+        if len(length_bytes) < 2:
+            return None, None
+        length = struct.unpack(">H", length_bytes)[0]
+        if length < 2:
+            return None, None
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">xHH", file.read(5))
+            return width, height
+        file.seek(length - 2, os.SEEK_CUR)
+
+def label_box_count(path):
+    """Count the boxes (non-empty lines) in a YOLO label file."""
+    with open(path, 'rb') as file:
+        return sum(1 for line in file if line.strip())
+
+class Catalog:
+    """
+    SQLite-backed index of the images and labels in the data directories.
+
+    Every directory is read with a single os.scandir pass per Catalog. Files whose size
+    and mtime are unchanged keep their stored image dimensions and box counts, so
+    re-scanning a persistent catalog only inspects new or modified files.
+
+    Args:
+        db_path (str or Path): SQLite database file. ":memory:" keeps the catalog for
+                               the lifetime of the object only.
+    """
+
+    def __init__(self, db_path=":memory:"):
+        if db_path != ":memory:":
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(db_path))
+        self.db.executescript(_SCHEMA)
+        self._scanned = set()
+
+    def close(self):
+        self.db.close()
+
+    def _walk(self, directory, recursive):
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        if recursive:
+                            stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+
+    def scan(self, directory, recursive=False, refresh=False):
+        """
+        Bring the catalog up to date with a directory.
+
+        Args:
+            directory (str or Path): Directory to scan.
+            recursive (bool): Also scan subdirectories.
+            refresh (bool): Re-scan even if this Catalog already scanned the directory.
+        """
+        directory = Path(directory).resolve()
+        key = (directory.as_posix(), recursive)
+        if not refresh and (key in self._scanned or (directory.as_posix(), True) in self._scanned):
+            return
+        if not directory.exists():
+            raise FileNotFoundError(f"Directory not found: {directory}")
+
+        where, args = self._directory_filter(directory, recursive)
+        known = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in self.db.execute(f"SELECT path, size, mtime_ns FROM files WHERE {where}", args)
+        }
+
+        rows = []
+        seen = set()
+        for entry in self._walk(directory, recursive):
+            suffix = os.path.splitext(entry.name)[1].lower()
+            if suffix not in IMAGE_SUFFIXES and suffix not in LABEL_SUFFIXES:
+                continue
+            path = Path(entry.path).as_posix()
+            stat = entry.stat()
+            seen.add(path)
+            if known.get(path) == (stat.st_size, stat.st_mtime_ns):
+                continue
+
+            width = height = boxes = None
+            if suffix in IMAGE_SUFFIXES:
+                width, height = image_size(entry.path)
+            else:
+                boxes = label_box_count(entry.path)
+            rows.append((path, Path(entry.path).parent.as_posix(), Path(entry.name).stem, suffix,
+                         stat.st_size, stat.st_mtime_ns, width, height, boxes))
+
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in known.keys() - seen])
+        self._scanned.add(key)
+
+    def invalidate(self, directory):
+        """Forget that a directory was scanned, e.g. after a stage wrote into it."""
+        directory = Path(directory).resolve().as_posix()
+        self._scanned = {key for key in self._scanned if not (key[0] == directory or key[0].startswith(directory + "/")
+                                                              or directory.startswith(key[0] + "/"))}
+
+    @staticmethod
+    def _directory_filter(directory, recursive):
+        directory = Path(directory).resolve().as_posix()
+        if recursive:
+            return "(directory = ? OR directory LIKE ? ESCAPE '\\')", (directory, _escape_like(directory) + "/%")
+        return "directory = ?", (directory,)
+
+    def records(self, directory, suffixes, recursive=False):
+        """
+        Return catalog rows for the files in a directory, sorted by path.
+
+        Returns:
+            list of sqlite3.Row: Rows with path, stem, size, mtime_ns, width, height and boxes.
+        """
+        self.scan(directory, recursive)
+        where, args = self._directory_filter(directory, recursive)
+        placeholders = ", ".join("?" for _ in suffixes)
+        self.db.row_factory = sqlite3.Row
+        try:
+            return self.db.execute(
+                f"SELECT * FROM files WHERE {where} AND suffix IN ({placeholders}) ORDER BY path",
+                (*args, *suffixes),
+            ).fetchall()
+        finally:
+            self.db.row_factory = None
+
+    def files(self, directory, suffixes=(".jpg",), recursive=False):
+        """Return the paths of the files with the given suffixes, sorted."""
+        return [Path(row["path"]) for row in self.records(directory, suffixes, recursive)]
+
+    def pairs(self, image_dir, label_dir, recursive=False, image_suffixes=(".jpg",)):
+        """
+        Pair every image with the label that has the same stem (and, when recursive,
+        the same subdirectory relative to its root).
+
+        Labels are put in a dict keyed by name and probed once per image (a hash join).
+
+        Returns:
+            list of tuple: (image_path, label_path) sorted by image path.
+
+        Raises:
+            ValueError: If an image has no label or a label has no image.
+        """
+        image_root, label_root = Path(image_dir).resolve(), Path(label_dir).resolve()
+        images = self.records(image_root, image_suffixes, recursive)
+        labels = {
+            _pair_key(row, label_root): Path(row["path"])
+            for row in self.records(label_root, LABEL_SUFFIXES, recursive)
+        }
+
+        pairs = []
+        for row in images:
+            label_path = labels.get(_pair_key(row, image_root))
+            if label_path is not None:
+                pairs.append((Path(row["path"]), label_path))
+        if len(pairs) != len(images) or len(pairs) != len(labels):
+            raise ValueError(f"Mismatch between number of images ({len(images)}) and labels ({len(labels)}): "
+                             f"only {len(pairs)} share a file name in {image_dir} and {label_dir}")
+        return pairs
+
+def _pair_key(row, root):
+    return (Path(row["directory"]).relative_to(root).as_posix(), row["stem"])
+
+def _escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
@@ -1,33 +1,43 @@
-import shutil
 from pathlib import Path
 import os
+from data_load import load_params
+from catalog import IMAGE_SUFFIXES, Catalog
+from transfer import transfer_files
 
-def consolidate_data(source_dirs):
+def consolidate_data(source_dirs, mode="copy", catalog=None, workers=8):
     """Collect data from different directories into a single directory
 
     Args:
         source_dirs (list of tuples): List of (source_image_dir, source_label_dir, 
                         destination_image_subdir, destination_label_subdir) tuples.
+        mode (str): How files are materialized: "hardlink", "reflink", "symlink" or "copy".
+        catalog (Catalog): Dataset catalog to list files from. Default scans into a new in-memory catalog.
+        workers (int): Number of concurrent file transfers.
     """
-    #  copy data from source to desired location
+    catalog = catalog or Catalog()
+
+    #  materialize data from source to desired location
+    jobs = []
     for source_image_dir, source_label_dir, dest_image_dir, dest_label_dir in source_dirs:
         # create destination directories if they don't exist
         dest_image_dir.mkdir(parents=True, exist_ok=True)
         dest_label_dir.mkdir(parents=True, exist_ok=True)
 
-        # copy the images
-        for image_path in source_image_dir.glob("*.jpg"):
-            try:
-                shutil.copy(image_path, dest_image_dir / image_path.name)
-            except Exception as e:
-                print(f"Error copying {image_path}: {e}")
+        # queue the images
+        for image_path in catalog.files(source_image_dir, IMAGE_SUFFIXES):
+            jobs.append((image_path, dest_image_dir / image_path.name))
+
+        # queue the labels
+        for label_path in catalog.files(source_label_dir, (".txt",)):
+            jobs.append((label_path, dest_label_dir / label_path.name))
+
+    stats = transfer_files(jobs, mode=mode, max_workers=workers, label="Consolidating", strict=False)
+    for src, _, e in stats.failures:
+        print(f"Error copying {src}: {e}")
 
-        # copy the labels
-        for label_path in source_label_dir.glob("*.txt"):
-            try:
-                shutil.copy(label_path, dest_label_dir / label_path.name)
-            except Exception as e:
-                print(f"Error copying {label_path}: {e}")
+    for _, _, dest_image_dir, dest_label_dir in source_dirs:
+        catalog.invalidate(dest_image_dir)
+        catalog.invalidate(dest_label_dir)
 
     print("Data Consolidation completed")
 
@@ -64,7 +74,9 @@ def main():
          Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/split_data/labels/train"))
     ]
 
-    consolidate_data(source_dirs)
+    params = load_params()
+    consolidate_data(source_dirs, mode=params['storage']['materialize'], catalog=Catalog(params['catalog']['path']),
+                     workers=params['storage']['transfer_workers'])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
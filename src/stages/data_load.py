@@ -1,6 +1,11 @@
 import yaml
 from pathlib import Path
-import shutil
+from catalog import Catalog
+from transfer import transfer_files
+from instrument import configure, instrument
+
+# Raw and intermediate data live here on the labelling workstation
+DATA_DIR = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data")
 
 def load_params(config_path="params.yaml"):
     """Load parameters from the YAML file."""
@@ -8,7 +13,7 @@ def load_params(config_path="params.yaml"):
         params = yaml.safe_load(file)
     return params
 
-def rename_files(source_path, destination_path, prefix="normal_size"):
+def rename_files(source_path, destination_path, prefix="normal_size", mode="copy", catalog=None, workers=8):
     """
     Renames all .jpg and .txt files in the specified directory and saves them in the destination directory.
 
@@ -16,103 +21,106 @@ def rename_files(source_path, destination_path, prefix="normal_size"):
         source_path (str): Path to the directory containing the files to rename.
         destination_path (str): Path to the directory where renamed files will be saved.
         prefix (str): Prefix for the new file names. Default is "normal_size".
+        mode (str): How files are materialized: "hardlink", "reflink", "symlink" or "copy".
+        catalog (Catalog): Dataset catalog to list files from. Default scans into a new in-memory catalog.
+        workers (int): Number of concurrent file transfers.
 
     Returns:
         tuple: A tuple containing two lists: (renamed_images, renamed_labels).
     """
     source_path = Path(source_path)
     destination_path = Path(destination_path)
+    catalog = catalog or Catalog()
 
     # Create the destination directory if it doesn't exist
     destination_path.mkdir(parents=True, exist_ok=True)
 
-    # Initialize lists to store new names
-    renamed_images = []
-    renamed_labels = []
-
-    # Process .jpg files (images)
-    all_image_files = sorted(source_path.glob("*.jpg"))
-    for idx, file in enumerate(all_image_files):
-        new_name = f"{prefix}_{idx + 1:03d}.jpg"
-        new_file_path = destination_path / new_name
-
-        # Copy the file to the destination directory
-        shutil.copy(file, new_file_path)
-
-        # Append the new name to the list
-        renamed_images.append(new_name)
-
-    # Process .txt files (labels)
-    all_text_files = sorted(source_path.glob("*.txt"))
-    for idx, file in enumerate(all_text_files):
-        new_name = f"{prefix}_{idx + 1:03d}.txt"
-        new_file_path = destination_path / new_name
+    # New names for .jpg files (images)
+    all_image_files = catalog.files(source_path, (".jpg",))
+    renamed_images = [f"{prefix}_{idx + 1:03d}.jpg" for idx in range(len(all_image_files))]
 
-        # Copy the file to the destination directory
-        shutil.copy(file, new_file_path)
+    # New names for .txt files (labels)
+    all_text_files = catalog.files(source_path, (".txt",))
+    renamed_labels = [f"{prefix}_{idx + 1:03d}.txt" for idx in range(len(all_text_files))]
 
-        # Append the new name to the list
-        renamed_labels.append(new_name)
+    # Materialize every file in the destination directory under its new name
+    jobs = [(file, destination_path / new_name)
+            for file, new_name in zip(all_image_files + all_text_files, renamed_images + renamed_labels)]
+    transfer_files(jobs, mode=mode, max_workers=workers, label=f"Renaming {source_path.name}")
 
+    catalog.invalidate(destination_path)
     return renamed_images, renamed_labels
 
-def create_empty_labels(image_dir, label_dir):
+def create_empty_labels(image_dir, label_dir, catalog=None):
     """
     Create empty .txt label files for all images in the specified directory.
     
     Args:
         image_dir (str or Path): Directory containing the images.
         label_dir (str or Path): Directory to save the empty label files.
+        catalog (Catalog): Dataset catalog to list files from. Default scans into a new in-memory catalog.
     """
     image_dir = Path(image_dir)
     label_dir = Path(label_dir)
+    catalog = catalog or Catalog()
 
     # Create the destination directory if it doesn't exist
     label_dir.mkdir(parents=True, exist_ok=True)
 
     # Get all image files in the image directory
-    all_images = sorted(image_dir.glob("*.jpg"))
+    all_images = catalog.files(image_dir, (".jpg",))
 
     # Create empty .txt files for each image
-    for image in all_images:
-        # Get the stem of the image file (filename without extension)
-        stem = image.stem
+    with instrument("create_empty_labels", total=len(all_images)) as metrics:
+        for image in all_images:
+            # Get the stem of the image file (filename without extension)
+            stem = image.stem
 
-        # Create the corresponding .txt file name
-        new_label = f"{stem}.txt"
-        new_label_path = label_dir / new_label
+            # Create the corresponding .txt file name
+            new_label = f"{stem}.txt"
+            new_label_path = label_dir / new_label
 
-        # Create an empty .txt file
-        with open(new_label_path, 'w') as f:
-            pass  # Create an empty file
-
-        print(f"Created empty label file: {new_label_path}")
+            # Create an empty .txt file
+            with metrics.phase("write"), open(new_label_path, 'w') as f:
+                pass  # Create an empty file
+            metrics.item()
 
+    catalog.invalidate(label_dir)
     print("All empty label files created successfully!")
 
-def load_data(params):
-    """Load data from the specified directories and rename files."""
-    source_dir = Path(params['data']['source_dir'])
-    normal_coal_dir = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/normal coal flow")
-    large_coal_dir = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/large pieces")
-    labels_dir = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/labels/train")
+def load_data(params, data_dir=DATA_DIR, catalog=None):
+    """
+    Load data from the specified directories and rename files.
+
+    Args:
+        params (dict): Parameters from params.yaml.
+        data_dir (Path): Directory holding the raw folders; the renamed copies are written next to them.
+        catalog (Catalog): Dataset catalog to list files from. Default opens the catalog from params.yaml.
+    """
+    data_dir = Path(data_dir)
+    mode = params['storage']['materialize']
+    workers = params['storage']['transfer_workers']
+    catalog = catalog or Catalog(params['catalog']['path'])
+    normal_coal_dir = data_dir / params['data']['normal_coal_dir']
+    large_coal_dir = data_dir / params['data']['large_coal_dir']
+    labels_dir = data_dir / "labels" / "train"
 
     # Ensure that the directories exist
     if not normal_coal_dir.exists() or not large_coal_dir.exists() or not labels_dir.exists():
         raise FileNotFoundError(f"Charly, that thing no dey there. the images and labels no dey here: {labels_dir}, {normal_coal_dir}, {large_coal_dir}")
     
     # Check if the images and the labels have the same number of records
-    normal_images = sorted(list(normal_coal_dir.glob("*.jpg")))
-    large_images = sorted(list(large_coal_dir.glob("*.jpg")))
-    annotated_labels = sorted(list(labels_dir.glob("*.txt")))
+    normal_images = catalog.files(normal_coal_dir, (".jpg",))
+    large_images = catalog.files(large_coal_dir, (".jpg",))
+    annotated_labels = catalog.files(labels_dir, (".txt",))
 
     if len(normal_images) != len(annotated_labels):
         raise ValueError(f"Chairman, matter dey ground. the normal images: {len(normal_images)} size no match the labels: {len(annotated_labels)}")
     
     # Define the destinations to save the renamed files
-    normal_dest = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/normal_dest")
-    large_dest = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/large_dest")
-    annotated_labels_dest = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/annotated_labels_dest")
+    normal_dest = data_dir / "normal_dest"
+    large_dest = data_dir / "large_dest"
+    annotated_labels_dest = data_dir / "annotated_labels_dest"
 
     # Create directories if they don't exist
     normal_dest.mkdir(parents=True, exist_ok=True)
@@ -120,19 +128,20 @@ def load_data(params):
     annotated_labels_dest.mkdir(parents=True, exist_ok=True)
 
     # Call the rename function and rename the files
-    renamed_normal_images, _ = rename_files(source_path=normal_coal_dir, destination_path=normal_dest)
-    renamed_large_images, _ = rename_files(source_path=large_coal_dir, destination_path=large_dest, prefix="large_size")
-    _, renamed_annotated_labels = rename_files(source_path=labels_dir, destination_path=annotated_labels_dest, prefix="large_size")
+    renamed_normal_images, _ = rename_files(source_path=normal_coal_dir, destination_path=normal_dest, mode=mode, catalog=catalog, workers=workers)
+    renamed_large_images, _ = rename_files(source_path=large_coal_dir, destination_path=large_dest, prefix="large_size", mode=mode, catalog=catalog, workers=workers)
+    _, renamed_annotated_labels = rename_files(source_path=labels_dir, destination_path=annotated_labels_dest, prefix="large_size", mode=mode, catalog=catalog, workers=workers)
 
     # Create empty label files for images in the normal_dest folder
-    normal_label_dest = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/normal_label_dest")
-    create_empty_labels(normal_dest, normal_label_dest)
+    normal_label_dest = data_dir / "normal_label_dest"
+    create_empty_labels(normal_dest, normal_label_dest, catalog=catalog)
 
     return renamed_normal_images, renamed_large_images, renamed_annotated_labels
 
 def main():
     # Load the params
     params = load_params()
+    configure(params['instrumentation'])
 
     # Load the data
     renamed_norm, renamed_large, renamed_annotated_label = load_data(params)
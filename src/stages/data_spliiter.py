@@ -1,5 +1,7 @@
 from pathlib import Path
-import shutil
+from data_load import load_params
+from catalog import Catalog
+from transfer import transfer_files
 
 def train_test_split(
     large_image_source: str,
@@ -8,7 +10,10 @@ def train_test_split(
     normal_label_source: str,
     output_base: str,
     train_size: int = 200,
-    test_size: int = 100
+    test_size: int = 100,
+    mode: str = "copy",
+    catalog: Catalog = None,
+    workers: int = 8
 ):
     """
     Splits large and normal coal images into train and test sets.
@@ -21,6 +26,9 @@ def train_test_split(
         output_base: Base directory where output folders will be created
         train_size: Number of samples for training set
         test_size: Number of samples for test set
+        mode: How files are materialized: "hardlink", "reflink", "symlink" or "copy"
+        catalog: Dataset catalog to list files from. Default scans into a new in-memory catalog
+        workers: Number of concurrent file transfers
     """
     # Convert paths to Path objects
     output_base = Path(output_base)
@@ -44,39 +52,43 @@ def train_test_split(
     for dir_path in output_dirs.values():
         dir_path.mkdir(parents=True, exist_ok=True)
     
-    # Get source files
-    source_large_images = sorted(large_image_source.rglob("*.jpg"))
-    source_large_labels = sorted(large_label_source.rglob("*.txt"))
-    source_normal_images = sorted(normal_image_source.rglob("*.jpg"))
-    source_normal_labels = sorted(normal_label_source.rglob("*.txt"))
-    
-    # Validate counts
-    if len(source_large_images) != len(source_large_labels):
-        raise ValueError(f"Mismatch: {len(source_large_images)} large images vs {len(source_large_labels)} labels")
-    if len(source_normal_images) != len(source_normal_labels):
-        raise ValueError(f"Mismatch: {len(source_normal_images)} normal images vs {len(source_normal_labels)} labels")
+    # Get source files, pairing images and labels by name (raises on any mismatch)
+    catalog = catalog or Catalog()
+    large_pairs = catalog.pairs(large_image_source, large_label_source, recursive=True)
+    normal_pairs = catalog.pairs(normal_image_source, normal_label_source, recursive=True)
+    source_large_images, source_large_labels = [p[0] for p in large_pairs], [p[1] for p in large_pairs]
+    source_normal_images, source_normal_labels = [p[0] for p in normal_pairs], [p[1] for p in normal_pairs]
     
     total_needed = train_size + test_size
     if len(source_large_images) < total_needed or len(source_normal_images) < total_needed:
         raise ValueError(f"Not enough samples. Need {total_needed}, have {min(len(source_large_images), len(source_normal_images))}")
     
-    # Copy training files
+    jobs = []
+
+    # Training files
     for i in range(train_size):
-        shutil.copy(source_large_images[i], output_dirs['train_large_image'])
-        shutil.copy(source_large_labels[i], output_dirs['train_large_label'])
-        shutil.copy(source_normal_images[i], output_dirs['train_normal_image'])
-        shutil.copy(source_normal_labels[i], output_dirs['train_normal_label'])
+        jobs.append((source_large_images[i], output_dirs['train_large_image']))
+        jobs.append((source_large_labels[i], output_dirs['train_large_label']))
+        jobs.append((source_normal_images[i], output_dirs['train_normal_image']))
+        jobs.append((source_normal_labels[i], output_dirs['train_normal_label']))
     
-    # Copy test files
+    # Test files
     for i in range(train_size, train_size + test_size):
-        shutil.copy(source_large_images[i], output_dirs['test_large_image'])
-        shutil.copy(source_large_labels[i], output_dirs['test_large_label'])
-        shutil.copy(source_normal_images[i], output_dirs['test_normal_image'])
-        shutil.copy(source_normal_labels[i], output_dirs['test_normal_label'])
+        jobs.append((source_large_images[i], output_dirs['test_large_image']))
+        jobs.append((source_large_labels[i], output_dirs['test_large_label']))
+        jobs.append((source_normal_images[i], output_dirs['test_normal_image']))
+        jobs.append((source_normal_labels[i], output_dirs['test_normal_label']))
+
+    transfer_files(jobs, mode=mode, max_workers=workers, label="Splitting")
     
+    for dir_path in output_dirs.values():
+        catalog.invalidate(dir_path)
+
     print(f"Successfully split {train_size} train and {test_size} test samples for both large and normal coal.")
 
 if __name__ == "__main__":
+    params = load_params()
+
     # Example usage
     train_test_split(
         large_image_source="D:/Users/eniang.eniang/Desktop/coal_size-detector/data/large_dest",
@@ -85,5 +97,8 @@ if __name__ == "__main__":
         normal_label_source="D:/Users/eniang.eniang/Desktop/coal_size-detector/data/normal_label_dest",
         output_base="D:/Users/eniang.eniang/Desktop/coal_size-detector/data",
         train_size=200,
-        test_size=100
+        test_size=100,
+        mode=params['storage']['materialize'],
+        catalog=Catalog(params['catalog']['path']),
+        workers=params['storage']['transfer_workers']
     )
\ No newline at end of file
@@ -0,0 +1,282 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import cv2
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from data_load import DATA_DIR, load_params
+from catalog import IMAGE_SUFFIXES, LABEL_SUFFIXES, Catalog
+from aug_cache import CACHE_FILE
+
+# pHash: the 8x8 lowest DCT frequencies of a 32x32 thumbnail, one bit each
+HASH_SIZE = 8
+THUMBNAIL_SIZE = 32
+
+# Above this many images the multi-index search beats comparing every pair
+BRUTE_FORCE_LIMIT = 20000
+
+# Bits set in every byte value, for popcounts on NumPy without bitwise_count
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def phash(image_path):
+    """
+    64-bit perceptual hash of an image, or None if it can't be read.
+
+    The JPEG is decoded at 1/8 scale in grayscale, since only a 32x32 thumbnail is needed.
+    Each bit says whether one of the 8x8 lowest DCT frequencies is above their median, so
+    small changes in noise, compression or lighting flip few bits.
+    """
+    image = cv2.imread(str(image_path), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        return None
+    thumbnail = cv2.resize(image, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(thumbnail)[:HASH_SIZE, :HASH_SIZE].reshape(-1)
+    return int(np.packbits(low > np.median(low)).view(">u8")[0])
+
+def compute_hashes(image_paths, num_threads=8):
+    """
+    Hash many images with a thread pool (OpenCV decodes without holding the GIL).
+
+    Returns:
+        tuple: (hashes (N,) uint64, readable (N,) bool)
+    """
+    with ThreadPoolExecutor(num_threads) as executor:
+        results = list(executor.map(phash, image_paths))
+    readable = np.array([value is not None for value in results], dtype=bool)
+    hashes = np.array([value or 0 for value in results], dtype=np.uint64)
+    return hashes, readable
+
+def popcount(values):
+    """Number of set bits of every uint64."""
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(*values.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+def pairs_brute_force(hashes, max_distance):
+    """
+    Every (i, j), i < j, within max_distance bits, comparing all pairs block by block.
+
+    Blocks of rows are XORed against the whole array, so memory stays around 16M
+    distances at a time whatever the number of images.
+    """
+    n = len(hashes)
+    block = max(1, 2 ** 24 // max(n, 1))
+    found_i, found_j = [], []
+    for start in range(0, n, block):
+        rows = hashes[start:start + block]
+        distances = popcount(rows[:, None] ^ hashes[None, :])
+        i, j = np.nonzero(distances <= max_distance)
+        i += start
+        upper = j > i
+        found_i.append(i[upper])
+        found_j.append(j[upper])
+    if not found_i:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(found_i), np.concatenate(found_j)
+
+def pairs_multi_index(hashes, max_distance):
+    """
+    Same result as pairs_brute_force(), via a multi-index hash.
+
+    The 64 bits are cut into max_distance + 1 chunks. Two hashes within max_distance bits
+    differ in at most max_distance chunks, so they match exactly on at least one (the
+    pigeonhole principle). Only pairs sharing a chunk value are compared.
+    """
+    n = len(hashes)
+    chunks = max_distance + 1
+    widths = [64 // chunks + (k < 64 % chunks) for k in range(chunks)]
+    candidates_i, candidates_j = [], []
+    shift = 0
+    for width in widths:
+        keys = (hashes >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+        shift += width
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        sizes = np.diff(np.r_[starts, n])
+        for start, size in zip(starts[sizes > 1], sizes[sizes > 1]):
+            members = order[start:start + size]
+            i, j = np.triu_indices(size, 1)
+            candidates_i.append(members[i])
+            candidates_j.append(members[j])
+    if not candidates_i:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    i, j = np.concatenate(candidates_i), np.concatenate(candidates_j)
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    unique = np.unique(i * n + j)
+    i, j = unique // n, unique % n
+    close = popcount(hashes[i] ^ hashes[j]) <= max_distance
+    return i[close], j[close]
+
+def near_duplicate_pairs(hashes, max_distance=6):
+    """Every (i, j), i < j, whose hashes differ in at most max_distance bits."""
+    if len(hashes) <= BRUTE_FORCE_LIMIT:
+        return pairs_brute_force(hashes, max_distance)
+    return pairs_multi_index(hashes, max_distance)
+
+class DuplicateGroups:
+    """
+    Near-duplicate clusters of a dataset, keyed by image file name.
+
+    File names are what consolidate_data() keeps, so groups found on the source folders
+    apply to the consolidated copies. Images missing from the groups (e.g. added later)
+    count as singletons and are always kept.
+
+    Args:
+        groups (dict): File name -> group id.
+        representatives (set): File names kept when collapsing, one per group.
+        collapse (bool): Split only the representatives (and their augmented copies).
+    """
+
+    def __init__(self, groups, representatives, collapse=False):
+        self.groups = dict(groups)
+        self.representatives = set(representatives)
+        self.collapse = collapse
+
+    def add_derived(self, derived):
+        """Put derived images (file name -> source file name, e.g. augmented copies) in their source's group."""
+        for name, source in derived.items():
+            if source in self.groups:
+                self.groups[name] = self.groups[source]
+                if source in self.representatives:
+                    self.representatives.add(name)
+
+    def kept(self, pairs):
+        """The (image, label) pairs that remain after collapsing (all of them when collapse is off)."""
+        if not self.collapse:
+            return pairs
+        return [pair for pair in pairs if Path(pair[0]).name not in self.groups
+                or Path(pair[0]).name in self.representatives]
+
+    def group_ids(self, image_paths):
+        """Group id of every image, for GroupShuffleSplit/GroupKFold. Unknown images get their own id."""
+        next_id = max(self.groups.values(), default=-1) + 1
+        ids = []
+        for image_path in image_paths:
+            group = self.groups.get(Path(image_path).name)
+            if group is None:
+                group, next_id = next_id, next_id + 1
+            ids.append(group)
+        return np.array(ids, dtype=np.int64)
+
+    def summary(self):
+        sizes = np.bincount(list(self.groups.values())) if self.groups else np.zeros(0, dtype=np.int64)
+        sizes = sizes[sizes > 0]
+        return {
+            "images": len(self.groups),
+            "groups": int(len(sizes)),
+            "duplicates": int(len(self.groups) - len(sizes)),
+            "largest_group": int(sizes.max()) if len(sizes) else 0,
+        }
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"summary": self.summary(), "groups": self.groups,
+                                    "representatives": sorted(self.representatives)}, indent=1))
+
+def find_duplicates(image_paths, max_distance=6, num_threads=8, scores=None, collapse=False):
+    """
+    Cluster near-duplicate images.
+
+    Images within max_distance bits of each other are linked, and linked images form a
+    group (connected components), so a run of slowly changing video frames ends up in one
+    group even when its first and last frames differ more.
+
+    Args:
+        image_paths (list of Path): Images to cluster. File names must be unique.
+        max_distance (int): Largest pHash Hamming distance (of 64 bits) counted as a duplicate.
+        num_threads (int): Hashing threads.
+        scores (np.ndarray): Per-image preference for the representative, e.g. labelled box
+                             counts, so annotated frames are the ones kept. Ties keep the first path.
+        collapse (bool): See DuplicateGroups.
+
+    Returns:
+        DuplicateGroups: Groups of the images.
+    """
+    image_paths = [Path(image_path) for image_path in image_paths]
+    hashes, readable = compute_hashes(image_paths, num_threads)
+    if not readable.all():
+        print(f"Warning: {int((~readable).sum())} images could not be hashed and are kept as singletons")
+
+    # Unreadable images hash to 0 and must not match each other
+    index = np.flatnonzero(readable)
+    i, j = near_duplicate_pairs(hashes[index], max_distance)
+    n = len(image_paths)
+    graph = coo_matrix((np.ones(len(i), dtype=np.int8), (index[i], index[j])), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+
+    scores = np.zeros(n) if scores is None else np.asarray(scores, dtype=np.float64)
+    order = np.lexsort((np.arange(n), -scores, labels))
+    first = order[np.r_[True, labels[order][1:] != labels[order][:-1]]]
+
+    names = [image_path.name for image_path in image_paths]
+    return DuplicateGroups({name: int(label) for name, label in zip(names, labels)}, {names[k] for k in first}, collapse)
+
+def augmented_sources(augmented_images_dir):
+    """
+    Map augmented image names to the name of the image they were made from.
+
+    Read from the augmentation cache augment_data() keeps next to its outputs; an empty
+    dict when there is none.
+    """
+    cache_path = Path(augmented_images_dir) / CACHE_FILE
+    if not cache_path.exists():
+        return {}
+    entries = json.loads(cache_path.read_text()).get("entries", {})
+    return {Path(output).name: Path(entry["image"]).name
+            for entry in entries.values() for output in entry["outputs"] if Path(output).suffix in IMAGE_SUFFIXES}
+
+def dedup_sources(source_dirs, dedup, catalog=None):
+    """
+    Find near-duplicates among the original images of the consolidation sources.
+
+    Folders written by augment_data() are not hashed: their images join the group of the
+    image they were augmented from, so augmented copies never land on the other side of
+    the split from their source.
+
+    Args:
+        source_dirs (list of tuples): (image_dir, label_dir, destination_subdir) as for consolidate_data().
+        dedup (dict): params.yaml dedup section (max_distance, hash_threads, collapse).
+        catalog (Catalog): Dataset catalog to list files from. Default scans into a new in-memory catalog.
+
+    Returns:
+        DuplicateGroups: Groups of every source image.
+    """
+    catalog = catalog or Catalog()
+    image_paths, scores, derived = [], [], {}
+    for image_dir, label_dir, _ in source_dirs:
+        if (Path(image_dir) / CACHE_FILE).exists():
+            derived.update(augmented_sources(image_dir))
+            continue
+        boxes = {row["stem"]: row["boxes"] or 0 for row in catalog.records(label_dir, LABEL_SUFFIXES)}
+        for image_path in catalog.files(image_dir, IMAGE_SUFFIXES):
+            image_paths.append(image_path)
+            scores.append(boxes.get(image_path.stem, 0))
+
+    duplicates = find_duplicates(image_paths, dedup['max_distance'], dedup['hash_threads'], np.array(scores),
+                                 collapse=dedup['collapse'])
+    summary = duplicates.summary()
+    print(f"Dedup: {summary['images']} images in {summary['groups']} groups, {summary['duplicates']} near-duplicates "
+          f"({summary['duplicates'] / max(summary['images'], 1):.1%}), largest group {summary['largest_group']}")
+    duplicates.add_derived(derived)
+    return duplicates
+
+def main():
+    params = load_params()
+    dedup = params['dedup']
+    catalog = Catalog(params['catalog']['path'])
+
+    # Report how redundant the raw video frame folders are
+    for folder in (params['data']['normal_coal_dir'], params['data']['large_coal_dir']):
+        image_paths = catalog.files(DATA_DIR / folder, IMAGE_SUFFIXES)
+        duplicates = find_duplicates(image_paths, dedup['max_distance'], dedup['hash_threads'])
+        summary = duplicates.summary()
+        print(f"{folder}: {summary['images']} images in {summary['groups']} groups, "
+              f"{summary['duplicates']} near-duplicates ({summary['duplicates'] / max(summary['images'], 1):.1%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import contextlib
+import queue
+import threading
+import cv2
+
+# File extension and default encoder settings for each supported output format
+OUTPUT_FORMATS = {
+    "jpg": ".jpg",
+    "png": ".png",
+    "webp": ".webp",
+}
+
+DEFAULT_OUTPUT = {
+    "format": "jpg",
+    "jpeg_quality": 95,     # OpenCV's own default
+    "png_compression": 3,
+    "webp_quality": 90,
+}
+
+def output_extension(output=None):
+    """Return the file extension for an output config (params.yaml augmentation.output)."""
+    output = {**DEFAULT_OUTPUT, **(output or {})}
+    if output["format"] not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {output['format']!r}. Expected one of {tuple(OUTPUT_FORMATS)}")
+    return OUTPUT_FORMATS[output["format"]]
+
+def encode_params(output=None):
+    """Return the cv2.imencode flags for an output config."""
+    output = {**DEFAULT_OUTPUT, **(output or {})}
+    fmt = output["format"]
+    if fmt == "jpg":
+        return [cv2.IMWRITE_JPEG_QUALITY, int(output["jpeg_quality"])]
+    if fmt == "png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(output["png_compression"])]
+    if fmt == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, int(output["webp_quality"])]
+    raise ValueError(f"Unknown output format {fmt!r}. Expected one of {tuple(OUTPUT_FORMATS)}")
+
+class ImageWriter:
+    """
+    Write-behind image encoder.
+
+    submit() puts a BGR image on a bounded queue and returns immediately, and a pool of
+    threads encodes and writes it. cv2.imencode releases the GIL, so encoding overlaps
+    with whatever the caller does next. submit() blocks once the queue is full, which
+    caps the memory held by images waiting to be written.
+
+    Args:
+        output (dict): Output config (format, jpeg_quality, png_compression, webp_quality).
+        num_threads (int): Number of encoder threads.
+        max_queue (int): Maximum number of images waiting to be encoded.
+        metrics (StageMetrics): Optional instrument.StageMetrics to time the encode and write
+                                phases on and count bytes_written.
+    """
+
+    def __init__(self, output=None, num_threads=2, max_queue=32, metrics=None):
+        self.extension = output_extension(output)
+        self.params = encode_params(output)
+        self.metrics = metrics
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._errors = []
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(num_threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                path, image = item
+                with self._phase("encode"):
+                    ok, encoded = cv2.imencode(self.extension, image, self.params)
+                if not ok:
+                    raise IOError(f"Failed to encode image for {path}")
+                with self._phase("write"), open(path, 'wb') as file:
+                    file.write(encoded.tobytes())
+                if self.metrics is not None:
+                    self.metrics.count("bytes_written", encoded.nbytes)
+            except Exception as e:
+                self._errors.append(e)
+            finally:
+                self._queue.task_done()
+
+    def _phase(self, name):
+        return self.metrics.phase(name) if self.metrics is not None else contextlib.nullcontext()
+
+    def submit(self, path, image):
+        """Queue a BGR image to be written to path. The caller must not modify image afterwards."""
+        if self._errors:
+            raise self._errors[0]
+        self._queue.put((path, image))
+
+    def close(self):
+        """Wait for every queued image to be written and stop the threads."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,88 +1,85 @@
-from ultralytics import YOLO
-
-def visualize_predictions(model_path, data_yaml, imgsz=640, conf=0.50):
+from data_load import load_params
+from catalog import Catalog
+from inference import list_images, load_backend, resolve_model, run_inference, split_source
+from tensor_cache import TensorCache, split_cache_dir
+from tiling import TiledBackend
+
+def visualize_predictions(model_path, data_yaml, imgsz=640, conf=0.50, device="cpu", batch_size=16,
+                          prefetch_threads=4, output_dir="runs/predict", render=False, catalog=None, backend="ultralytics",
+                          tiling=None, tensor_cache=None):
     """
-    Visualize predictions on the validation dataset.
+    Run batched predictions on a folder of images and save them as per-image result files.
 
     Args:
-        model_path (str): Path to the trained model weights.
-        data_yaml (str): Path to the dataset YAML file.
+        model_path (str): Path to the trained model weights (.pt), or an exported .onnx model.
+        data_yaml (str): Image directory, single image or split manifest (.txt) to predict on.
         imgsz (int): Image size for prediction. Default is 640.
-        conf (float): Confidence threshold for predictions. Default is 0.25.
+        conf (float): Confidence threshold for predictions. Default is 0.50.
+        device (str): Device to run on, "cpu" (default) or a GPU index such as "0".
+        batch_size (int): Number of images per predict call.
+        prefetch_threads (int): Threads decoding the next batches while the model runs.
+        output_dir (str): Directory for labels/<stem>.txt results (and images/ when rendering).
+        render (bool): Also save annotated prediction images.
+        catalog (Catalog): Dataset catalog used to list image directories.
+        backend (str): "ultralytics" for .pt weights or "onnx" for a model from export_model.py.
+        tiling (dict): When given, predict overlapping full-resolution tiles of each image
+                       (tiling.TiledBackend options: tile_size, overlap, merge, ...).
+        tensor_cache (str): Directory of a tensor cache (e.g. tensor_cache.split_cache_dir(dir, "test"))
+                            to read packed images from instead of decoding them. Ignored when
+                            tiling, which needs the full-resolution frames.
+
+    Returns:
+        dict: Throughput and per-stage latency report from inference.run_inference().
     """
-    # Load the trained model
-    model = YOLO(model_path)
+    backend = load_backend(backend, model_path, imgsz=imgsz, conf=conf, device=device)
+    if tiling:
+        backend = TiledBackend(backend, **tiling)
+    image_paths = list_images(data_yaml, catalog=catalog)
+    cache = TensorCache(tensor_cache) if tensor_cache and not tiling else None
+    if cache is not None and cache.meta["letterbox"]:
+        raise ValueError(f"Can't predict from the letterboxed tensor cache {tensor_cache}: its frames are padded")
+
+    report = run_inference(backend, image_paths, output_dir, batch_size=batch_size,
+                           prefetch_threads=prefetch_threads, render=render, names=backend.names, cache=cache)
+
+    print(f"Predictions saved to {output_dir}!")
+    return report
+
+def tiling_options(tiling):
+    """Return TiledBackend options from the params.yaml tiling section, or None when tiling is off."""
+    if not tiling['enabled']:
+        return None
+    return {key: tiling[key] for key in ("tile_size", "overlap", "merge", "merge_iou", "match_metric", "full_frame")}
 
-    # Run predictions on the validation dataset
-    results = model.predict(
-        source=data_yaml,  # Path to the dataset YAML file
-        imgsz=imgsz,       # Image size
-        conf=conf,         # Confidence threshold
-        save=True,         # Save prediction images
-        device="0",        # Use GPU 0 (or "cpu" for CPU)
-    )
+def main():
+    params = load_params()
+    inference = params['inference']
 
-    print("Predictions saved!")
+    # Trained weights, or the exported ONNX model when inference.backend is onnx
+    model_path = resolve_model(params)
 
-def main():
-    # Define the path to the trained model weights
-    model_path = "D:/Users/eniang.eniang/Desktop/coal_size-detector/runs/detect/yolov8n_coal_detector10/weights/best.pt"  # Update this path to your trained model
+    # Test split written by the split stage: test.txt in manifest mode, images/test in copy mode
+    data_yaml = str(split_source("data/split_data", "test", params['split']['mode']))
 
-    # Define the path to the dataset YAML file
-    data_yaml = "data/split_data/images/test"
+    # Packed test images, when the tensor cache stage has run
+    cache_params = params['tensor_cache']
+    tensor_cache = split_cache_dir(cache_params['dir'], "test") if cache_params['enabled'] else None
 
     # Visualize predictions
-    visualize_predictions(model_path, data_yaml)
+    visualize_predictions(
+        model_path,
+        data_yaml,
+        conf=inference['conf'],
+        device=inference['device'],
+        batch_size=inference['batch_size'],
+        prefetch_threads=inference['prefetch_threads'],
+        output_dir=inference['output_dir'],
+        render=inference['render'],
+        backend=inference['backend'],
+        tiling=tiling_options(params['tiling']),
+        catalog=Catalog(params['catalog']['path']),
+        tensor_cache=tensor_cache,
+    )
 
 if __name__ == "__main__":
     main()
-
-# from ultralytics import YOLO
-# import numpy as np
-
-# def evaluate_model(model_path, data_yaml, imgsz=640, conf=0.50):
-#     """
-#     Evaluate the model and compute IoU metrics.
-
-#     Args:
-#         model_path (str): Path to the trained model weights.
-#         data_yaml (str): Path to the dataset YAML file.
-#         imgsz (int): Image size for prediction. Default is 640.
-#         conf (float): Confidence threshold for predictions. Default is 0.50.
-#     """
-#     # Load the trained model
-#     model = YOLO(model_path)
-
-#     # Run validation (evaluation) on the test dataset
-#     metrics = model.val(
-#         data=data_yaml,    # Path to the dataset YAML file
-#         imgsz=imgsz,      # Image size
-#         conf=conf,        # Confidence threshold
-#         iou=0.50,         # IoU threshold for mAP calculation
-#         device="0",       # Use GPU 0 (or "cpu" for CPU)
-#         split="test",      # Evaluate on the test set
-#     )
-
-#     # Print IoU-related metrics
-#     print("\nIoU and Detection Metrics:")
-#     print(f"mAP@0.50 (IoU=0.50): {metrics.box.map:.4f}")
-#     print(f"mAP@0.50:0.95 (IoU range [0.50, 0.95]): {metrics.box.map50:.4f} to {metrics.box.map95:.4f}")
-
-#     # If you want per-class IoU, you can access detailed results
-#     if hasattr(metrics.box, "iou"):
-#         print("\nPer-class IoU:")
-#         for class_id, iou in enumerate(metrics.box.iou):
-#             print(f"Class {class_id}: IoU = {iou:.4f}")
-
-# def main():
-#     # Define the path to the trained model weights
-#     model_path = "D:/Users/eniang.eniang/Desktop/coal_size-detector/runs/detect/yolov8n_coal_detector12/weights/best.pt"
-
-#     # Define the path to the dataset YAML file
-#     data_yaml = "D:/Users/eniang.eniang/Desktop/coal_size-detector/dataset.yaml"  # Ensure this points to your YAML file (not just the test images folder)
-
-#     # Evaluate the model and compute IoU
-#     evaluate_model(model_path, data_yaml)
-
-# if __name__ == "__main__":
-#     main()
\ No newline at end of file
@@ -0,0 +1,132 @@
+import json
+from pathlib import Path
+import cv2
+import numpy as np
+from data_load import load_params
+from catalog import IMAGE_SUFFIXES, Catalog
+from inference import split_pairs, unique_stems
+from metrics import IOU_THRESHOLDS, SIZE_BUCKETS, evaluate_detections
+from yolo_labels import load_yolo_label_files
+
+def normalized_to_pixels(rows, sizes, offsets):
+    """
+    Convert normalized [class_id, x_center, y_center, width, height, ...] rows of many
+    images to pixel [x_min, y_min, x_max, y_max, ..., class_id] rows in one operation.
+
+    Args:
+        rows (np.ndarray): (M, 5) labels or (M, 6) predictions (confidence last).
+        sizes (np.ndarray): (images, 2) image (width, height).
+        offsets (np.ndarray): (images + 1,) start of each image's rows.
+
+    Returns:
+        np.ndarray: (M, 5) [x_min, y_min, x_max, y_max, class_id] or
+                    (M, 6) [x_min, y_min, x_max, y_max, confidence, class_id].
+    """
+    scale = np.repeat(np.asarray(sizes, dtype=np.float32), np.diff(offsets), axis=0)
+    centers = rows[:, 1:3] * scale
+    half_sizes = rows[:, 3:5] * scale / 2
+    return np.column_stack([centers - half_sizes, centers + half_sizes, rows[:, 5:], rows[:, 0]]).astype(np.float32)
+
+def image_sizes(image_paths, catalog):
+    """Return (images, 2) (width, height), read from the catalog's header scan where possible."""
+    sizes = np.zeros((len(image_paths), 2), dtype=np.float32)
+    # The catalog stores POSIX paths under the resolved directory, so key lookups the same way
+    directories = {parent: parent.resolve() for parent in {Path(path).parent for path in image_paths}}
+    known = {}
+    for directory in directories.values():
+        for row in catalog.records(directory, IMAGE_SUFFIXES):
+            known[Path(row["path"]).as_posix()] = (row["width"], row["height"])
+    for i, path in enumerate(image_paths):
+        width, height = known.get((directories[Path(path).parent] / Path(path).name).as_posix(), (None, None))
+        if not width:
+            image = cv2.imread(str(path))
+            if image is None:
+                raise IOError(f"Unable to read image at {path}")
+            height, width = image.shape[:2]
+        sizes[i] = width, height
+    return sizes
+
+def load_ground_truth(pairs, catalog=None):
+    """
+    Read every ground truth label of a split once.
+
+    Args:
+        pairs (list of tuple): (image_path, label_path) of the split, e.g. from inference.split_pairs().
+        catalog (Catalog): Dataset catalog the image sizes are read from.
+
+    Returns:
+        tuple: (stems, sizes, gt, gt_offsets) with gt as (G, 5) pixel
+               [x_min, y_min, x_max, y_max, class_id] rows grouped by image.
+    """
+    catalog = catalog or Catalog()
+    sizes = image_sizes([image_path for image_path, _ in pairs], catalog)
+    labels, offsets = load_yolo_label_files([label_path for _, label_path in pairs])
+    return unique_stems([image_path for image_path, _ in pairs]), sizes, normalized_to_pixels(labels, sizes, offsets), offsets
+
+def load_predictions(prediction_dir, stems, sizes):
+    """
+    Read saved prediction files (inference.run_inference() output) for the given images.
+
+    Images without a prediction file count as having no detections.
+
+    Returns:
+        tuple: (predictions (P, 6) pixel rows, offsets)
+    """
+    prediction_dir = Path(prediction_dir)
+    if (prediction_dir / "labels").is_dir():
+        prediction_dir = prediction_dir / "labels"
+    rows, offsets = load_yolo_label_files([prediction_dir / f"{stem}.txt" for stem in stems], columns=6, missing_ok=True)
+    return normalized_to_pixels(rows, sizes, offsets), offsets
+
+def evaluate_runs(pairs, prediction_dirs, iou_thresholds=IOU_THRESHOLDS, size_buckets=SIZE_BUCKETS,
+                  catalog=None):
+    """
+    Score saved predictions of one or more checkpoints against the same ground truth.
+
+    Ground truth and image sizes are loaded once; each checkpoint then only costs reading its
+    prediction files and one batched evaluate_detections() call. Nothing is re-inferred.
+
+    Args:
+        pairs (list of tuple): (image_path, label_path) of the split; images give the sizes and names.
+        prediction_dirs (dict): Checkpoint name -> directory written by run_inference().
+        iou_thresholds (np.ndarray): IoU thresholds.
+        size_buckets (dict): Bucket name -> (min area, max area) in pixels.
+        catalog (Catalog): Dataset catalog the image sizes are read from.
+
+    Returns:
+        dict: Checkpoint name -> evaluate_detections() result.
+    """
+    stems, sizes, gt, gt_offsets = load_ground_truth(pairs, catalog)
+    results = {}
+    for name, prediction_dir in prediction_dirs.items():
+        predictions, pred_offsets = load_predictions(prediction_dir, stems, sizes)
+        results[name] = evaluate_detections(predictions, pred_offsets, gt, gt_offsets, iou_thresholds, size_buckets)
+
+    buckets = list(size_buckets)
+    print(f"\n{'checkpoint':<24}{'mAP50':>8}{'mAP50-95':>10}{'P':>7}{'R':>7}" + "".join(f"{'R_' + b:>10}" for b in buckets))
+    for name, result in results.items():
+        print(f"{name:<24}{result['map50']:>8.4f}{result['map50_95']:>10.4f}{result['precision']:>7.3f}{result['recall']:>7.3f}"
+              + "".join(f"{result['size_recall'][b]['recall50']:>10.3f}" for b in buckets))
+    return results
+
+def main():
+    params = load_params()
+    evaluation = params['evaluation']
+    split_dir = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/split_data")
+
+    catalog = Catalog(params['catalog']['path'])
+
+    size_buckets = {name: (low, np.inf if high is None else high) for name, (low, high) in evaluation['size_buckets'].items()}
+    results = evaluate_runs(
+        split_pairs(split_dir, "test", params['split']['mode'], catalog=catalog),
+        evaluation['predictions'],
+        size_buckets=size_buckets,
+        catalog=catalog,
+    )
+
+    report_path = Path(evaluation['report'])
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report_path.write_text(json.dumps(results, indent=1))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import json
+import random
+import time
+from pathlib import Path
+import numpy as np
+from data_load import load_params
+from catalog import Catalog
+from image_io import decode_image, letterbox_image
+from inference import inference_report, iter_predictions, list_images, load_backend, new_timings, split_pairs, split_source
+from metrics import DetectionStats
+from yolo_labels import load_yolo_labels, yolo_to_pascal_voc
+
+try:
+    from onnxruntime.quantization import CalibrationDataReader
+except ImportError:  # exporting and FP32 inference don't need the quantization tools
+    CalibrationDataReader = object
+
+def export_onnx(model_path, imgsz=640, dynamic=True, simplify=True, opset=None):
+    """
+    Export trained .pt weights to ONNX with ultralytics.
+
+    Args:
+        model_path (str): Path to the trained model weights (best.pt).
+        imgsz (int): Input size baked into the model.
+        dynamic (bool): Export a dynamic batch dimension so one model serves any batch size.
+        simplify (bool): Run onnxslim/onnx-simplifier on the exported graph.
+        opset (int): ONNX opset. Default lets ultralytics choose.
+
+    Returns:
+        Path: Path to the exported .onnx file (next to the weights).
+    """
+    from ultralytics import YOLO
+    exported = YOLO(model_path).export(format="onnx", imgsz=imgsz, dynamic=dynamic, simplify=simplify,
+                                       opset=opset, device="cpu")
+    print(f"Exported {model_path} to {exported}")
+    return Path(exported)
+
+class CalibrationReader(CalibrationDataReader):
+    """
+    Feed letterboxed training images to ONNX Runtime's static quantization calibrator.
+
+    Images are preprocessed exactly like OnnxBackend.preprocess(), so the activation ranges
+    observed during calibration match what the model sees at inference time.
+
+    Args:
+        image_paths (list of Path): Calibration images.
+        input_name (str): Name of the model input.
+        imgsz (int): Model input size.
+        batch_size (int): Images per calibration batch.
+    """
+
+    def __init__(self, image_paths, input_name, imgsz=640, batch_size=8):
+        self.image_paths = list(image_paths)
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self.batch_size = batch_size
+        self._position = 0
+
+    def get_next(self):
+        while self._position < len(self.image_paths):
+            paths = self.image_paths[self._position:self._position + self.batch_size]
+            self._position += self.batch_size
+            images = [image for image in (decode_image(path, (self.imgsz, self.imgsz), reduced=False) for path in paths) if image is not None]
+            if not images:
+                continue
+            batch = np.stack([letterbox_image(image, (self.imgsz, self.imgsz))[0][:, :, ::-1].transpose(2, 0, 1)
+                              for image in images]).astype(np.float32) / 255
+            return {self.input_name: batch}
+        return None
+
+    def rewind(self):
+        self._position = 0
+
+def sample_images(source, num_samples=200, seed=0, catalog=None):
+    """Return a reproducible random sample of the images in source (a folder or a manifest .txt)."""
+    image_paths = list_images(source, catalog=catalog)
+    return random.Random(seed).sample(image_paths, min(num_samples, len(image_paths)))
+
+def quantize_int8(onnx_path, calibration_images, output_path=None, imgsz=640, batch_size=8, per_channel=True):
+    """
+    INT8 post-training static quantization of an exported ONNX model.
+
+    Weights are quantized per channel to int8 and activations to uint8, with activation
+    ranges calibrated on calibration_images. The model is written in QDQ format, which
+    ONNX Runtime's CPU provider fuses into integer kernels.
+
+    Args:
+        onnx_path (Path): FP32 model from export_onnx().
+        calibration_images (list of Path): Representative images, e.g. from sample_images().
+        output_path (Path): Where to write the INT8 model. Default is "<name>_int8.onnx".
+        imgsz (int): Model input size.
+        batch_size (int): Images per calibration batch.
+        per_channel (bool): Per-channel weight scales (more accurate, slightly larger model).
+
+    Returns:
+        Path: Path to the quantized model.
+    """
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    onnx_path = Path(onnx_path)
+    output_path = Path(output_path) if output_path else onnx_path.with_name(f"{onnx_path.stem}_int8.onnx")
+
+    # Symbolic shape inference and graph cleanup make more nodes quantizable
+    prepared_path = onnx_path.with_name(f"{onnx_path.stem}_prep.onnx")
+    quant_pre_process(str(onnx_path), str(prepared_path))
+
+    input_name = ort.InferenceSession(str(prepared_path), providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    reader = CalibrationReader(calibration_images, input_name, imgsz=imgsz, batch_size=batch_size)
+    quantize_static(
+        str(prepared_path),
+        str(output_path),
+        reader,
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=per_channel,
+    )
+    prepared_path.unlink()
+    print(f"Quantized {onnx_path} to {output_path} using {len(reader.image_paths)} calibration images")
+    return output_path
+
+def evaluate_backend(backend, pairs, batch_size=16, prefetch_threads=4, warmup=1):
+    """
+    Measure accuracy and speed of one backend on (image, label) pairs.
+
+    Args:
+        backend: Inference backend (see inference.load_backend()).
+        pairs (list of tuple): (image_path, label_path) pairs of the test split.
+        batch_size (int): Images per backend call.
+        prefetch_threads (int): Decode threads.
+        warmup (int): Batches run before timing starts (first calls allocate and JIT).
+
+    Returns:
+        dict: inference_report() fields plus map50, map50_95, precision and recall.
+    """
+    labels_by_image = {str(Path(image_path)): label_path for image_path, label_path in pairs}
+    image_paths = [Path(image_path) for image_path, _ in pairs]
+    for _ in iter_predictions(backend, image_paths[:batch_size * warmup], batch_size, prefetch_threads):
+        pass
+
+    stats = DetectionStats()
+    timings = new_timings()
+    started = time.perf_counter()
+    for path, image, detections in iter_predictions(backend, image_paths, batch_size, prefetch_threads, timings=timings):
+        height, width = image.shape[:2]
+        gt_boxes, gt_classes = yolo_to_pascal_voc(load_yolo_labels(labels_by_image[str(path)]), width, height)
+        stats.add_detections(detections, gt_boxes, gt_classes)
+    report = inference_report(backend, stats.images, time.perf_counter() - started, batch_size, timings)
+
+    accuracy = stats.compute()
+    report.update({key: accuracy[key] for key in ("map50", "map50_95", "precision", "recall")})
+    return report
+
+def compare_backends(backends, pairs, batch_size=16, prefetch_threads=4, reference=None):
+    """
+    Accuracy-vs-latency report for several backends on the same test split.
+
+    Args:
+        backends (dict): Backend name -> backend.
+        pairs (list of tuple): (image_path, label_path) pairs of the test split.
+        reference (str): Backend the mAP drop is measured against. Default is the first.
+
+    Returns:
+        dict: Backend name -> evaluate_backend() report with an added map50_95_drop.
+    """
+    results = {name: evaluate_backend(backend, pairs, batch_size, prefetch_threads) for name, backend in backends.items()}
+    reference = reference or next(iter(results))
+    for result in results.values():
+        result["map50_95_drop"] = results[reference]["map50_95"] - result["map50_95"]
+
+    print(f"\n{'backend':<16}{'mAP50':>8}{'mAP50-95':>10}{'drop':>8}{'img/s':>9}{'ms/img':>9}")
+    for name, result in results.items():
+        print(f"{name:<16}{result['map50']:>8.4f}{result['map50_95']:>10.4f}{result['map50_95_drop']:>8.4f}"
+              f"{result['images_per_sec']:>9.1f}{result['latency']['infer_image']['p50_ms']:>9.1f}")
+    return results
+
+def choose_backend(results, map_budget=0.01):
+    """Return the name of the fastest backend whose mAP@0.5:0.95 drop is within map_budget."""
+    eligible = [name for name, result in results.items() if result["map50_95_drop"] <= map_budget]
+    return max(eligible, key=lambda name: results[name]["images_per_sec"])
+
+def main():
+    params = load_params()
+    export_params = params['export']
+    inference = params['inference']
+    catalog = Catalog(params['catalog']['path'])
+    imgsz = export_params['imgsz']
+
+    model_path = inference['model']
+    split_dir = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/split_data")
+    split_mode = params['split']['mode']
+
+    onnx_path = export_onnx(model_path, imgsz=imgsz)
+    models = {"ultralytics": ("ultralytics", model_path), "onnx_fp32": ("onnx", onnx_path)}
+    if export_params['int8']:
+        calibration = sample_images(split_source(split_dir, "train", split_mode), export_params['calibration_samples'],
+                                    catalog=catalog)
+        models["onnx_int8"] = ("onnx", quantize_int8(onnx_path, calibration, imgsz=imgsz))
+
+    backends = {
+        name: load_backend(kind, path, imgsz=imgsz, conf=export_params['eval_conf'], device="cpu")
+        for name, (kind, path) in models.items()
+    }
+    pairs = split_pairs(split_dir, "test", split_mode, catalog=catalog)
+    results = compare_backends(backends, pairs, batch_size=inference['batch_size'],
+                               prefetch_threads=inference['prefetch_threads'])
+
+    best = choose_backend(results, export_params['map_budget'])
+    print(f"\nFastest backend within a mAP@0.5:0.95 budget of {export_params['map_budget']}: {best} ({models[best][1]})")
+    report_path = Path(export_params['report'])
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report_path.write_text(json.dumps(
+        {"recommended": best, "models": {name: str(path) for name, (_, path) in models.items()}, "results": results},
+        indent=1))
+
+if __name__ == "__main__":
+    main()
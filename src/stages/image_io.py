@@ -0,0 +1,114 @@
+import cv2
+import numpy as np
+from catalog import image_size
+
+# JPEG can be decoded directly at 1/2, 1/4 or 1/8 scale, skipping most of the IDCT work
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# Padding colour used by YOLOv8's own letterbox
+LETTERBOX_COLOR = (114, 114, 114)
+
+def choose_decode_flag(source_size, target_size):
+    """
+    Pick the cheapest imread flag that still decodes at least target_size pixels.
+
+    Args:
+        source_size (tuple): (width, height) of the encoded image, or (None, None) if unknown.
+        target_size (tuple): (width, height) the image will be resized to.
+
+    Returns:
+        tuple: (scale factor, cv2 imread flag). (1, cv2.IMREAD_COLOR) means a full decode.
+    """
+    source_width, source_height = source_size
+    if source_width and source_height:
+        for factor, flag in REDUCED_DECODE_FLAGS:
+            # Never decode below the target size, so the final resize only ever shrinks
+            if source_width // factor >= target_size[0] and source_height // factor >= target_size[1]:
+                return factor, flag
+    return 1, cv2.IMREAD_COLOR
+
+def decode_image(image_path, target_size, reduced=True):
+    """
+    Decode an image at the smallest scale that still covers target_size.
+
+    Files whose header can't be parsed (e.g. truncated ones) are decoded with
+    cv2.IMREAD_COLOR, as is a file whose reduced decode fails.
+
+    Args:
+        image_path (Path): Image to decode.
+        target_size (tuple): (width, height) the image will be resized to.
+        reduced (bool): Allow reduced-resolution decoding. False always decodes fully.
+
+    Returns:
+        np.ndarray: BGR image, or None if it could not be read.
+    """
+    flag = cv2.IMREAD_COLOR
+    if reduced:
+        _, flag = choose_decode_flag(image_size(image_path), target_size)
+    image = cv2.imread(str(image_path), flag)
+    if image is None and flag != cv2.IMREAD_COLOR:
+        image = cv2.imread(str(image_path), cv2.IMREAD_COLOR)
+    return image
+
+def letterbox_image(image, target_size, color=LETTERBOX_COLOR):
+    """
+    Resize an image to fit target_size keeping its aspect ratio, padding the rest.
+
+    Returns:
+        tuple: (letterboxed image, scale, (pad_x, pad_y))
+    """
+    target_width, target_height = target_size
+    height, width = image.shape[:2]
+    scale = min(target_width / width, target_height / height)
+    new_width, new_height = round(width * scale), round(height * scale)
+    resized = cv2.resize(image, (new_width, new_height))
+
+    pad_x = (target_width - new_width) // 2
+    pad_y = (target_height - new_height) // 2
+    letterboxed = cv2.copyMakeBorder(
+        resized, pad_y, target_height - new_height - pad_y, pad_x, target_width - new_width - pad_x,
+        cv2.BORDER_CONSTANT, value=color,
+    )
+    return letterboxed, scale, (pad_x, pad_y)
+
+def letterbox_labels(labels, source_size, scale, pad, target_size):
+    """
+    Map normalized YOLO rows of the original image onto the letterboxed image.
+
+    Args:
+        labels (np.ndarray): (N, 5) YOLO rows.
+        source_size (tuple): (width, height) of the image that was letterboxed.
+        scale (float): Resize factor returned by letterbox_image().
+        pad (tuple): (pad_x, pad_y) returned by letterbox_image().
+        target_size (tuple): (width, height) of the letterboxed image.
+
+    Returns:
+        np.ndarray: (N, 5) YOLO rows normalized to the letterboxed image.
+    """
+    labels = np.array(labels, dtype=np.float32).reshape(-1, 5)
+    source = np.array(source_size, dtype=np.float32)
+    target = np.array(target_size, dtype=np.float32)
+    labels[:, 1:3] = (labels[:, 1:3] * source * scale + np.array(pad, dtype=np.float32)) / target
+    labels[:, 3:5] = labels[:, 3:5] * source * scale / target
+    return labels
+
+def prepare_image(image_path, target_size, letterbox=False, reduced=True):
+    """
+    Decode an image straight to the model input size.
+
+    Returns:
+        tuple: (image, decoded_size, scale, pad), or None if the image could not be read.
+               scale and pad are None for a plain (aspect-changing) resize.
+    """
+    image = decode_image(image_path, target_size, reduced=reduced)
+    if image is None:
+        return None
+    decoded_size = (image.shape[1], image.shape[0])
+    if letterbox:
+        image, scale, pad = letterbox_image(image, target_size)
+        return image, decoded_size, scale, pad
+    return cv2.resize(image, tuple(target_size)), decoded_size, None, None
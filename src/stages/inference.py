@@ -0,0 +1,416 @@
+import ast
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+import cv2
+import numpy as np
+from box_ops import batched_nms, xywh_to_xyxy
+from catalog import IMAGE_SUFFIXES, Catalog
+from image_io import letterbox_image
+from yolo_labels import pixel_xyxy_to_yolo_predictions, save_yolo_predictions
+
+class UltralyticsBackend:
+    """
+    Run a YOLO .pt model through ultralytics.
+
+    Args:
+        model_path (str): Path to the trained model weights.
+        imgsz (int): Inference image size.
+        conf (float): Confidence threshold.
+        iou (float): NMS IoU threshold.
+        device (str): "cpu" or a CUDA device index such as "0".
+        max_det (int): Maximum detections per image.
+    """
+
+    name = "ultralytics"
+
+    def __init__(self, model_path, imgsz=640, conf=0.25, iou=0.7, device="cpu", max_det=300):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.names = self.model.names
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.device = device
+        self.max_det = max_det
+
+    def predict(self, images):
+        """
+        Run one batch of BGR images.
+
+        Returns:
+            list of np.ndarray: Per image, (N, 6) float32 [x_min, y_min, x_max, y_max, confidence,
+                                class_id] in the pixel coordinates of that image.
+        """
+        results = self.model.predict(source=list(images), imgsz=self.imgsz, conf=self.conf, iou=self.iou,
+                                     device=self.device, max_det=self.max_det, verbose=False)
+        return [result.boxes.data.cpu().numpy().astype(np.float32).reshape(-1, 6) for result in results]
+
+class OnnxBackend:
+    """
+    Run a YOLO model exported to ONNX (see export_model.py) through ONNX Runtime on CPU.
+
+    Frames are letterboxed to imgsz, batched into one NCHW float tensor, and the raw
+    (B, 4 + classes, anchors) head output is decoded and NMS'd in numpy, so no torch or
+    ultralytics install is needed at inference time. Works for FP32 and INT8 models alike.
+
+    Args:
+        onnx_path (str): Path to the .onnx model.
+        imgsz (int): Input size the model was exported with.
+        conf (float): Confidence threshold.
+        iou (float): NMS IoU threshold.
+        max_det (int): Maximum detections per image.
+        num_threads (int): Intra-op threads. Default lets ONNX Runtime use every core.
+        providers (tuple): ONNX Runtime execution providers, in order of preference.
+    """
+
+    name = "onnx"
+
+    def __init__(self, onnx_path, imgsz=640, conf=0.25, iou=0.7, max_det=300, num_threads=None,
+                 providers=("CPUExecutionProvider",)):
+        import onnxruntime as ort
+        if not Path(onnx_path).exists():
+            raise FileNotFoundError(f"ONNX model {onnx_path} not found. Export one with export_model.py "
+                                    f"or set inference.onnx_model")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(onnx_path), options, providers=list(providers))
+        self.input_name = self.session.get_inputs()[0].name
+        # A static export has a fixed batch dimension, a dynamic one a symbolic name
+        batch_dim = self.session.get_inputs()[0].shape[0]
+        self.fixed_batch = batch_dim if isinstance(batch_dim, int) else None
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+        # ultralytics stores the class names in the model metadata
+        names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        self.names = ast.literal_eval(names) if names else None
+
+    def preprocess(self, images):
+        """Letterbox BGR frames into a (B, 3, imgsz, imgsz) float32 RGB tensor in [0, 1]."""
+        batch = np.empty((len(images), 3, self.imgsz, self.imgsz), dtype=np.float32)
+        transforms = []
+        for i, image in enumerate(images):
+            letterboxed, scale, pad = letterbox_image(image, (self.imgsz, self.imgsz))
+            batch[i] = letterboxed[:, :, ::-1].transpose(2, 0, 1)
+            transforms.append((scale, pad))
+        batch *= 1 / 255
+        return batch, transforms
+
+    def postprocess(self, output, transforms, image_shapes):
+        """Decode raw head output to per-image (N, 6) pixel detections."""
+        results = []
+        for prediction, (scale, (pad_x, pad_y)), (height, width) in zip(output, transforms, image_shapes):
+            prediction = prediction.T                       # (anchors, 4 + classes)
+            class_scores = prediction[:, 4:]
+            class_ids = class_scores.argmax(axis=1)
+            scores = class_scores[np.arange(len(class_ids)), class_ids]
+            keep = scores > self.conf
+            boxes = xywh_to_xyxy(prediction[keep, :4])
+            scores, class_ids = scores[keep], class_ids[keep]
+
+            kept = batched_nms(boxes, scores, class_ids, self.iou)[:self.max_det]
+            boxes = (boxes[kept] - np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)) / scale
+            boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+            boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+            results.append(np.concatenate(
+                [boxes, scores[kept, None], class_ids[kept, None].astype(np.float32)], axis=1).astype(np.float32))
+        return results
+
+    def predict(self, images):
+        """Same contract as UltralyticsBackend.predict()."""
+        batch, transforms = self.preprocess(images)
+        step = self.fixed_batch or len(images)
+        outputs = []
+        for i in range(0, len(batch), step):
+            chunk = batch[i:i + step]
+            # A static batch dimension needs full chunks: pad the last one and drop the padded rows
+            if len(chunk) < step:
+                chunk = np.concatenate([chunk, np.zeros((step - len(chunk), *chunk.shape[1:]), dtype=chunk.dtype)])
+            outputs.append(self.session.run(None, {self.input_name: chunk})[0][:len(batch) - i])
+        return self.postprocess(np.concatenate(outputs), transforms, [image.shape[:2] for image in images])
+
+BACKENDS = {
+    "ultralytics": UltralyticsBackend,
+    "onnx": OnnxBackend,
+}
+
+def load_backend(kind, model_path, **options):
+    """
+    Create an inference backend by name.
+
+    Args:
+        kind (str): "ultralytics" (.pt weights) or "onnx" (exported FP32 or INT8 model).
+        model_path (str): Weights or model file for that backend.
+        **options: Backend options (imgsz, conf, iou, device, ...). Options a backend
+                   doesn't take are ignored, e.g. device for "onnx".
+    """
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {kind!r}. Expected one of {tuple(BACKENDS)}")
+    backend = BACKENDS[kind]
+    accepted = backend.__init__.__code__.co_varnames[1:backend.__init__.__code__.co_argcount]
+    return backend(model_path, **{key: value for key, value in options.items() if key in accepted})
+
+def resolve_model(params, weights=None):
+    """
+    Return the model file that params.yaml inference.backend runs.
+
+    The ultralytics backend runs the trained weights. The onnx backend runs
+    inference.onnx_model; when that is null, it runs the ONNX model export_model.py
+    recommended in export.report (FP32 or INT8), provided the report was made from these
+    weights, and otherwise the FP32 export next to the weights.
+
+    Args:
+        params (dict): Parameters from params.yaml.
+        weights (str or Path): Trained .pt weights. Default is inference.model.
+
+    Returns:
+        str: Path to pass to load_backend() with inference.backend.
+    """
+    inference = params['inference']
+    weights = Path(weights or inference['model'])
+    if inference['backend'] != "onnx":
+        return str(weights)
+    if inference['onnx_model']:
+        return str(inference['onnx_model'])
+
+    report_path = Path(params['export']['report'])
+    if report_path.exists():
+        report = json.loads(report_path.read_text())
+        models = report["models"]
+        if Path(models.get("ultralytics", "")) == weights:
+            # Fastest ONNX model within the mAP budget, or the FP32 export when the .pt model won
+            name = report["recommended"] if models[report["recommended"]].endswith(".onnx") else "onnx_fp32"
+            return models[name]
+    return str(weights.with_suffix(".onnx"))
+
+def list_images(source, catalog=None):
+    """
+    Resolve an inference source to a sorted list of image paths.
+
+    Args:
+        source (str or Path): Image directory, a single image, or a manifest .txt list
+                              (one image path per line, as written by the split stage).
+    """
+    source = Path(source)
+    if source.is_dir():
+        return (catalog or Catalog()).files(source, IMAGE_SUFFIXES)
+    if source.suffix.lower() == ".txt":
+        return [Path(line.strip()) for line in source.read_text().splitlines() if line.strip()]
+    return [source]
+
+def split_source(split_dir, split, mode="manifest"):
+    """
+    Where the split stage put one split, as a source for list_images(): the
+    split_dir/<split>.txt manifest in manifest mode, split_dir/images/<split> in copy mode.
+    """
+    split_dir = Path(split_dir)
+    return split_dir / f"{split}.txt" if mode == "manifest" else split_dir / "images" / split
+
+def label_path(image_path):
+    """The YOLO label file of an image: the last images/ directory swapped for labels/, with a .txt suffix."""
+    parts = list(Path(image_path).parts)
+    if "images" not in parts:
+        raise ValueError(f"Can't find the label of {image_path}: it is not under an images/ directory")
+    parts[len(parts) - 1 - parts[::-1].index("images")] = "labels"
+    return Path(*parts).with_suffix(".txt")
+
+def split_pairs(split_dir, split, mode="manifest", catalog=None):
+    """
+    (image, label) pairs of one split, in either split mode.
+
+    Manifest entries are paired the way YOLO pairs them (see label_path()).
+
+    Raises:
+        ValueError: If an image has no label.
+    """
+    if mode != "manifest":
+        split_dir = Path(split_dir)
+        return (catalog or Catalog()).pairs(split_dir / "images" / split, split_dir / "labels" / split)
+    pairs = [(image_path, label_path(image_path)) for image_path in list_images(split_source(split_dir, split, mode))]
+    missing = [str(label) for _, label in pairs if not label.exists()]
+    if missing:
+        raise ValueError(f"{len(missing)} images in {split_source(split_dir, split, mode)} have no label, e.g. {missing[0]}")
+    return pairs
+
+def unique_stems(image_paths):
+    """
+    Stems of image_paths, which name their prediction files (labels/<stem>.txt).
+
+    Raises:
+        ValueError: If two images share a stem, e.g. the same file name in two source
+                    folders of a manifest, as their predictions would overwrite each other.
+    """
+    stems = [Path(path).stem for path in image_paths]
+    if len(set(stems)) < len(stems):
+        first = {}
+        for path, stem in zip(image_paths, stems):
+            if stem in first:
+                raise ValueError(f"Images {first[stem]} and {path} share the stem {stem!r}, "
+                                 f"so their prediction files would collide; rename one of them")
+            first[stem] = path
+    return stems
+
+def _decode(image_path):
+    start = time.perf_counter()
+    image = cv2.imread(str(image_path))
+    return image, time.perf_counter() - start
+
+def _decode_cached(cache, image_path):
+    # Packed images are copied out of the read-only map; anything not packed is decoded as usual
+    start = time.perf_counter()
+    index = cache.index_of(image_path)
+    image = cv2.imread(str(image_path)) if index is None else np.array(cache.image(index))
+    return image, time.perf_counter() - start
+
+def render_detections(image, detections, names=None):
+    """Draw (N, 6) pixel detections onto a copy of a BGR image."""
+    canvas = image.copy()
+    for x_min, y_min, x_max, y_max, confidence, class_id in detections:
+        cv2.rectangle(canvas, (int(x_min), int(y_min)), (int(x_max), int(y_max)), (0, 0, 255), 2)
+        name = names.get(int(class_id), int(class_id)) if names else int(class_id)
+        cv2.putText(canvas, f"{name} {confidence:.2f}", (int(x_min), max(int(y_min) - 4, 12)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1, cv2.LINE_AA)
+    return canvas
+
+def latency_summary(seconds):
+    """Return mean/p50/p95/max in milliseconds for a list of durations in seconds."""
+    if not seconds:
+        return {"mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "max_ms": float(ms.max()),
+    }
+
+def new_timings():
+    """Return an empty per-stage timing dict for iter_predictions()."""
+    return {"decode": [], "infer_batch": [], "infer_image": [], "write": []}
+
+def iter_predictions(backend, image_paths, batch_size=16, prefetch_threads=4, prefetch_batches=2, timings=None,
+                     cache=None):
+    """
+    Batched inference with a thread-pool decode prefetcher.
+
+    Decoding of the next prefetch_batches batches runs on worker threads (cv2 releases the
+    GIL) while the current batch is in the model, so disk and decode time overlap compute.
+
+    Args:
+        backend: Object with predict(list of BGR images) -> list of (N, 6) pixel detections.
+        image_paths (list of Path): Images to run on.
+        batch_size (int): Images per backend call.
+        prefetch_threads (int): Decode threads.
+        prefetch_batches (int): How many batches to decode ahead of the model.
+        timings (dict): Optional dict from new_timings() that decode/infer durations are appended to.
+        cache (TensorCache): Optional tensor cache; images packed in it are read from the
+                             memory map (at the cache's resolution) instead of decoded.
+
+    Yields:
+        tuple: (image path, BGR image, (N, 6) [x_min, y_min, x_max, y_max, confidence, class_id])
+    """
+    timings = timings if timings is not None else new_timings()
+    decode = _decode if cache is None else partial(_decode_cached, cache)
+    with ThreadPoolExecutor(max_workers=prefetch_threads) as executor:
+        batches = [image_paths[i:i + batch_size] for i in range(0, len(image_paths), batch_size)]
+        pending = [[executor.submit(decode, path) for path in batch] for batch in batches[:prefetch_batches]]
+
+        for batch_idx, batch_paths in enumerate(batches):
+            futures = pending.pop(0)
+            ahead = batch_idx + prefetch_batches
+            if ahead < len(batches):
+                pending.append([executor.submit(decode, path) for path in batches[ahead]])
+
+            images, paths = [], []
+            for path, future in zip(batch_paths, futures):
+                image, decode_seconds = future.result()
+                timings["decode"].append(decode_seconds)
+                if image is None:
+                    print(f"Warning: Unable to read image at {path}. Skipping...")
+                    continue
+                images.append(image)
+                paths.append(Path(path))
+            if not images:
+                continue
+
+            start = time.perf_counter()
+            detections = backend.predict(images)
+            infer_seconds = time.perf_counter() - start
+            timings["infer_batch"].append(infer_seconds)
+            timings["infer_image"].append(infer_seconds / len(images))
+
+            yield from zip(paths, images, detections)
+
+def run_inference(backend, image_paths, output_dir, batch_size=16, prefetch_threads=4, prefetch_batches=2,
+                  render=False, names=None, cache=None):
+    """
+    Run iter_predictions() over a list of images and save the results.
+
+    Per image, predictions are written to output_dir/labels/<stem>.txt as normalized
+    "class x_center y_center width height confidence" rows (YOLO label format plus a
+    confidence column). Annotated images go to output_dir/images only when render is set.
+
+    Args:
+        backend: Object with predict(list of BGR images) -> list of (N, 6) pixel detections.
+        image_paths (list of Path): Images to run on.
+        output_dir (Path): Directory for the results.
+        batch_size (int): Images per backend call.
+        prefetch_threads (int): Decode threads.
+        prefetch_batches (int): How many batches to decode ahead of the model.
+        render (bool): Also write annotated images.
+        names (dict): Class id -> name used when rendering.
+        cache (TensorCache): Optional tensor cache to read packed images from (see iter_predictions()).
+
+    Returns:
+        dict: images, seconds, images_per_sec and latency summaries per stage.
+
+    Raises:
+        ValueError: If two images share a stem (see unique_stems()).
+    """
+    unique_stems(image_paths)
+    output_dir = Path(output_dir)
+    labels_dir = output_dir / "labels"
+    labels_dir.mkdir(parents=True, exist_ok=True)
+    if render:
+        (output_dir / "images").mkdir(parents=True, exist_ok=True)
+
+    timings = new_timings()
+    processed = 0
+    started = time.perf_counter()
+    for path, image, detections in iter_predictions(backend, image_paths, batch_size, prefetch_threads,
+                                                    prefetch_batches, timings, cache):
+        start = time.perf_counter()
+        height, width = image.shape[:2]
+        rows = pixel_xyxy_to_yolo_predictions(detections, width, height)
+        save_yolo_predictions(labels_dir / f"{path.stem}.txt", rows)
+        if render:
+            cv2.imwrite(str(output_dir / "images" / path.name), render_detections(image, detections, names))
+        timings["write"].append(time.perf_counter() - start)
+        processed += 1
+
+    report = inference_report(backend, processed, time.perf_counter() - started, batch_size, timings)
+    print_report(report)
+    return report
+
+def inference_report(backend, images, seconds, batch_size, timings):
+    """Build the throughput/latency report returned by run_inference()."""
+    return {
+        "backend": getattr(backend, "name", type(backend).__name__),
+        "images": images,
+        "seconds": seconds,
+        "images_per_sec": images / seconds if seconds > 0 else 0.0,
+        "batch_size": batch_size,
+        "latency": {stage: latency_summary(values) for stage, values in timings.items() if values},
+    }
+
+def print_report(report):
+    print(f"Inference ({report['backend']}): {report['images']} images in {report['seconds']:.2f}s "
+          f"({report['images_per_sec']:.1f} images/s)")
+    for stage, summary in report["latency"].items():
+        print(f"  {stage:<12} mean {summary['mean_ms']:.1f} ms, p50 {summary['p50_ms']:.1f} ms, p95 {summary['p95_ms']:.1f} ms")
@@ -0,0 +1,231 @@
+import cProfile
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import psutil
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:
+    PyinstrumentProfiler = None
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+# Run-wide defaults set once by a stage's main() from params.yaml instrumentation
+_settings = {
+    "metrics_dir": None,        # None keeps the metrics in memory only
+    "progress_interval": 5.0,   # seconds between progress lines, None disables them
+    "profiler": "cprofile",
+    "profile_stages": [],
+}
+
+def configure(settings):
+    """Set the run-wide instrumentation defaults (params.yaml instrumentation section)."""
+    _settings.update(settings or {})
+
+class PeakMemory:
+    """
+    Track the peak resident memory of this process and its children while a block runs.
+
+    A background thread samples RSS every interval seconds, so worker processes started by
+    the measured code (e.g. augment_data's process pool) are included.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._process = psutil.Process()
+
+    def _rss(self):
+        total = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self._rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+
+class StageMetrics:
+    """
+    Phase timers and counters of one stage run, safe to update from several threads.
+
+    Phase times are summed over every thread (and, after merge(), every worker process)
+    that ran the phase, so with parallelism they add up to more than the wall time.
+    Progress lines are rate limited to one per progress_interval seconds.
+
+    Args:
+        stage (str): Stage name used in progress lines and the metrics file name.
+        total (int): Expected number of items, for the progress line. Optional.
+        progress_interval (float): Seconds between progress lines. None disables them.
+    """
+
+    def __init__(self, stage, total=None, progress_interval=None):
+        self.stage = stage
+        self.total = total
+        self.progress_interval = progress_interval
+        self.counters = {"items": 0, "bytes": 0, "skipped": 0, "failed": 0}
+        self.phases = {}
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self._last_report = self.started
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as part of phase name (decode, transform, encode, copy, ...)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def item(self, nbytes=0):
+        """Count one finished item (and the bytes it read or wrote), printing progress when due."""
+        with self._lock:
+            self.counters["items"] += 1
+            self.counters["bytes"] += nbytes
+        self.progress()
+
+    def snapshot(self):
+        """Counters and phase times as plain dicts (picklable, for returning from workers)."""
+        with self._lock:
+            return {"counters": dict(self.counters), "phases": dict(self.phases)}
+
+    def merge(self, snapshot):
+        """Add a snapshot() taken in a worker to this run's totals."""
+        with self._lock:
+            for name, value in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, seconds in snapshot["phases"].items():
+                self.phases[name] = self.phases.get(name, 0.0) + seconds
+        self.progress()
+
+    def throughput(self):
+        """Return (items/s, MB/s) so far."""
+        elapsed = self.elapsed or (time.perf_counter() - self.started)
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return self.counters["items"] / elapsed, self.counters["bytes"] / elapsed / 1e6
+
+    def summary(self):
+        items_per_sec, mb_per_sec = self.throughput()
+        done = f"{self.counters['items']}/{self.total}" if self.total is not None else f"{self.counters['items']}"
+        return (f"{self.stage}: {done} items ({items_per_sec:.1f} items/s, {mb_per_sec:.1f} MB/s), "
+                f"{self.counters['skipped']} skipped, {self.counters['failed']} failed")
+
+    def progress(self, force=False):
+        if self.progress_interval is None and not force:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            if not force and now - self._last_report < self.progress_interval:
+                return
+            self._last_report = now
+        print(self.summary())
+
+    def report(self, peak_rss=None, profile=None):
+        """Everything measured so far as a JSON-serializable dict."""
+        items_per_sec, mb_per_sec = self.throughput()
+        return {
+            "stage": self.stage,
+            "seconds": round(self.elapsed or (time.perf_counter() - self.started), 4),
+            "total": self.total,
+            "counters": dict(self.counters),
+            "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            "items_per_sec": round(items_per_sec, 2),
+            "mb_per_sec": round(mb_per_sec, 2),
+            "peak_rss_mb": None if peak_rss is None else round(peak_rss / 1e6, 1),
+            "profile": profile,
+        }
+
+def _start_profiler(kind):
+    if kind == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    if kind == "pyinstrument":
+        if PyinstrumentProfiler is None:
+            raise ImportError("pyinstrument is not installed. Install it with `pip install pyinstrument` or use cprofile")
+        profiler = PyinstrumentProfiler()
+        profiler.start()
+        return profiler
+    raise ValueError(f"Unknown profiler {kind!r}. Expected one of {PROFILERS}")
+
+def _stop_profiler(kind, profiler, path):
+    """Stop the profiler and save its output next to the metrics file. Returns the file written."""
+    if kind == "cprofile":
+        profiler.disable()
+        path = path.with_suffix(".prof")
+        profiler.dump_stats(path)
+    else:
+        profiler.stop()
+        path = path.with_suffix(".html")
+        path.write_text(profiler.output_html())
+    return str(path)
+
+@contextmanager
+def instrument(stage, total=None, **overrides):
+    """
+    Measure one stage run.
+
+    Yields a StageMetrics to update. On exit the final progress line is printed and, when a
+    metrics_dir is configured, <metrics_dir>/<stage>_<timestamp>.json is written with the
+    counters, phase times, throughput and peak RSS. Stages listed in profile_stages also run
+    under the configured profiler (main process only), saved next to the metrics file.
+
+    Args:
+        stage (str): Stage name.
+        total (int): Expected number of items. Optional.
+        **overrides: Per-call replacements for the configure() settings.
+    """
+    settings = {**_settings, **overrides}
+    metrics = StageMetrics(stage, total, settings["progress_interval"])
+    metrics_dir = Path(settings["metrics_dir"]) if settings["metrics_dir"] else None
+    stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}"
+    kind = settings["profiler"] if stage in settings["profile_stages"] else None
+    if kind is not None and metrics_dir is None:
+        print(f"Profiling {stage} needs a metrics_dir to save to; profiling disabled")
+        kind = None
+    profiler = _start_profiler(kind) if kind else None
+
+    profile_path = None
+    with PeakMemory(interval=0.1) as memory:
+        try:
+            yield metrics
+        finally:
+            metrics.elapsed = time.perf_counter() - metrics.started
+            if profiler is not None:
+                metrics_dir.mkdir(parents=True, exist_ok=True)
+                profile_path = _stop_profiler(kind, profiler, metrics_dir / f"{stage}_{stamp}")
+
+    if settings["progress_interval"] is not None:
+        metrics.progress(force=True)
+    if metrics_dir is not None:
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        metrics_path = metrics_dir / f"{stage}_{stamp}.json"
+        metrics_path.write_text(json.dumps(metrics.report(memory.peak, profile_path), indent=1))
@@ -0,0 +1,141 @@
+import errno
+import os
+import shutil
+import sys
+from pathlib import Path
+
+MATERIALIZE_MODES = ("hardlink", "reflink", "symlink", "copy")
+
+# Modes tried, in order, for each requested mode. "copy" always works.
+FALLBACKS = {
+    "hardlink": ("hardlink", "reflink", "copy"),
+    "reflink": ("reflink", "copy"),
+    "symlink": ("symlink", "copy"),
+    "copy": ("copy",),
+}
+
+# Errors meaning "this filesystem can't do that", as opposed to a real failure
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV, errno.EPERM, errno.EACCES, errno.EOPNOTSUPP, errno.ENOTSUP,
+    errno.ENOSYS, errno.EINVAL, errno.ENOTTY, errno.EMLINK,
+}
+
+# Linux ioctl that shares extents between two files (btrfs, XFS, bcachefs, ...)
+FICLONE = 0x40049409
+
+# (mode, source device, destination device) combinations that already failed,
+# so large batches don't retry an unsupported mode for every file
+_unsupported = set()
+
+def _hardlink(src, dst):
+    os.link(src, dst)
+
+def _symlink(src, dst):
+    os.symlink(src.resolve(), dst)
+
+def _reflink(src, dst):
+    if sys.platform.startswith("linux"):
+        import fcntl
+        with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+            try:
+                fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+            except OSError:
+                dst_file.close()
+                os.remove(dst)
+                raise
+    elif sys.platform == "darwin":
+        import ctypes
+        libc = ctypes.CDLL("libc.dylib", use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(dst))
+    else:
+        raise OSError(errno.EOPNOTSUPP, "reflink is not supported on this platform", str(dst))
+
+def copy_file(src, dst):
+    """
+    Copy file contents and permission bits, keeping the data in the kernel where possible.
+
+    Uses os.copy_file_range (which also lets NFS/SMB servers copy server-side), then
+    os.sendfile, and finally a buffered userspace copy when neither works here.
+    """
+    size = os.stat(src).st_size
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        src_fd, dst_fd = src_file.fileno(), dst_file.fileno()
+        for name in ("copy_file_range", "sendfile"):
+            kernel_copy = getattr(os, name, None)
+            if kernel_copy is None:
+                continue
+            try:
+                copied = 0
+                while copied < size:
+                    if name == "copy_file_range":
+                        sent = kernel_copy(src_fd, dst_fd, size - copied)
+                    else:
+                        sent = kernel_copy(dst_fd, src_fd, copied, size - copied)
+                    if sent == 0:
+                        break
+                    copied += sent
+                if copied == size:
+                    break
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED_ERRNOS and e.errno != errno.ENOTSOCK:
+                    raise
+            # Start over with the next strategy
+            src_file.seek(0)
+            dst_file.seek(0)
+            dst_file.truncate()
+        else:
+            shutil.copyfileobj(src_file, dst_file, 1 << 20)
+    shutil.copymode(src, dst)
+
+_OPERATIONS = {
+    "hardlink": _hardlink,
+    "reflink": _reflink,
+    "symlink": _symlink,
+    "copy": copy_file,
+}
+
+def materialize(src, dst, mode="copy"):
+    """
+    Make src available at dst using the cheapest supported strategy.
+
+    Hardlinks and reflinks are metadata-only, and symlinks just point back at the source.
+    When the filesystem refuses a mode (cross-device link, no reflink support, no symlink
+    privilege, ...), the next mode in FALLBACKS is tried, ending with a plain copy.
+
+    Hardlinked and symlinked files share their data with the source, so outputs must be
+    replaced (written to a new file) rather than modified in place.
+
+    Args:
+        src (str or Path): Existing file.
+        dst (str or Path): Destination file, or an existing directory to place src in.
+        mode (str): One of "hardlink", "reflink", "symlink" or "copy".
+
+    Returns:
+        str: The mode that was actually used.
+    """
+    if mode not in FALLBACKS:
+        raise ValueError(f"Unknown materialize mode {mode!r}. Expected one of {MATERIALIZE_MODES}")
+
+    src, dst = Path(src), Path(dst)
+    if dst.is_dir():
+        dst = dst / src.name
+
+    if os.path.lexists(dst):
+        if dst.exists() and os.path.samefile(src, dst):
+            return mode
+        dst.unlink()
+
+    devices = (os.stat(src).st_dev, os.stat(dst.parent).st_dev)
+    for candidate in FALLBACKS[mode]:
+        if (candidate, devices) in _unsupported:
+            continue
+        try:
+            _OPERATIONS[candidate](src, dst)
+            return candidate
+        except OSError as e:
+            if candidate == "copy" or e.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+            _unsupported.add((candidate, devices))
+    raise OSError(f"Could not materialize {src} at {dst}")
@@ -0,0 +1,238 @@
+import numpy as np
+from box_ops import box_area, paired_iou
+
+# COCO IoU thresholds for mAP@0.5:0.95
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+# Ground truth box area buckets in pixels (COCO small/medium/large)
+SIZE_BUCKETS = {
+    "small": (0, 32 ** 2),
+    "medium": (32 ** 2, 96 ** 2),
+    "large": (96 ** 2, np.inf),
+}
+
+# Recall points the AP and the stored precision/recall curves are sampled at
+RECALL_POINTS = np.linspace(0, 1, 101)
+
+def image_pairs(pred_offsets, gt_offsets):
+    """
+    Every (prediction, ground truth) index pair that belongs to the same image.
+
+    Predictions and ground truth are flat arrays grouped by image, with the rows of image i
+    at [offsets[i], offsets[i + 1]). The pairs of all images are generated at once.
+
+    Returns:
+        tuple: (pred_idx, gt_idx) int64 arrays of equal length.
+    """
+    n_pred = np.diff(pred_offsets)
+    n_gt = np.diff(gt_offsets)
+    pred_image = np.repeat(np.arange(len(n_pred)), n_pred)
+    # Each prediction is paired with every ground truth box of its image
+    per_pred = n_gt[pred_image]
+    pred_idx = np.repeat(np.arange(len(pred_image)), per_pred)
+    pair_starts = np.repeat(np.cumsum(per_pred) - per_pred, per_pred)
+    gt_idx = np.repeat(gt_offsets[:-1][pred_image], per_pred) + np.arange(len(pred_idx)) - pair_starts
+    return pred_idx, gt_idx
+
+def match_pairs(pred_idx, gt_idx, iou, n_pred, n_gt, iou_thresholds=IOU_THRESHOLDS):
+    """
+    Match candidate (prediction, ground truth) pairs at several IoU thresholds at once.
+
+    For every threshold, the pairs with an IoU at or above it are walked from the highest
+    IoU down and a pair is matched when neither its prediction nor its ground truth box is
+    matched yet. Indices are global, so the pairs of a whole dataset are matched in one pass.
+
+    Args:
+        pred_idx (np.ndarray): (K,) prediction index of each candidate pair.
+        gt_idx (np.ndarray): (K,) ground truth index of each candidate pair.
+        iou (np.ndarray): (K,) IoU of each pair (0 for pairs that may not match, e.g. other class).
+        n_pred (int): Number of predictions.
+        n_gt (int): Number of ground truth boxes.
+        iou_thresholds (np.ndarray): (T,) IoU thresholds.
+
+    Returns:
+        tuple: (correct (n_pred, T) bool, matched (n_gt, T) bool)
+    """
+    correct = np.zeros((n_pred, len(iou_thresholds)), dtype=bool)
+    matched = np.zeros((n_gt, len(iou_thresholds)), dtype=bool)
+    keep = iou >= np.min(iou_thresholds) if len(iou_thresholds) else np.zeros(len(iou), dtype=bool)
+    order = np.argsort(-iou[keep], kind="stable")
+    pred_idx, gt_idx, iou = pred_idx[keep][order], gt_idx[keep][order], iou[keep][order]
+
+    # The pairs at or above any threshold are a prefix of this order, and greedy decisions on a
+    # prefix don't depend on the pairs after it, so one greedy pass serves every threshold
+    pred_used, gt_used, accepted = set(), set(), []
+    for k, (pred, gt) in enumerate(zip(pred_idx.tolist(), gt_idx.tolist())):
+        if pred not in pred_used and gt not in gt_used:
+            pred_used.add(pred)
+            gt_used.add(gt)
+            accepted.append(k)
+    accepted = np.asarray(accepted, dtype=np.int64)
+    above = iou[accepted, None] >= np.asarray(iou_thresholds)[None, :]
+    correct[pred_idx[accepted]] = above
+    matched[gt_idx[accepted]] = above
+    return correct, matched
+
+def match_predictions(pred_classes, gt_classes, iou, iou_thresholds=IOU_THRESHOLDS):
+    """
+    Match the predictions of one image given their (N, M) IoU matrix with the ground truth.
+
+    Returns:
+        np.ndarray: (N, T) bool, True where the prediction is a true positive.
+    """
+    pred_idx, gt_idx = np.nonzero(np.asarray(pred_classes)[:, None] == np.asarray(gt_classes)[None, :])
+    return match_pairs(pred_idx, gt_idx, np.asarray(iou)[pred_idx, gt_idx], len(pred_classes), len(gt_classes),
+                       iou_thresholds)[0]
+
+def precision_recall(correct, scores, n_gt):
+    """
+    Precision and recall after each prediction, in descending score order.
+
+    Args:
+        correct (np.ndarray): (N, T) true positive flags from match_pairs().
+        scores (np.ndarray): (N,) prediction confidences.
+        n_gt (int): Number of ground truth boxes.
+
+    Returns:
+        tuple: (precision (N, T), recall (N, T), sorted scores (N,))
+    """
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    correct = np.asarray(correct)[order]
+    tp = np.cumsum(correct, axis=0)
+    fp = np.cumsum(~correct, axis=0)
+    precision = tp / np.maximum(tp + fp, 1)
+    recall = tp / max(n_gt, 1)
+    return precision, recall, np.asarray(scores)[order]
+
+def interpolated_precision(precision, recall):
+    """
+    Precision envelope of one curve sampled at RECALL_POINTS (COCO 101-point interpolation).
+
+    Precision is replaced by its running maximum from the right, then read at the first
+    point reaching each recall level (0 for levels never reached).
+    """
+    envelope = np.maximum.accumulate(np.asarray(precision, dtype=np.float64)[::-1])[::-1]
+    points = np.searchsorted(recall, RECALL_POINTS, side="left")
+    # Index len(envelope) lands on the appended 0 for recall levels never reached
+    return np.append(envelope, 0.0)[points]
+
+def average_precision(precision, recall):
+    """COCO 101-point interpolated AP for one precision/recall curve."""
+    return float(interpolated_precision(precision, recall).mean())
+
+def evaluate_detections(predictions, pred_offsets, gt, gt_offsets, iou_thresholds=IOU_THRESHOLDS,
+                        size_buckets=SIZE_BUCKETS):
+    """
+    Score a whole dataset of detections in batched NumPy operations.
+
+    Args:
+        predictions (np.ndarray): (P, 6) [x_min, y_min, x_max, y_max, confidence, class_id]
+                                  in pixels, grouped by image.
+        pred_offsets (np.ndarray): (images + 1,) start of each image's predictions.
+        gt (np.ndarray): (G, 5) [x_min, y_min, x_max, y_max, class_id] in pixels, grouped by image.
+        gt_offsets (np.ndarray): (images + 1,) start of each image's ground truth.
+        iou_thresholds (np.ndarray): IoU thresholds. The first one is reported as mAP@0.5.
+        size_buckets (dict): Bucket name -> (min area, max area) of ground truth boxes in pixels.
+
+    Returns:
+        dict: map50, map50_95, precision and recall (at the first IoU threshold, over every
+              prediction), per-class AP, per-class precision/recall curves at the first IoU
+              threshold, recall per ground truth size bucket, and counts.
+    """
+    predictions = np.asarray(predictions, dtype=np.float32).reshape(-1, 6)
+    gt = np.asarray(gt, dtype=np.float32).reshape(-1, 5)
+    iou_thresholds = np.asarray(iou_thresholds)
+
+    pred_idx, gt_idx = image_pairs(np.asarray(pred_offsets), np.asarray(gt_offsets))
+    iou = paired_iou(predictions[pred_idx, :4], gt[gt_idx, :4])
+    iou[predictions[pred_idx, 5] != gt[gt_idx, 4]] = 0
+    correct, matched = match_pairs(pred_idx, gt_idx, iou, len(predictions), len(gt), iou_thresholds)
+
+    scores, pred_classes, gt_classes = predictions[:, 4], predictions[:, 5], gt[:, 4]
+    per_class, curves = {}, {}
+    for class_id in np.unique(gt_classes):
+        mask = pred_classes == class_id
+        n_gt = int((gt_classes == class_id).sum())
+        precision, recall, _ = precision_recall(correct[mask], scores[mask], n_gt)
+        envelopes = np.array([interpolated_precision(precision[:, t], recall[:, t]) for t in range(len(iou_thresholds))])
+        ap = envelopes.mean(axis=1)
+        per_class[int(class_id)] = {"ap50": float(ap[0]), "ap50_95": float(ap.mean()), "gt": n_gt, "predictions": int(mask.sum())}
+        curves[int(class_id)] = {"recall": RECALL_POINTS.round(2).tolist(), "precision": envelopes[0].round(4).tolist()}
+
+    areas = box_area(gt[:, :4])
+    size_recall = {}
+    for bucket, (low, high) in size_buckets.items():
+        in_bucket = (areas >= low) & (areas < high)
+        size_recall[bucket] = {
+            "gt": int(in_bucket.sum()),
+            "recall50": float(matched[in_bucket, 0].mean()) if in_bucket.any() else 0.0,
+            "recall50_95": float(matched[in_bucket].mean()) if in_bucket.any() else 0.0,
+        }
+
+    tp = int(correct[:, 0].sum()) if len(correct) else 0
+    return {
+        "map50": float(np.mean([c["ap50"] for c in per_class.values()])) if per_class else 0.0,
+        "map50_95": float(np.mean([c["ap50_95"] for c in per_class.values()])) if per_class else 0.0,
+        "precision": tp / len(correct) if len(correct) else 0.0,
+        "recall": tp / len(gt) if len(gt) else 0.0,
+        "per_class": per_class,
+        "pr_curves": curves,
+        "size_recall": size_recall,
+        "images": len(pred_offsets) - 1,
+        "gt": int(len(gt)),
+        "predictions": int(len(predictions)),
+    }
+
+class DetectionStats:
+    """
+    Collects per-image detections and ground truth, then scores them with evaluate_detections().
+
+    Call add() once per image with pixel-space boxes, then compute().
+
+    Args:
+        iou_thresholds (np.ndarray): IoU thresholds. The first one is reported as mAP@0.5.
+    """
+
+    def __init__(self, iou_thresholds=IOU_THRESHOLDS):
+        self.iou_thresholds = np.asarray(iou_thresholds)
+        self.predictions, self.gt = [], []
+
+    @property
+    def images(self):
+        return len(self.gt)
+
+    def add(self, pred_boxes, pred_scores, pred_classes, gt_boxes, gt_classes):
+        """
+        Add one image.
+
+        Args:
+            pred_boxes (np.ndarray): (N, 4) predicted [x_min, y_min, x_max, y_max].
+            pred_scores (np.ndarray): (N,) confidences.
+            pred_classes (np.ndarray): (N,) class ids.
+            gt_boxes (np.ndarray): (M, 4) ground truth [x_min, y_min, x_max, y_max].
+            gt_classes (np.ndarray): (M,) class ids.
+        """
+        self.predictions.append(np.column_stack([
+            np.asarray(pred_boxes, dtype=np.float32).reshape(-1, 4),
+            np.asarray(pred_scores, dtype=np.float32).reshape(-1),
+            np.asarray(pred_classes, dtype=np.float32).reshape(-1),
+        ]))
+        self.gt.append(np.column_stack([
+            np.asarray(gt_boxes, dtype=np.float32).reshape(-1, 4),
+            np.asarray(gt_classes, dtype=np.float32).reshape(-1),
+        ]))
+
+    def add_detections(self, detections, gt_boxes, gt_classes):
+        """Add one image from (N, 6) [x_min, y_min, x_max, y_max, confidence, class_id] detections."""
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+        self.add(detections[:, :4], detections[:, 4], detections[:, 5], gt_boxes, gt_classes)
+
+    def compute(self, size_buckets=SIZE_BUCKETS):
+        """Return evaluate_detections() over every image added so far."""
+        pred_offsets = np.zeros(len(self.predictions) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in self.predictions], out=pred_offsets[1:])
+        gt_offsets = np.zeros(len(self.gt) + 1, dtype=np.int64)
+        np.cumsum([len(g) for g in self.gt], out=gt_offsets[1:])
+        predictions = np.concatenate(self.predictions) if self.predictions else np.zeros((0, 6), dtype=np.float32)
+        gt = np.concatenate(self.gt) if self.gt else np.zeros((0, 5), dtype=np.float32)
+        return evaluate_detections(predictions, pred_offsets, gt, gt_offsets, self.iou_thresholds, size_buckets)
@@ -0,0 +1,216 @@
+import os
+import numpy as np
+from augment_data import apply_augmentation, build_augmentations, load_resized, seed_pipeline
+from yolo_labels import pascal_voc_to_yolo
+
+try:
+    import torch
+    from torch.utils.data import DataLoader, Dataset
+except ImportError:  # the augmenter itself only needs numpy and albumentations
+    torch = DataLoader = None
+    Dataset = object
+
+try:
+    from ultralytics.data import YOLODataset
+    from ultralytics.models.yolo.detect import DetectionTrainer
+    from ultralytics.utils.instance import Instances
+    from tensor_cache import CachedYOLODataset
+except ImportError:
+    YOLODataset = DetectionTrainer = Instances = None
+
+class OnlineAugmenter:
+    """
+    Apply one randomly chosen augmentation branch per sample, at load time.
+
+    augment_data() materializes every branch of build_augmentations() once per source image
+    and the split keeps the originals too, so training sees the original plus five fixed
+    variants. Picking the original or one branch uniformly reproduces that mix, but each
+    draw samples fresh branch parameters, so every epoch sees new variants and nothing is
+    written to disk.
+
+    Every process (main or DataLoader worker) gets its own generator. Inside a torch worker
+    it is seeded from the worker's seed, which torch derives from the loader's base seed,
+    so runs with a seeded loader generator are reproducible.
+
+    Args:
+        augmentations (list): Branch pipelines. Default is build_augmentations().
+        include_original (bool): Also draw the unaugmented sample, as the materialized split does.
+        seed (int): Seed used outside DataLoader workers.
+    """
+
+    def __init__(self, augmentations=None, include_original=True, seed=0):
+        self.augmentations = augmentations
+        self.include_original = include_original
+        self.seed = seed
+        self._rng = None
+        self._pid = None
+
+    def __getstate__(self):
+        # Pipelines and generators are rebuilt in each worker process
+        state = self.__dict__.copy()
+        state["_rng"] = None
+        state["_pid"] = None
+        return state
+
+    @property
+    def rng(self):
+        if self._rng is None or self._pid != os.getpid():
+            info = torch.utils.data.get_worker_info() if torch is not None else None
+            self._rng = np.random.default_rng(info.seed if info is not None else self.seed)
+            self._pid = os.getpid()
+            if self.augmentations is None:
+                self.augmentations = build_augmentations()
+        return self._rng
+
+    def __call__(self, image, boxes, class_ids):
+        """
+        Augment one sample.
+
+        Args:
+            image (np.ndarray): BGR image.
+            boxes: (N, 4) [x_min, y_min, x_max, y_max] pixels, as read_yolo_label() returns them.
+            class_ids: (N,) class ids.
+
+        Returns:
+            tuple: (image, boxes, class_ids) in the same formats.
+        """
+        rng = self.rng
+        choice = int(rng.integers(len(self.augmentations) + self.include_original))
+        if choice == len(self.augmentations):
+            return image, boxes, class_ids
+        pipeline = self.augmentations[choice]
+        seed = int(rng.integers(2 ** 32))
+        if hasattr(pipeline, "set_random_seed"):
+            pipeline.set_random_seed(seed)
+        else:
+            seed_pipeline(pipeline, seed)
+        return apply_augmentation(image, boxes, class_ids, pipeline)
+
+class OnlineAugmentDataset(Dataset):
+    """
+    torch Dataset of (image, label) pairs augmented on the fly.
+
+    Each item is decoded and resized with load_resized(), augmented by an OnlineAugmenter
+    and returned as (image, labels): a (3, H, W) uint8 RGB tensor and an (N, 5) float32
+    tensor of YOLO rows [class_id, x_center, y_center, width, height].
+
+    Args:
+        pairs (list): (image_path, label_path) pairs, e.g. from Catalog.pairs().
+        target_size (tuple): (width, height) every image is resized to.
+        augmenter (OnlineAugmenter): Default is OnlineAugmenter().
+    """
+
+    def __init__(self, pairs, target_size=(640, 640), augmenter=None):
+        self.pairs = list(pairs)
+        self.target_size = tuple(target_size)
+        self.augmenter = augmenter or OnlineAugmenter()
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __getitem__(self, i):
+        image_path, label_path = self.pairs[i]
+        loaded = load_resized(image_path, label_path, self.target_size)
+        if loaded is None:
+            raise IOError(f"Unable to read image at {image_path}")
+        image, boxes, class_ids = self.augmenter(*loaded)
+        labels = pascal_voc_to_yolo(boxes, class_ids, *self.target_size)
+        image = np.ascontiguousarray(image[:, :, ::-1].transpose(2, 0, 1))
+        return torch.from_numpy(image), torch.from_numpy(np.asarray(labels, dtype=np.float32).reshape(-1, 5))
+
+def collate_batch(batch):
+    """
+    Stack samples into the batch layout ultralytics uses.
+
+    Returns:
+        dict: img (B, 3, H, W) uint8, cls (M, 1), bboxes (M, 4) normalized xywh, and
+              batch_idx (M,) giving the image of every box.
+    """
+    images, labels = zip(*batch)
+    batch_idx = torch.cat([torch.full((len(rows),), i, dtype=torch.float32) for i, rows in enumerate(labels)])
+    labels = torch.cat(labels)
+    return {"img": torch.stack(images), "cls": labels[:, :1], "bboxes": labels[:, 1:], "batch_idx": batch_idx}
+
+def build_dataloader(pairs, batch_size=16, num_workers=4, target_size=(640, 640), seed=0, shuffle=True):
+    """
+    Multi-worker DataLoader over OnlineAugmentDataset.
+
+    The loader's generator is seeded, so shuffling and every worker's augmentation seed
+    are reproducible for a given seed. Workers persist across epochs and keep drawing
+    fresh augmentations.
+    """
+    if torch is None:
+        raise ImportError("Online augmentation needs torch. Install it with `pip install torch`")
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    dataset = OnlineAugmentDataset(pairs, target_size, OnlineAugmenter(seed=seed))
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers,
+                      collate_fn=collate_batch, generator=generator, persistent_workers=num_workers > 0,
+                      pin_memory=torch.cuda.is_available())
+
+class OnlineAugmentMixin:
+    """Adds OnlineAugmenter to an ultralytics YOLODataset, before its own transforms (mosaic etc.)."""
+
+    def get_image_and_label(self, index):
+        label = super().get_image_and_label(index)
+        image = label["img"]
+        height, width = image.shape[:2]
+        scale = np.array([width, height, width, height], dtype=np.float32)
+
+        # Labels are normalized xywh here; albumentations wants pixel xyxy inside the image
+        instances = label["instances"]
+        instances.convert_bbox("xyxy")
+        boxes = np.clip(instances.bboxes, 0, 1) * scale
+        image, boxes, class_ids = self.online_augmenter(image, boxes, label["cls"].reshape(-1))
+
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4) / scale
+        label["img"] = image
+        label["cls"] = np.asarray(class_ids, dtype=np.float32).reshape(-1, 1)
+        label["instances"] = Instances(boxes, segments=np.zeros((0, 1000, 2), dtype=np.float32), bbox_format="xyxy",
+                                       normalized=True)
+        return label
+
+# Defined at module level (not built on the fly) so datasets pickle into spawned DataLoader workers
+_ONLINE_DATASETS = {}
+if YOLODataset is not None:
+    class OnlineAugmentYOLODataset(OnlineAugmentMixin, YOLODataset):
+        pass
+
+    class OnlineAugmentCachedYOLODataset(OnlineAugmentMixin, CachedYOLODataset):
+        pass
+
+    _ONLINE_DATASETS = {YOLODataset: OnlineAugmentYOLODataset, CachedYOLODataset: OnlineAugmentCachedYOLODataset}
+
+def attach_online_augmentation(dataset, augmenter):
+    """
+    Make an ultralytics YOLODataset augment every loaded sample with augmenter.
+
+    Works on top of tensor_cache.attach_to_dataset(): a dataset reading from the tensor
+    cache keeps doing so.
+    """
+    if dataset.__class__ not in _ONLINE_DATASETS:
+        raise TypeError(f"Can't add online augmentation to a {dataset.__class__.__name__}")
+    dataset.__class__ = _ONLINE_DATASETS[dataset.__class__]
+    dataset.online_augmenter = augmenter
+    return dataset
+
+def online_augment_trainer(base=None, seed=0):
+    """
+    Return a DetectionTrainer class whose training set is augmented on the fly.
+
+    Args:
+        base (type): Trainer class to extend, e.g. tensor_cache.cached_trainer(). Default is DetectionTrainer.
+        seed (int): Seed of the augmenter outside DataLoader workers.
+    """
+    if DetectionTrainer is None:
+        raise ImportError("Online augmentation for training needs ultralytics. Install it with `pip install ultralytics`")
+    base = base or DetectionTrainer
+
+    class OnlineAugmentTrainer(base):
+        def build_dataset(self, img_path, mode="train", batch=None):
+            dataset = super().build_dataset(img_path, mode, batch)
+            if mode == "train":
+                attach_online_augmentation(dataset, OnlineAugmenter(seed=seed))
+            return dataset
+
+    return OnlineAugmentTrainer
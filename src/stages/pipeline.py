@@ -0,0 +1,308 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from data_load import load_params, load_data
+from catalog import Catalog
+from augment_data import augment_data
+from train_test_split import consolidate_and_split
+from instrument import configure
+from inference import resolve_model
+from tensor_cache import pack_splits, split_cache_dir
+
+class Stage:
+    """
+    One step of the pipeline.
+
+    Stages are ordered by their files: a stage runs after every stage whose outs contain
+    one of its deps. A stage is skipped when its params, the fingerprints of its deps and
+    the fingerprints of its outs all match the last successful run.
+
+    Args:
+        name (str): Stage name.
+        run (callable): run(catalog) does the work.
+        deps (list of Path): Files or directories the stage reads.
+        outs (list of Path): Files or directories the stage writes.
+        params (list of str): Dotted params.yaml keys the stage depends on, e.g. "augmentation.seed".
+    """
+
+    def __init__(self, name, run, deps, outs, params=()):
+        self.name = name
+        self.run = run
+        self.deps = [Path(path) for path in deps]
+        self.outs = [Path(path) for path in outs]
+        self.params = list(params)
+
+def param_value(params, key):
+    """Look up a dotted key such as "split.test_size" in the params dict."""
+    value = params
+    for part in key.split("."):
+        value = value[part]
+    return value
+
+def fingerprint(path):
+    """
+    Hash the relative names, sizes and mtimes of a file or of every file under a directory.
+
+    Like the augmentation cache, contents are not read: a file only counts as changed when
+    its size or mtime did. Returns None for a missing path.
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    digest = hashlib.blake2b(digest_size=20)
+    if path.is_file():
+        stat = path.stat()
+        digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = Path(root) / name
+            stat = file_path.stat()
+            digest.update(f"{file_path.relative_to(path).as_posix()}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+def stage_key(stage, params):
+    """Hash of everything that decides a stage's result: its params and its deps."""
+    missing = [str(path) for path in stage.deps if not path.exists()]
+    if missing:
+        raise FileNotFoundError(f"Stage {stage.name} is missing its inputs: {missing}")
+    state = {
+        "params": {key: param_value(params, key) for key in stage.params},
+        "deps": {str(path): fingerprint(path) for path in stage.deps},
+    }
+    return hashlib.blake2b(json.dumps(state, sort_keys=True, default=str).encode(), digest_size=20).hexdigest()
+
+def _contains(parent, child):
+    return child == parent or parent in child.parents
+
+def stage_graph(stages):
+    """Return {stage name: set of upstream stage names}, found by matching deps against outs."""
+    upstream = {stage.name: set() for stage in stages}
+    for stage in stages:
+        for other in stages:
+            if other is not stage and any(_contains(out, dep) for dep in stage.deps for out in other.outs):
+                upstream[stage.name].add(other.name)
+    return upstream
+
+def select_stages(stages, upstream, targets=None):
+    """The target stages and everything upstream of them (every stage when targets is empty)."""
+    if not targets:
+        return stages
+    names = {stage.name for stage in stages}
+    unknown = set(targets) - names
+    if unknown:
+        raise ValueError(f"Unknown pipeline stages {sorted(unknown)}. Expected some of {sorted(names)}")
+    selected, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in selected:
+            selected.add(name)
+            todo.extend(upstream[name])
+    return [stage for stage in stages if stage.name in selected]
+
+class PipelineState:
+    """Last successful run of every stage (its key and out fingerprints), saved as JSON after each stage."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.stages = json.loads(self.path.read_text()) if self.path.exists() else {}
+        self._lock = threading.Lock()
+
+    def is_fresh(self, stage, key):
+        entry = self.stages.get(stage.name)
+        return (entry is not None and entry["key"] == key
+                and entry["outs"] == {str(path): fingerprint(path) for path in stage.outs})
+
+    def record(self, stage, key):
+        outs = {str(path): fingerprint(path) for path in stage.outs}
+        with self._lock:
+            self.stages[stage.name] = {"key": key, "outs": outs, "finished": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(self.stages, indent=1))
+
+def _execute(stage, params, state, force, catalog_path):
+    """Run one stage unless it is up to date. Returns True if it ran."""
+    key = stage_key(stage, params)
+    if not force and state.is_fresh(stage, key):
+        print(f"Stage {stage.name}: up to date")
+        return False
+    print(f"Stage {stage.name}: running")
+    started = time.perf_counter()
+    # SQLite connections can't be shared between threads, so every stage opens its own
+    catalog = Catalog(catalog_path)
+    try:
+        stage.run(catalog)
+    finally:
+        catalog.close()
+    state.record(stage, key)
+    print(f"Stage {stage.name}: done in {time.perf_counter() - started:.1f}s")
+    return True
+
+def run_pipeline(stages, params, state_path, targets=None, force=(), jobs=2, catalog_path=":memory:"):
+    """
+    Run the stages in dependency order, independent stages concurrently.
+
+    A stage starts as soon as everything upstream of it has finished (run or skipped).
+    After a failure no new stage is started; the running ones finish and the first
+    error is raised.
+
+    Args:
+        stages (list of Stage): Every stage of the pipeline.
+        params (dict): Parameters from params.yaml.
+        state_path (Path): JSON file with the last successful run of every stage.
+        targets (list of str): Stages to bring up to date, with their upstream stages. Default is every stage.
+        force (list of str): Stages to run even when up to date.
+        jobs (int): Maximum number of stages running at once.
+        catalog_path (str): SQLite catalog every stage opens.
+
+    Returns:
+        dict: Stage name -> "ran" or "skipped".
+    """
+    upstream = stage_graph(stages)
+    stages = select_stages(stages, upstream, targets)
+    state = PipelineState(state_path)
+    pending = {stage.name: stage for stage in stages}
+    results, running, errors = {}, {}, []
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            if not errors:
+                for name, stage in list(pending.items()):
+                    if upstream[name] <= results.keys():
+                        future = executor.submit(_execute, stage, params, state, name in force, catalog_path)
+                        running[future] = name
+                        del pending[name]
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = "ran" if future.result() else "skipped"
+                except Exception as e:
+                    print(f"Stage {name}: failed: {e}")
+                    errors.append(e)
+
+    if errors:
+        raise errors[0]
+    if pending:
+        raise ValueError(f"Pipeline stages {sorted(pending)} depend on each other in a cycle")
+    return results
+
+def build_stages(params):
+    """Declare the training pipeline: data_load -> augment (large | normal) -> split -> tensor_cache -> train -> eval."""
+    pipeline = params['pipeline']
+    data_dir = Path(pipeline['data_dir'])
+    augmented_dir = data_dir / params['data']['augmented_dir']
+    consolidated_dir = data_dir / "consolidated_data"
+    split_dir = data_dir / "split_data"
+    train = params['train']
+    run_dir = Path(pipeline['runs_dir']) / "detect" / train['name']
+    manifest = params['split']['mode'] == "manifest"
+
+    sources = {
+        "normal": (data_dir / "normal_dest", data_dir / "normal_label_dest"),
+        "large": (data_dir / "large_dest", data_dir / "annotated_labels_dest"),
+    }
+    augmented = {
+        "normal": (augmented_dir / "augmented_norm_image", augmented_dir / "augmented_norm_label"),
+        "large": (augmented_dir / "augmented_large_image", augmented_dir / "augmented_large_label"),
+    }
+    augmentation = params['augmentation']
+    # augment_large and augment_normal run at the same time when jobs allows, so they split the workers
+    concurrent_augments = max(1, min(pipeline['jobs'], len(augmented)))
+    augment_workers = max(1, (augmentation['num_workers'] or os.cpu_count() or 1) // concurrent_augments)
+
+    def run_augment(kind):
+        def run(catalog):
+            augment_data(*sources[kind], *augmented[kind], prefix=kind, num_workers=augment_workers,
+                         seed=augmentation['seed'], output=augmentation['output'],
+                         encoder_threads=augmentation['encoder_threads'], queue_size=augmentation['queue_size'],
+                         catalog=catalog)
+        return run
+
+    # With online augmentation the augmented copies are never materialized
+    online = train['online_augment']
+    split_sources = [(*sources["normal"], "original_normal"), (*sources["large"], "original_large")]
+    if not online:
+        split_sources += [(*augmented["normal"], "augmented_normal"), (*augmented["large"], "augmented_large")]
+
+    def run_split(catalog):
+        consolidate_and_split(split_sources, consolidated_dir, split_dir, params, catalog=catalog)
+
+    data_yaml = split_dir / "dataset.yaml" if manifest else Path(pipeline['dataset_yaml'])
+    test_images = split_dir / "test.txt" if manifest else split_dir / "images" / "test"
+
+    # Pre-decoded copies of every split that train and eval read instead of the JPEGs
+    cache_params = params['tensor_cache']
+    cache_dir = Path(cache_params['dir']) if cache_params['enabled'] else None
+
+    def run_tensor_cache(catalog):
+        pack_splits(split_dir, cache_dir, params, catalog=catalog)
+
+    # train and eval_model are imported inside their stages so the data stages run without ultralytics installed
+    def run_train(catalog):
+        from train import train_yolov8n
+        train_yolov8n(str(data_yaml), epochs=train['epochs'], imgsz=train['imgsz'], batch=train['batch'],
+                      name=train['name'], tensor_cache=cache_dir, model_path=train['model'], device=train['device'],
+                      project=str(run_dir.parent), exist_ok=True, online_augment=online,
+                      augment_seed=augmentation['seed'])
+
+    inference = params['inference']
+
+    def run_eval(catalog):
+        from eval_model import tiling_options, visualize_predictions
+        visualize_predictions(resolve_model(params, weights=run_dir / "weights" / "best.pt"), str(test_images),
+                              conf=inference['conf'], device=inference['device'], batch_size=inference['batch_size'],
+                              prefetch_threads=inference['prefetch_threads'], output_dir=inference['output_dir'],
+                              render=inference['render'], backend=inference['backend'],
+                              tiling=tiling_options(params['tiling']), catalog=catalog,
+                              tensor_cache=split_cache_dir(cache_dir, "test") if cache_dir else None)
+
+    augment_stages = [] if online else [
+        Stage("augment_large", run_augment("large"), deps=sources["large"], outs=augmented["large"],
+              params=["augmentation.seed", "augmentation.output"]),
+        Stage("augment_normal", run_augment("normal"), deps=sources["normal"], outs=augmented["normal"],
+              params=["augmentation.seed", "augmentation.output"]),
+    ]
+    cache_stages = [] if cache_dir is None else [
+        Stage("tensor_cache", run_tensor_cache, deps=[split_dir], outs=[cache_dir],
+              params=["tensor_cache", "preprocessing.resize", "preprocessing.reduced_decode"]),
+    ]
+    cache_deps = [] if cache_dir is None else [cache_dir]
+    return [
+        Stage("data_load", lambda catalog: load_data(params, data_dir, catalog),
+              deps=[data_dir / params['data']['normal_coal_dir'], data_dir / params['data']['large_coal_dir'],
+                    data_dir / "labels" / "train"],
+              outs=[*sources["normal"], *sources["large"]],
+              params=["data.normal_coal_dir", "data.large_coal_dir"]),
+        *augment_stages,
+        Stage("split", run_split, deps=[path for source in split_sources for path in source[:2]],
+              outs=[consolidated_dir, split_dir], params=["split", "shards", "dedup"]),
+        *cache_stages,
+        Stage("train", run_train, deps=[split_dir] + ([] if manifest else [data_yaml]) + cache_deps, outs=[run_dir],
+              params=["train"] + (["augmentation.seed"] if online else [])),
+        Stage("eval", run_eval, deps=[run_dir / "weights" / "best.pt", split_dir] + cache_deps, outs=[Path(inference['output_dir'])],
+              params=["inference.backend", "inference.onnx_model", "inference.conf", "tiling"]),
+    ]
+
+def main():
+    params = load_params()
+    configure(params['instrumentation'])
+    pipeline = params['pipeline']
+
+    stages = build_stages(params)
+    results = run_pipeline(stages, params, pipeline['state'], targets=pipeline['targets'], force=pipeline['force'],
+                           jobs=pipeline['jobs'], catalog_path=params['catalog']['path'])
+    ran = [name for name, result in results.items() if result == "ran"]
+    print(f"Pipeline finished: {len(ran)} stages ran ({', '.join(ran) or 'none'}), "
+          f"{len(results) - len(ran)} up to date")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+import asyncio
+import collections
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+import cv2
+import numpy as np
+from data_load import load_params
+from inference import load_backend, resolve_model
+from stream import percentiles
+
+class QueueFull(Exception):
+    """Raised by MicroBatcher.submit() when max_queue requests are already waiting."""
+
+class MicroBatcher:
+    """
+    Coalesce concurrent predict requests into batched backend calls.
+
+    Requests wait in a queue. The batch loop takes the first waiting request, then collects
+    more for at most max_wait_ms or until max_batch_size, and runs the batch in one
+    backend.predict() call. The model runs on a single thread, so every camera shares one
+    model instance, and requests arriving during a predict call form the next batch.
+
+    Args:
+        backend: Object with predict(list of BGR images) -> list of (N, 6) pixel detections.
+        max_batch_size (int): Most images per predict call.
+        max_wait_ms (float): How long a batch waits to fill once its first request arrived.
+        max_queue (int): Most requests waiting for a batch; more are rejected with QueueFull.
+        latency_window (int): Number of most recent requests the latency percentiles cover.
+    """
+
+    def __init__(self, backend, max_batch_size=8, max_wait_ms=10, max_queue=64, latency_window=10000):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.queue = None
+        self.batch_sizes = collections.Counter()
+        self.latencies = collections.deque(maxlen=latency_window)
+        self.queue_waits = collections.deque(maxlen=latency_window)
+        self.infer_times = collections.deque(maxlen=latency_window)
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._task = None
+
+    def start(self):
+        # Created here so the queue belongs to the running event loop
+        self.queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, image):
+        """
+        Queue one BGR image and wait for its detections.
+
+        Returns:
+            tuple: ((N, 6) [x_min, y_min, x_max, y_max, confidence, class_id] detections,
+                    size of the batch it ran in)
+        """
+        if self.queue.qsize() >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(f"{self.queue.qsize()} requests already waiting")
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((image, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self, getter):
+        """Wait for the first request, then gather a batch. Returns (batch, pending queue getter)."""
+        loop = asyncio.get_running_loop()
+        batch = [await (getter or self.queue.get())]
+        getter = None
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            # A timed-out get is kept for the next batch instead of cancelled, so no request is lost
+            getter = getter or asyncio.ensure_future(self.queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if not done:
+                break
+            batch.append(getter.result())
+            getter = None
+        return batch, getter
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        getter = None
+        try:
+            while True:
+                batch, getter = await self._collect(getter)
+                # Requests whose client went away are not worth running
+                batch = [item for item in batch if not item[1].done()]
+                if not batch:
+                    continue
+
+                started = time.perf_counter()
+                try:
+                    detections = await loop.run_in_executor(self._executor, self.backend.predict,
+                                                            [image for image, _, _ in batch])
+                except Exception as e:
+                    self.errors += len(batch)
+                    for _, future, _ in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                done = time.perf_counter()
+
+                self.batch_sizes[len(batch)] += 1
+                self.infer_times.append((done - started) * 1000)
+                for (_, future, queued), image_detections in zip(batch, detections):
+                    self.queue_waits.append((started - queued) * 1000)
+                    if not future.done():
+                        future.set_result((image_detections, len(batch)))
+        finally:
+            if getter is not None:
+                getter.cancel()
+
+    def metrics(self):
+        batches = sum(self.batch_sizes.values())
+        images = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "requests": self.requests,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "batches": batches,
+            "mean_batch_size": images / batches if batches else 0.0,
+            "batch_size_histogram": {str(size): self.batch_sizes[size] for size in sorted(self.batch_sizes)},
+            "latency": percentiles(self.latencies, (50, 90, 99)),
+            "queue_wait": percentiles(self.queue_waits, (50, 99)),
+            "infer_batch": percentiles(self.infer_times, (50, 99)),
+        }
+
+class InferenceServer:
+    """
+    Minimal HTTP/1.1 server (asyncio streams, keep-alive) in front of a MicroBatcher.
+
+    Endpoints:
+        POST /predict   JPEG (or PNG) body. Responds with the detections as [x_min, y_min,
+                        x_max, y_max, confidence, class_id] rows in image pixels. An optional
+                        ?camera=<id> query is echoed back and counted per camera in /metrics.
+        GET  /health    Liveness, backend and batching settings.
+        GET  /metrics   Queue depth, batch size histogram and latency percentiles.
+
+    Latency is measured per request from the end of the upload to the response, so it
+    includes decoding, queueing and inference.
+
+    Args:
+        batcher (MicroBatcher): Started batcher that runs the model.
+        max_body_mb (float): Largest accepted upload.
+        names (dict): Class id -> name, returned by /health.
+    """
+
+    def __init__(self, batcher, max_body_mb=20, names=None):
+        self.batcher = batcher
+        self.max_body = int(max_body_mb * 1e6)
+        self.names = names
+        self.cameras = collections.Counter()
+        self.started = time.time()
+        # Decoding runs off the event loop (cv2 releases the GIL), a full batch at a time
+        self._decoder = ThreadPoolExecutor(max_workers=batcher.max_batch_size)
+
+    async def handle(self, reader, writer):
+        """Serve every request on one connection until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {"error": "malformed request line"}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                # The body can't be delimited without a valid length, so the connection is closed
+                length = headers.get("content-length") or "0"
+                if not (length.isascii() and length.isdigit()):
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST,
+                                        {"error": f"invalid Content-Length {length!r}"}, False)
+                    break
+                length = int(length)
+                if length > self.max_body:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                        {"error": f"body larger than {self.max_body} bytes"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self.route(method, target, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, target, body):
+        """Dispatch one request. Returns (HTTPStatus, JSON-serializable payload)."""
+        url = urlsplit(target)
+        if url.path == "/predict":
+            if method != "POST":
+                return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "use POST"}
+            return await self.predict(body, parse_qs(url.query).get("camera", [None])[0])
+        if method != "GET":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "use GET"}
+        if url.path == "/health":
+            return HTTPStatus.OK, {
+                "status": "ok",
+                "backend": getattr(self.batcher.backend, "name", type(self.batcher.backend).__name__),
+                "names": self.names,
+                "max_batch_size": self.batcher.max_batch_size,
+                "max_wait_ms": self.batcher.max_wait * 1000,
+                "uptime_s": round(time.time() - self.started, 1),
+            }
+        if url.path == "/metrics":
+            return HTTPStatus.OK, {**self.batcher.metrics(), "cameras": dict(self.cameras)}
+        return HTTPStatus.NOT_FOUND, {"error": f"unknown path {url.path}"}
+
+    async def predict(self, body, camera=None):
+        started = time.perf_counter()
+        self.batcher.requests += 1
+        if camera is not None:
+            self.cameras[camera] += 1
+        if not body:
+            return HTTPStatus.BAD_REQUEST, {"error": "empty body, expected a JPEG image"}
+        image = await asyncio.get_running_loop().run_in_executor(
+            self._decoder, cv2.imdecode, np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return HTTPStatus.BAD_REQUEST, {"error": "body is not a decodable image"}
+
+        try:
+            detections, batch_size = await self.batcher.submit(image)
+        except QueueFull as e:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": f"server busy: {e}"}
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"inference failed: {e}"}
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.batcher.latencies.append(latency_ms)
+        height, width = image.shape[:2]
+        return HTTPStatus.OK, {
+            "camera": camera,
+            "width": width,
+            "height": height,
+            "batch_size": batch_size,
+            "latency_ms": round(latency_ms, 2),
+            "detections": np.round(np.asarray(detections, dtype=np.float32).reshape(-1, 6), 2).tolist(),
+        }
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    def close(self):
+        self._decoder.shutdown(wait=False)
+
+async def serve(backend, host="127.0.0.1", port=8000, max_batch_size=8, max_wait_ms=10, max_queue=64,
+                max_body_mb=20, latency_window=10000, ready=None):
+    """
+    Serve backend over HTTP until cancelled.
+
+    Args:
+        backend: Inference backend (see inference.load_backend()), loaded once and shared by every client.
+        host (str): Address to bind. The default only accepts connections from this machine.
+        port (int): Port to bind. 0 picks a free one.
+        max_batch_size, max_wait_ms, max_queue, latency_window: See MicroBatcher.
+        max_body_mb (float): Largest accepted upload.
+        ready (asyncio.Future): Optional future set to the bound (host, port) once listening.
+    """
+    batcher = MicroBatcher(backend, max_batch_size, max_wait_ms, max_queue, latency_window).start()
+    server = InferenceServer(batcher, max_body_mb, names=getattr(backend, "names", None))
+    listener = await asyncio.start_server(server.handle, host, port)
+    address = listener.sockets[0].getsockname()[:2]
+    print(f"Serving {getattr(backend, 'name', type(backend).__name__)} on http://{address[0]}:{address[1]} "
+          f"(batches of up to {max_batch_size}, waiting at most {max_wait_ms} ms)")
+    if ready is not None:
+        ready.set_result(address)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await batcher.stop()
+        server.close()
+
+def main():
+    params = load_params()
+    serve_params = params['serve']
+    inference = params['inference']
+
+    model_path = resolve_model(params)
+
+    backend = load_backend(inference['backend'], model_path, conf=inference['conf'], device=inference['device'])
+    try:
+        asyncio.run(serve(
+            backend,
+            host=serve_params['host'],
+            port=serve_params['port'],
+            max_batch_size=serve_params['max_batch_size'],
+            max_wait_ms=serve_params['max_wait_ms'],
+            max_queue=serve_params['max_queue'],
+            max_body_mb=serve_params['max_body_mb'],
+        ))
+    except KeyboardInterrupt:
+        print("Server stopped")
+
+if __name__ == "__main__":
+    main()
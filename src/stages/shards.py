@@ -0,0 +1,135 @@
+import io
+import json
+import random
+import tarfile
+from pathlib import Path
+import cv2
+import numpy as np
+from yolo_labels import parse_yolo_text
+
+SHARD_PATTERN = "shard-{:05d}.tar"
+INDEX_FILE = "shards.json"
+
+def _add_member(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+def write_shards(pairs, shard_dir, shard_size_mb=256, keys=None):
+    """
+    Pack (image, label) pairs into fixed-size tar shards.
+
+    Each sample is stored as two consecutive members, "<key>.<ext>" and "<key>.txt", so a
+    reader can stream a shard front to back without seeking. A new shard is started when
+    the current one would grow past shard_size_mb. The index file records which keys live
+    in which shard and the byte size of every shard.
+
+    Args:
+        pairs (list of tuple): (image_path, label_path) pairs, e.g. from Catalog.pairs().
+        shard_dir (Path): Directory to write the shards and index to.
+        shard_size_mb (float): Target shard size in megabytes.
+        keys (list of str): Sample key of every pair. Default is the image stem. Keys
+                            may contain "/" to keep samples from different sources apart.
+
+    Returns:
+        Path: Path to the index file.
+    """
+    shard_dir = Path(shard_dir)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    max_bytes = int(shard_size_mb * 1e6)
+
+    shards = []
+    tar = None
+    current_bytes = 0
+    for i, (image_path, label_path) in enumerate(pairs):
+        image_path, label_path = Path(image_path), Path(label_path)
+        image_bytes = image_path.read_bytes()
+        label_bytes = label_path.read_bytes()
+        sample_bytes = len(image_bytes) + len(label_bytes) + 2048  # two tar headers (+ padding)
+
+        if tar is None or (current_bytes + sample_bytes > max_bytes and shards[-1]["keys"]):
+            if tar is not None:
+                tar.close()
+                shards[-1]["bytes"] = (shard_dir / shards[-1]["file"]).stat().st_size
+            name = SHARD_PATTERN.format(len(shards))
+            tar = tarfile.open(shard_dir / name, 'w')
+            shards.append({"file": name, "keys": []})
+            current_bytes = 0
+
+        key = keys[i] if keys is not None else image_path.stem
+        _add_member(tar, f"{key}{image_path.suffix.lower()}", image_bytes)
+        _add_member(tar, f"{key}.txt", label_bytes)
+        shards[-1]["keys"].append(key)
+        current_bytes += sample_bytes
+
+    if tar is not None:
+        tar.close()
+        shards[-1]["bytes"] = (shard_dir / shards[-1]["file"]).stat().st_size
+
+    index_path = shard_dir / INDEX_FILE
+    index_path.write_text(json.dumps({"samples": sum(len(s["keys"]) for s in shards), "shards": shards}, indent=1))
+    print(f"Wrote {sum(len(s['keys']) for s in shards)} samples into {len(shards)} shards in {shard_dir}")
+    return index_path
+
+def load_shard_index(shard_dir):
+    """Return the shard index written by write_shards()."""
+    return json.loads((Path(shard_dir) / INDEX_FILE).read_text())
+
+def iter_shards(shard_dir, shuffle=False, seed=0, buffer_size=0, decode=True, shards=None):
+    """
+    Stream samples from a shard directory with large sequential reads.
+
+    Args:
+        shard_dir (Path): Directory written by write_shards().
+        shuffle (bool): Visit shards in a random order (shard-level shuffle).
+        seed (int): Seed for the shard order and the sample buffer.
+        buffer_size (int): When > 0, also shuffle samples through a buffer of this size,
+                           which mixes samples across neighbouring shards.
+        decode (bool): Decode images to BGR arrays and labels to (N, 5) arrays. With False
+                       the raw encoded bytes are yielded.
+        shards (list of str): Only read these shard files (e.g. one worker's share).
+
+    Yields:
+        tuple: (key, image, labels)
+    """
+    shard_dir = Path(shard_dir)
+    files = shards if shards is not None else [shard["file"] for shard in load_shard_index(shard_dir)["shards"]]
+    rng = random.Random(seed)
+    if shuffle:
+        files = list(files)
+        rng.shuffle(files)
+
+    def samples():
+        for name in files:
+            # Stream mode ("r|") reads the tar front to back without seeking
+            with tarfile.open(shard_dir / name, 'r|') as tar:
+                pending = {}
+                for member in tar:
+                    key, ext = member.name.rsplit(".", 1)
+                    data = tar.extractfile(member).read()
+                    pending.setdefault(key, {})[ext] = data
+                    if len(pending[key]) == 2:
+                        sample = pending.pop(key)
+                        label_bytes = sample.pop("txt")
+                        image_bytes = next(iter(sample.values()))
+                        if decode:
+                            image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+                            labels = parse_yolo_text(label_bytes.decode(), source=f"{name}:{key}")
+                            yield key, image, labels
+                        else:
+                            yield key, image_bytes, label_bytes
+
+    if buffer_size <= 0:
+        yield from samples()
+        return
+
+    buffer = []
+    for sample in samples():
+        if len(buffer) < buffer_size:
+            buffer.append(sample)
+            continue
+        i = rng.randrange(buffer_size)
+        yield buffer[i]
+        buffer[i] = sample
+    rng.shuffle(buffer)
+    yield from buffer
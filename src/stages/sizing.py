@@ -0,0 +1,277 @@
+import collections
+import json
+import math
+from pathlib import Path
+import numpy as np
+from data_load import load_params
+
+SIZE_METRICS = ("max_side", "min_side", "mean_side", "equivalent_diameter")
+
+class Calibration:
+    """
+    Pixel to millimetre conversion for a fixed camera looking down at the belt.
+
+    Args:
+        mm_per_pixel_x (float): Millimetres per pixel across the image.
+        mm_per_pixel_y (float): Millimetres per pixel down the image. Default is the same as x.
+    """
+
+    def __init__(self, mm_per_pixel_x, mm_per_pixel_y=None):
+        self.mm_per_pixel = np.array([mm_per_pixel_x, mm_per_pixel_y or mm_per_pixel_x], dtype=np.float32)
+
+    @classmethod
+    def from_reference(cls, length_px, length_mm):
+        """Calibrate from an object of known length, e.g. the belt width in pixels and in mm."""
+        return cls(length_mm / length_px)
+
+def box_sizes_mm(detections, calibration, metric="max_side", min_conf=0.0):
+    """
+    Estimate the size of every detected lump of a frame in one vectorized step.
+
+    Args:
+        detections (np.ndarray): (N, 6) [x_min, y_min, x_max, y_max, confidence, class_id] pixels.
+        calibration (Calibration): Pixel to millimetre conversion.
+        metric (str): "max_side" and "min_side" of the box, "mean_side", or "equivalent_diameter"
+                      (diameter of the circle with the same area as the box).
+        min_conf (float): Ignore detections below this confidence.
+
+    Returns:
+        np.ndarray: (M,) float32 sizes in millimetres.
+    """
+    detections = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+    detections = detections[detections[:, 4] >= min_conf]
+    sides = (detections[:, 2:4] - detections[:, :2]) * calibration.mm_per_pixel
+    if metric == "max_side":
+        return sides.max(axis=1)
+    if metric == "min_side":
+        return sides.min(axis=1)
+    if metric == "mean_side":
+        return sides.mean(axis=1)
+    if metric == "equivalent_diameter":
+        return 2 * np.sqrt(sides.prod(axis=1) / np.pi)
+    raise ValueError(f"Unknown size metric {metric!r}. Expected one of {SIZE_METRICS}")
+
+def size_bins(min_mm=5, max_mm=500, count=64):
+    """Log-spaced bin edges, so small and large lumps get the same relative resolution."""
+    return np.geomspace(min_mm, max_mm, count + 1)
+
+class SizeHistogram:
+    """
+    Fixed-bin histogram of lump sizes with constant memory, however many lumps are added.
+
+    Sizes below the first edge and above the last are counted in an underflow and overflow
+    bin, so no lump is lost. Percentiles are interpolated linearly within a bin.
+
+    Args:
+        edges (np.ndarray): Increasing bin edges in millimetres.
+    """
+
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        # counts[0] is underflow, counts[-1] overflow
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+        self.total_mm = 0.0
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def add(self, sizes):
+        sizes = np.asarray(sizes, dtype=np.float64).reshape(-1)
+        if len(sizes):
+            self.counts += np.bincount(np.searchsorted(self.edges, sizes, side="right"), minlength=len(self.counts))
+            self.total_mm += float(sizes.sum())
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.total_mm += other.total_mm
+
+    def percentile(self, q):
+        """Size below which q percent of the lumps fall (None when empty)."""
+        total = self.count
+        if not total:
+            return None
+        target = q / 100 * total
+        cumulative = np.cumsum(self.counts)
+        index = int(np.searchsorted(cumulative, target, side="left"))
+        if index == 0:
+            return float(self.edges[0])
+        if index == len(self.counts) - 1:
+            return float(self.edges[-1])
+        low, high = self.edges[index - 1], self.edges[index]
+        before = cumulative[index - 1]
+        return float(low + (high - low) * (target - before) / self.counts[index])
+
+    def fraction_above(self, size_mm):
+        """
+        Share of lumps larger than size_mm (None when empty).
+
+        The bin containing size_mm is split linearly; underflow lumps count as smaller and
+        overflow lumps as larger, so size_mm should lie inside the binned range.
+        """
+        total = self.count
+        if not total:
+            return None
+        index = int(np.searchsorted(self.edges, size_mm, side="right"))
+        above = float(self.counts[index + 1:].sum())
+        if 0 < index < len(self.edges):
+            low, high = self.edges[index - 1], self.edges[index]
+            above += self.counts[index] * (high - size_mm) / (high - low)
+        elif index == len(self.edges):
+            above += self.counts[index]
+        return above / total
+
+    def summary(self, oversize_mm, percentiles=(50, 80)):
+        count = self.count
+        return {
+            "lumps": count,
+            "mean_mm": round(self.total_mm / count, 2) if count else None,
+            **{f"p{q}_mm": None if count == 0 else round(self.percentile(q), 2) for q in percentiles},
+            "oversize_fraction": None if count == 0 else round(float(self.fraction_above(oversize_mm)), 4),
+        }
+
+class MinuteAggregator:
+    """
+    Per-minute and rolling size statistics over a live stream.
+
+    Lump sizes go into the histogram of the current minute of belt time. When a frame from
+    a later minute arrives, the finished minute is summarized and handed to emit, and it
+    joins a ring of minute histograms that the rolling statistics are computed from. The
+    ring covers the last rolling_minutes minutes of belt time, not the last minutes that had
+    frames: when the belt stops, older minutes age out instead of stretching the window.
+    Memory is fixed: (rolling_minutes + 1) histograms.
+
+    Args:
+        edges (np.ndarray): Histogram bin edges in millimetres.
+        oversize_mm (float): Lumps larger than this count as oversize.
+        rolling_minutes (int): Length of the rolling window.
+        emit (callable): Called with each finished minute's summary dict.
+    """
+
+    def __init__(self, edges, oversize_mm=150, rolling_minutes=15, emit=None):
+        self.edges = edges
+        self.oversize_mm = oversize_mm
+        self.current = SizeHistogram(edges)
+        self.minute = None
+        self.frames = 0
+        self.rolling_minutes = rolling_minutes
+        self.history = collections.deque(maxlen=rolling_minutes)  # (minute, histogram)
+        self.emit = emit or (lambda summary: print(json.dumps(summary)))
+
+    def add(self, timestamp, sizes):
+        """Add the lump sizes (mm) of one frame captured at timestamp (seconds of belt time)."""
+        minute = math.floor(timestamp / 60)
+        if self.minute is not None and minute != self.minute:
+            self.flush()
+        self.minute = minute
+        self.current.add(sizes)
+        self.frames += 1
+
+    def flush(self):
+        """Summarize and emit the current minute, then start a new one."""
+        if self.minute is None:
+            return
+        summary = {"minute_start": self.minute * 60, "frames": self.frames, **self.current.summary(self.oversize_mm)}
+        self.history.append((self.minute, self.current))
+        self._evict(self.minute)
+        summary["rolling"] = self.rolling_summary(include_current=False)
+        self.emit(summary)
+        self.current = SizeHistogram(self.edges)
+        self.frames = 0
+        self.minute = None
+
+    def _evict(self, minute):
+        """Drop history minutes outside the rolling window that ends at minute."""
+        while self.history and self.history[0][0] <= minute - self.rolling_minutes:
+            self.history.popleft()
+
+    def rolling_summary(self, include_current=True):
+        if include_current and self.minute is not None:
+            self._evict(self.minute)
+        combined = SizeHistogram(self.edges)
+        for _, histogram in self.history:
+            combined.merge(histogram)
+        if include_current:
+            combined.merge(self.current)
+        return {"minutes": len(self.history) + include_current, **combined.summary(self.oversize_mm)}
+
+class SizingSink:
+    """
+    Stream sink (see stream.stream_inference()) that turns detections into size statistics.
+
+    Every frame's boxes are converted to millimetres and added to a MinuteAggregator; finished
+    minutes are appended as JSON lines to output. Frames are optionally forwarded to another
+    sink, e.g. a JsonlSink keeping the raw detections.
+
+    Args:
+        aggregator (MinuteAggregator): Aggregator whose emit is replaced by the output writer.
+        calibration (Calibration): Pixel to millimetre conversion.
+        output (Path): JSON lines file of per-minute summaries.
+        metric (str): See box_sizes_mm().
+        min_conf (float): Ignore detections below this confidence.
+        clock (str): "wall" uses capture timestamps, "video" the position in the video (for files).
+        forward: Optional sink that also receives every frame.
+    """
+
+    def __init__(self, aggregator, calibration, output, metric="max_side", min_conf=0.25, clock="wall", forward=None):
+        self.aggregator = aggregator
+        self.calibration = calibration
+        self.metric = metric
+        self.min_conf = min_conf
+        self.clock = clock
+        self.forward = forward
+        self.path = Path(output)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, 'w', buffering=1)
+        self.aggregator.emit = lambda summary: self.file.write(json.dumps(summary) + "\n")
+
+    def emit(self, frame_idx, timestamp, video_ms, latency_ms, detections):
+        belt_time = timestamp if self.clock == "wall" else video_ms / 1000
+        self.aggregator.add(belt_time, box_sizes_mm(detections, self.calibration, self.metric, self.min_conf))
+        if self.forward is not None:
+            self.forward.emit(frame_idx, timestamp, video_ms, latency_ms, detections)
+
+    def close(self):
+        self.aggregator.flush()
+        self.file.close()
+        if self.forward is not None:
+            self.forward.close()
+
+def summarize_detection_log(log_path, output_path, calibration, edges, oversize_mm=150, rolling_minutes=15,
+                            metric="max_side", min_conf=0.25, clock="wall"):
+    """
+    Compute per-minute size statistics from a saved stream.JsonlSink log, one line at a time.
+
+    Returns:
+        int: Number of frames read.
+    """
+    sink = SizingSink(MinuteAggregator(edges, oversize_mm, rolling_minutes), calibration, output_path, metric,
+                      min_conf, clock)
+    frames = 0
+    with open(log_path) as log:
+        for line in log:
+            record = json.loads(line)
+            sink.emit(record["frame"], record["timestamp"], record["video_ms"], record["latency_ms"],
+                      np.array(record["detections"], dtype=np.float32))
+            frames += 1
+    sink.close()
+    print(f"Summarized {frames} frames from {log_path} into {output_path}")
+    return frames
+
+def sizing_from_params(sizing):
+    """Return (calibration, edges) from the params.yaml sizing section."""
+    bins = sizing['bins']
+    return Calibration(sizing['mm_per_pixel']), size_bins(bins['min_mm'], bins['max_mm'], bins['count'])
+
+def main():
+    params = load_params()
+    sizing = params['sizing']
+    calibration, edges = sizing_from_params(sizing)
+
+    # Post-process a recorded stream run (stream.py also aggregates live when sizing.enabled)
+    summarize_detection_log(params['stream']['output'], sizing['output'], calibration, edges,
+                            oversize_mm=sizing['oversize_mm'], rolling_minutes=sizing['rolling_minutes'],
+                            metric=sizing['metric'], min_conf=sizing['min_conf'], clock=sizing['clock'])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import collections
+import json
+import threading
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+from data_load import load_params
+from inference import load_backend, resolve_model
+from sizing import MinuteAggregator, SizingSink, sizing_from_params
+
+class FrameReader:
+    """
+    Read frames from a video file or capture device on a background thread.
+
+    Frames go into a bounded buffer. When the consumer falls behind, the oldest buffered
+    frame is dropped to make room, so the buffer never holds more than queue_size frames
+    and the consumer always sees the most recent part of the stream.
+
+    Args:
+        source (str or int): Video file path, stream URL, or device index.
+        queue_size (int): Maximum number of buffered frames.
+        realtime (bool): Pace a video file at its own frame rate, like a live camera.
+                         Default is True for files and False for devices (which pace themselves).
+    """
+
+    def __init__(self, source, queue_size=4, realtime=None):
+        self.source = int(source) if str(source).isdigit() else str(source)
+        self.capture = cv2.VideoCapture(self.source)
+        if not self.capture.isOpened():
+            raise IOError(f"Unable to open video source {source!r}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.realtime = not isinstance(self.source, int) if realtime is None else realtime
+        self.frames = collections.deque(maxlen=queue_size)
+        self.read_count = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.finished = False
+        self._ready = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        started = time.perf_counter()
+        while not self._stop.is_set():
+            ok, frame = self.capture.read()
+            if not ok:
+                break
+            if self.realtime:
+                # Sleep until this frame's slot in the stream's own timeline
+                delay = started + self.read_count / self.fps - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            item = (self.read_count, time.time(), time.perf_counter(), self.capture.get(cv2.CAP_PROP_POS_MSEC), frame)
+            with self._ready:
+                if len(self.frames) == self.frames.maxlen:
+                    self.dropped += 1
+                self.frames.append(item)
+                self._ready.notify()
+            self.read_count += 1
+        self.capture.release()
+        with self._ready:
+            self.finished = True
+            self._ready.notify_all()
+
+    def get(self, max_frames=1, max_age_ms=None, timeout=1.0):
+        """
+        Take up to max_frames buffered frames, oldest first, waiting for at least one.
+
+        Buffered frames that have waited longer than max_age_ms are discarded first (and
+        counted in skipped), so a consumer that fell behind jumps straight to fresh frames.
+        The newest frame is never discarded, so the stream keeps moving even when the
+        budget can't be met.
+
+        Returns:
+            list of tuple: (frame index, wall-clock capture time, perf_counter capture time,
+                           position in the video in ms, BGR frame). Empty once the stream ended.
+        """
+        with self._ready:
+            if not self.frames and not self.finished:
+                self._ready.wait(timeout)
+            if max_age_ms is not None:
+                oldest_allowed = time.perf_counter() - max_age_ms / 1000
+                while len(self.frames) > 1 and self.frames[0][2] < oldest_allowed:
+                    self.frames.popleft()
+                    self.skipped += 1
+            return [self.frames.popleft() for _ in range(min(max_frames, len(self.frames)))]
+
+    @property
+    def done(self):
+        return self.finished and not self.frames
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+class JsonlSink:
+    """
+    Append one JSON line per processed frame.
+
+    Each line holds the frame index, its wall-clock capture timestamp, its position in the
+    video, the end-to-end latency and the detections as [x_min, y_min, x_max, y_max,
+    confidence, class_id] rows in frame pixels.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, 'w', buffering=1)
+
+    def emit(self, frame_idx, timestamp, video_ms, latency_ms, detections):
+        self.file.write(json.dumps({
+            "frame": frame_idx,
+            "timestamp": round(timestamp, 6),
+            "video_ms": round(video_ms, 1),
+            "latency_ms": round(latency_ms, 2),
+            "detections": np.round(detections, 2).tolist(),
+        }) + "\n")
+
+    def close(self):
+        self.file.close()
+
+def percentiles(values, points=(50, 90, 95, 99)):
+    """Return {"p50_ms": ..., ...} for a sequence of millisecond values."""
+    if not len(values):
+        return {f"p{point}_ms": 0.0 for point in points}
+    return {f"p{point}_ms": float(value) for point, value in zip(points, np.percentile(values, points))}
+
+def stream_inference(backend, source, sink, batch_size=1, queue_size=4, max_latency_ms=500, realtime=None,
+                     report_interval=10.0, latency_window=10000):
+    """
+    Run the detector over a live stream without building a backlog.
+
+    Before each batch, buffered frames that could no longer be finished within
+    max_latency_ms are skipped: a frame's age plus the recent inference time (a moving
+    average) must fit the budget. The reader also drops the oldest buffered frame when its
+    buffer is full. So when inference is slower than the camera the pipeline processes
+    fewer, fresher frames instead of falling further behind.
+
+    Args:
+        backend: Inference backend (see inference.load_backend()).
+        source (str or int): Video file path, stream URL, or device index.
+        sink: Object with emit(frame_idx, timestamp, video_ms, latency_ms, detections).
+        batch_size (int): Maximum frames per backend call. Only frames already buffered are
+                          batched; the loop never waits to fill a batch.
+        queue_size (int): Frame buffer size.
+        max_latency_ms (float): End-to-end latency budget per frame. None disables skipping.
+        realtime (bool): See FrameReader.
+        report_interval (float): Seconds between progress lines.
+        latency_window (int): Number of most recent frames the latency percentiles cover.
+
+    Returns:
+        dict: Frame counts and end-to-end latency percentiles.
+    """
+    reader = FrameReader(source, queue_size=queue_size, realtime=realtime).start()
+    latencies = collections.deque(maxlen=latency_window)
+    processed = 0
+    infer_ms = 0.0
+    started = last_report = time.perf_counter()
+    try:
+        while not reader.done:
+            max_age_ms = None if max_latency_ms is None else max(max_latency_ms - infer_ms, 0)
+            frames = reader.get(batch_size, max_age_ms=max_age_ms)
+            if not frames:
+                continue
+
+            predict_started = time.perf_counter()
+            detections = backend.predict([frame[4] for frame in frames])
+            done = time.perf_counter()
+            # Moving average of how long a batch takes, used to budget the next one
+            infer_ms = 0.8 * infer_ms + 0.2 * (done - predict_started) * 1000 if infer_ms else (done - predict_started) * 1000
+            for (frame_idx, timestamp, captured, video_ms, _), frame_detections in zip(frames, detections):
+                latency_ms = (done - captured) * 1000
+                latencies.append(latency_ms)
+                sink.emit(frame_idx, timestamp, video_ms, latency_ms, frame_detections)
+            processed += len(frames)
+
+            if done - last_report >= report_interval:
+                summary = percentiles(latencies)
+                print(f"{processed}/{reader.read_count} frames processed ({processed / (done - started):.1f} fps), "
+                      f"{reader.dropped} dropped, {reader.skipped} skipped, "
+                      f"latency p50 {summary['p50_ms']:.0f} ms, p99 {summary['p99_ms']:.0f} ms")
+                last_report = done
+    finally:
+        reader.stop()
+
+    elapsed = time.perf_counter() - started
+    report = {
+        "frames_read": reader.read_count,
+        "frames_processed": processed,
+        "frames_dropped": reader.dropped,
+        "frames_skipped": reader.skipped,
+        "source_fps": reader.fps,
+        "processed_fps": processed / elapsed if elapsed > 0 else 0.0,
+        "latency": percentiles(latencies),
+    }
+    print(f"Stream finished: {processed}/{reader.read_count} frames processed, {reader.dropped} dropped, "
+          f"{reader.skipped} skipped, latency {', '.join(f'{k} {v:.0f}' for k, v in report['latency'].items())}")
+    return report
+
+def main():
+    params = load_params()
+    stream_params = params['stream']
+    inference = params['inference']
+
+    model_path = resolve_model(params)
+
+    backend = load_backend(inference['backend'], model_path, conf=inference['conf'], device=inference['device'])
+    sink = JsonlSink(stream_params['output'])
+    sizing = params['sizing']
+    if sizing['enabled']:
+        # Aggregate lump sizes per minute while the stream runs, keeping the raw log as well
+        calibration, edges = sizing_from_params(sizing)
+        sink = SizingSink(MinuteAggregator(edges, sizing['oversize_mm'], sizing['rolling_minutes']), calibration,
+                          sizing['output'], sizing['metric'], sizing['min_conf'], sizing['clock'], forward=sink)
+    try:
+        stream_inference(
+            backend,
+            stream_params['source'],
+            sink,
+            batch_size=stream_params['batch_size'],
+            queue_size=stream_params['queue_size'],
+            max_latency_ms=stream_params['max_latency_ms'],
+            realtime=stream_params['realtime'],
+        )
+    finally:
+        sink.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import json
+from pathlib import Path
+import numpy as np
+from data_load import load_params
+from catalog import Catalog
+from box_ops import batched_nms, box_iou
+from evaluate import load_ground_truth
+from inference import iter_predictions, load_backend, resolve_model, split_pairs, split_source, unique_stems
+
+def collect_detections(backend, image_paths, batch_size=16, prefetch_threads=4):
+    """
+    Run the backend once and keep every raw detection.
+
+    The backend should run at a very low confidence and a loose NMS IoU, so any stricter
+    setting can be derived from this one pass.
+
+    Returns:
+        dict: stems (list), detections ((P, 6) float32 pixel rows grouped by image) and
+              offsets ((images + 1,) int64).
+    """
+    unique_stems(image_paths)
+    stems, per_image = [], []
+    for path, _, detections in iter_predictions(backend, image_paths, batch_size, prefetch_threads):
+        stems.append(path.stem)
+        per_image.append(np.asarray(detections, dtype=np.float32).reshape(-1, 6))
+    offsets = np.zeros(len(per_image) + 1, dtype=np.int64)
+    np.cumsum([len(d) for d in per_image], out=offsets[1:])
+    detections = np.concatenate(per_image) if per_image else np.zeros((0, 6), dtype=np.float32)
+    return {"stems": stems, "detections": detections, "offsets": offsets}
+
+def save_detection_cache(cache_path, cache, settings):
+    """Save collect_detections() output with the settings (model, conf, iou) it was made with."""
+    cache_path = Path(cache_path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(cache_path, stems=np.array(cache["stems"]), detections=cache["detections"], offsets=cache["offsets"],
+             settings=json.dumps(settings, sort_keys=True))
+
+def load_detection_cache(cache_path, settings):
+    """Return the cached detections, or None when there is no cache made with these settings."""
+    cache_path = Path(cache_path)
+    if not cache_path.exists():
+        return None
+    with np.load(cache_path) as cache:
+        if str(cache["settings"]) != json.dumps(settings, sort_keys=True):
+            return None
+        return {"stems": [str(stem) for stem in cache["stems"]], "detections": cache["detections"], "offsets": cache["offsets"]}
+
+def align_detections(cache, stems):
+    """Reorder cached detections to follow stems (images missing from the cache get none)."""
+    position = {stem: i for i, stem in enumerate(cache["stems"])}
+    detections, offsets = cache["detections"], cache["offsets"]
+    per_image = [detections[offsets[position[stem]]:offsets[position[stem] + 1]] if stem in position
+                 else np.zeros((0, 6), dtype=np.float32) for stem in stems]
+    new_offsets = np.zeros(len(stems) + 1, dtype=np.int64)
+    np.cumsum([len(d) for d in per_image], out=new_offsets[1:])
+    return (np.concatenate(per_image) if per_image else np.zeros((0, 6), dtype=np.float32)), new_offsets
+
+def apply_nms(detections, offsets, iou_threshold):
+    """
+    Re-run class-aware NMS on every image at a stricter IoU threshold.
+
+    Returns:
+        tuple: (kept detections, offsets)
+    """
+    kept = []
+    for i in range(len(offsets) - 1):
+        image_detections = detections[offsets[i]:offsets[i + 1]]
+        keep = batched_nms(image_detections[:, :4], image_detections[:, 4], image_detections[:, 5], iou_threshold)
+        kept.append(image_detections[keep])
+    new_offsets = np.zeros(len(kept) + 1, dtype=np.int64)
+    np.cumsum([len(d) for d in kept], out=new_offsets[1:])
+    return (np.concatenate(kept) if kept else np.zeros((0, 6), dtype=np.float32)), new_offsets
+
+def match_by_score(detections, offsets, gt, gt_offsets, match_iou=0.5):
+    """
+    Flag true positives with score-ordered greedy matching (COCO style).
+
+    Each detection, highest score first, takes the unmatched ground truth box of its class
+    with the highest IoU. A detection's flag therefore never depends on lower-scoring
+    detections, so the true positives above any confidence threshold are a prefix of the
+    score-sorted flags and every threshold can be read off one cumulative sum.
+
+    Returns:
+        np.ndarray: (P,) bool true positive flags.
+    """
+    tp = np.zeros(len(detections), dtype=bool)
+    for i in range(len(offsets) - 1):
+        start, end = offsets[i], offsets[i + 1]
+        image_gt = gt[gt_offsets[i]:gt_offsets[i + 1]]
+        if start == end or not len(image_gt):
+            continue
+        image_detections = detections[start:end]
+        iou = box_iou(image_detections[:, :4], image_gt[:, :4])
+        iou[image_detections[:, 5][:, None] != image_gt[:, 4][None, :]] = 0
+        taken = np.zeros(len(image_gt), dtype=bool)
+        for j in np.argsort(-image_detections[:, 4], kind="stable"):
+            candidates = np.where(taken, 0, iou[j])
+            best = candidates.argmax()
+            if candidates[best] >= match_iou:
+                taken[best] = True
+                tp[start + j] = True
+    return tp
+
+def threshold_curve(scores, tp, n_gt, conf_grid):
+    """
+    Precision, recall and F1 at every confidence threshold from one cumulative sum.
+
+    Returns:
+        dict: Arrays over conf_grid: tp, fp, precision, recall, f1.
+    """
+    order = np.argsort(-scores, kind="stable")
+    cumulative_tp = np.concatenate([[0], np.cumsum(tp[order])])
+    # Number of detections with score >= each threshold
+    counts = np.searchsorted(-scores[order], -np.asarray(conf_grid), side="right")
+    tps = cumulative_tp[counts]
+    fps = counts - tps
+    precision = tps / np.maximum(counts, 1)
+    recall = tps / max(n_gt, 1)
+    f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-9)
+    return {"tp": tps, "fp": fps, "precision": precision, "recall": recall, "f1": f1}
+
+def alarm_curve(detections, offsets, gt, gt_offsets, alarm_class, conf_grid):
+    """
+    Image-level large-piece alarm statistics at every confidence threshold.
+
+    An image raises an alarm when it has a detection of alarm_class at or above the
+    threshold. NMS never removes an image's top-scoring box, so this only depends on the
+    best alarm_class score per image.
+
+    Returns:
+        dict: Arrays over conf_grid: alarm_rate (share of images alarmed), false_alarm_rate
+              (share of images without a large piece that alarm), miss_rate (share of images
+              with a large piece that don't).
+    """
+    images = len(offsets) - 1
+    image_of = np.repeat(np.arange(images), np.diff(offsets))
+    best = np.full(images, -np.inf)
+    is_alarm_class = detections[:, 5] == alarm_class
+    np.maximum.at(best, image_of[is_alarm_class], detections[is_alarm_class, 4])
+
+    gt_image_of = np.repeat(np.arange(images), np.diff(gt_offsets))
+    has_large = np.zeros(images, dtype=bool)
+    has_large[gt_image_of[gt[:, 4] == alarm_class]] = True
+
+    alarms = best[None, :] >= np.asarray(conf_grid)[:, None]
+    return {
+        "alarm_rate": alarms.mean(axis=1) if images else np.zeros(len(conf_grid)),
+        "false_alarm_rate": alarms[:, ~has_large].mean(axis=1) if (~has_large).any() else np.zeros(len(conf_grid)),
+        "miss_rate": (~alarms[:, has_large]).mean(axis=1) if has_large.any() else np.zeros(len(conf_grid)),
+    }
+
+def sweep_thresholds(detections, offsets, gt, gt_offsets, conf_grid, iou_grid, match_iou=0.5, alarm_class=0):
+    """
+    Score every (confidence, NMS IoU) pair from cached raw detections.
+
+    NMS is re-run once per IoU threshold; every confidence threshold is then read from
+    cumulative sums. NMS at a stricter IoU is applied to detections already NMS'd at the
+    loosest IoU of the inference pass, which matches a fresh run except for rare chains of
+    boxes suppressed by boxes that are suppressed themselves.
+
+    Returns:
+        list of dict: One row per (conf, nms_iou) with tp, fp, precision, recall, f1,
+                      alarm_rate, false_alarm_rate and miss_rate.
+    """
+    conf_grid = np.asarray(conf_grid)
+    rows = []
+    for iou_threshold in iou_grid:
+        kept, kept_offsets = apply_nms(detections, offsets, iou_threshold)
+        tp = match_by_score(kept, kept_offsets, gt, gt_offsets, match_iou)
+        curve = threshold_curve(kept[:, 4], tp, len(gt), conf_grid)
+        alarms = alarm_curve(kept, kept_offsets, gt, gt_offsets, alarm_class, conf_grid)
+        for k, conf in enumerate(conf_grid):
+            rows.append({"conf": round(float(conf), 4), "nms_iou": float(iou_threshold),
+                         **{key: float(values[k]) for key, values in {**curve, **alarms}.items()}})
+    return rows
+
+def recommend(rows, max_false_alarm_rate=None):
+    """Return the row with the best F1 among those within the false alarm budget (if any meet it)."""
+    eligible = [row for row in rows if max_false_alarm_rate is None or row["false_alarm_rate"] <= max_false_alarm_rate]
+    return max(eligible or rows, key=lambda row: (row["f1"], row["conf"]))
+
+def print_sweep(rows, best):
+    print(f"\n{'conf':>6}{'nms_iou':>9}{'P':>7}{'R':>7}{'F1':>7}{'alarm':>8}{'false':>8}{'miss':>8}")
+    for row in rows:
+        marker = "  <- recommended" if row is best else ""
+        print(f"{row['conf']:>6.2f}{row['nms_iou']:>9.2f}{row['precision']:>7.3f}{row['recall']:>7.3f}{row['f1']:>7.3f}"
+              f"{row['alarm_rate']:>8.3f}{row['false_alarm_rate']:>8.3f}{row['miss_rate']:>8.3f}{marker}")
+
+def main():
+    params = load_params()
+    sweep = params['sweep']
+    inference = params['inference']
+    catalog = Catalog(params['catalog']['path'])
+
+    model_path = resolve_model(params)
+    split_dir = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/split_data")
+    split_mode = params['split']['mode']
+    pairs = split_pairs(split_dir, "test", split_mode, catalog=catalog)
+
+    stems, _, gt, gt_offsets = load_ground_truth(pairs, catalog)
+    iou_grid = sorted(sweep['iou_grid'])
+    conf_grid = np.round(np.arange(*sweep['conf_grid']), 4)
+
+    # One pass at the lowest confidence and loosest NMS covers the whole grid
+    settings = {"model": model_path, "backend": inference['backend'], "conf": sweep['conf_min'], "iou": iou_grid[-1],
+                "images": str(split_source(split_dir, "test", split_mode))}
+    cache = load_detection_cache(sweep['cache'], settings)
+    if cache is None:
+        backend = load_backend(inference['backend'], model_path, conf=settings['conf'], iou=settings['iou'],
+                               device=inference['device'])
+        cache = collect_detections(backend, [image_path for image_path, _ in pairs], inference['batch_size'], inference['prefetch_threads'])
+        save_detection_cache(sweep['cache'], cache, settings)
+
+    detections, offsets = align_detections(cache, stems)
+    rows = sweep_thresholds(detections, offsets, gt, gt_offsets, conf_grid, iou_grid, sweep['match_iou'],
+                            sweep['alarm_class'])
+    best = recommend(rows, sweep['max_false_alarm_rate'])
+    print_sweep(rows, best)
+    print(f"\nRecommended operating point: conf={best['conf']}, nms_iou={best['nms_iou']} "
+          f"(F1 {best['f1']:.3f}, false alarm rate {best['false_alarm_rate']:.3f})")
+
+    report_path = Path(sweep['report'])
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report_path.write_text(json.dumps({"recommended": best, "rows": rows}, indent=1))
+
+if __name__ == "__main__":
+    main()
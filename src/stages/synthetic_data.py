@@ -0,0 +1,100 @@
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import cv2
+import numpy as np
+from yolo_labels import save_yolo_labels
+
+def synthetic_frame(rng, width, height, num_boxes, size_range=(0.02, 0.25)):
+    """
+    Draw one belt-like frame with coal lumps and return it with its YOLO labels.
+
+    The background is blurred noise (so JPEGs compress like real textured frames rather
+    than flat colour) and each lump is a dark, shaded ellipse filling its box.
+
+    Returns:
+        tuple: (BGR uint8 image, (N, 5) float32 YOLO rows)
+    """
+    background = rng.normal(110, 25, (height // 8 + 1, width // 8 + 1)).astype(np.float32)
+    image = cv2.resize(background, (width, height), interpolation=cv2.INTER_CUBIC)
+    image += rng.normal(0, 8, (height, width)).astype(np.float32)
+
+    # Lump sizes are log-uniform between the size range fractions of the frame height
+    sizes = np.exp(rng.uniform(np.log(size_range[0]), np.log(size_range[1]), num_boxes)) * height
+    aspect = rng.uniform(0.6, 1.6, num_boxes)
+    box_w = np.minimum(sizes * aspect, width - 2)
+    box_h = np.minimum(sizes, height - 2)
+    x_min = rng.uniform(0, width - box_w)
+    y_min = rng.uniform(0, height - box_h)
+
+    for x, y, w, h in zip(x_min, y_min, box_w, box_h):
+        shade = float(rng.uniform(20, 70))
+        center = (int(x + w / 2), int(y + h / 2))
+        cv2.ellipse(image, center, (max(int(w / 2), 1), max(int(h / 2), 1)), float(rng.uniform(0, 180)), 0, 360, shade, -1)
+        cv2.ellipse(image, (center[0] - int(w / 8), center[1] - int(h / 8)), (max(int(w / 6), 1), max(int(h / 6), 1)),
+                    0, 0, 360, shade + 40, -1)
+
+    image = cv2.cvtColor(np.clip(image, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+    labels = np.column_stack([
+        np.zeros(num_boxes),
+        (x_min + box_w / 2) / width,
+        (y_min + box_h / 2) / height,
+        box_w / width,
+        box_h / height,
+    ]).astype(np.float32)
+    return image, labels
+
+def generate_dataset(output_dir, num_images=100, resolution=(1920, 1080), boxes_per_image=(0, 30), empty_fraction=0.2,
+                     jpeg_quality=90, seed=0, prefix="synthetic", num_threads=4):
+    """
+    Write a synthetic dataset of JPEG frames and YOLO labels.
+
+    Output is deterministic for a given seed. A frame config file is written next to the
+    data, and an existing dataset with the same config is reused instead of regenerated.
+
+    Args:
+        output_dir (Path): Directory to create images/ and labels/ in.
+        num_images (int): Number of frames.
+        resolution (tuple): (width, height) of every frame.
+        boxes_per_image (tuple): Inclusive (min, max) number of lumps on non-empty frames.
+        empty_fraction (float): Share of frames without any lump (empty label file).
+        jpeg_quality (int): JPEG quality of the frames.
+        seed (int): Random seed.
+        prefix (str): File name prefix.
+        num_threads (int): Encoder threads.
+
+    Returns:
+        tuple: (images_dir, labels_dir)
+    """
+    output_dir = Path(output_dir)
+    images_dir, labels_dir = output_dir / "images", output_dir / "labels"
+    config = {"num_images": num_images, "resolution": list(resolution), "boxes_per_image": list(boxes_per_image),
+              "empty_fraction": empty_fraction, "jpeg_quality": jpeg_quality, "seed": seed, "prefix": prefix}
+    config_path = output_dir / "synthetic.json"
+    if config_path.exists() and json.loads(config_path.read_text()) == config:
+        return images_dir, labels_dir
+
+    # A different config replaces the old frames entirely
+    shutil.rmtree(images_dir, ignore_errors=True)
+    shutil.rmtree(labels_dir, ignore_errors=True)
+    images_dir.mkdir(parents=True, exist_ok=True)
+    labels_dir.mkdir(parents=True, exist_ok=True)
+    width, height = resolution
+
+    def write(idx):
+        # One generator per frame keeps frames identical however the threads interleave
+        rng = np.random.default_rng([seed, idx])
+        empty = rng.random() < empty_fraction
+        num_boxes = 0 if empty else int(rng.integers(boxes_per_image[0], boxes_per_image[1] + 1))
+        image, labels = synthetic_frame(rng, width, height, num_boxes)
+        name = f"{prefix}_{idx + 1:05d}"
+        cv2.imwrite(str(images_dir / f"{name}.jpg"), image, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        save_yolo_labels(labels_dir / f"{name}.txt", labels)
+
+    with ThreadPoolExecutor(num_threads) as executor:
+        list(executor.map(write, range(num_images)))
+
+    config_path.write_text(json.dumps(config, indent=1))
+    print(f"Generated {num_images} synthetic {width}x{height} frames in {output_dir}")
+    return images_dir, labels_dir
@@ -0,0 +1,234 @@
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+from data_load import load_params
+from catalog import Catalog
+from image_io import letterbox_labels, prepare_image
+from inference import split_pairs, split_source
+from yolo_labels import load_yolo_labels
+
+IMAGES_FILE = "images.u8"
+INDEX_FILE = "index.npz"
+META_FILE = "meta.json"
+
+def pack_images(pairs, cache_dir, target_size=(640, 640), letterbox=False, reduced=True, num_threads=4):
+    """
+    Decode and resize images once and pack them into a single memory-mappable file.
+
+    Writes to cache_dir:
+        images.u8:  raw uint8 BGR pixels of every image, back to back.
+        index.npz:  per-image byte offsets and (H, W, C) shapes, every label row in one
+                    (M, 5) float32 array with per-image label offsets, and the source paths.
+        meta.json:  settings the cache was built with.
+
+    Args:
+        pairs (list of tuple): (image_path, label_path) pairs, e.g. from Catalog.pairs().
+        cache_dir (Path): Directory to write the cache to.
+        target_size (tuple): (width, height) to resize to.
+        letterbox (bool): Keep the aspect ratio and pad, rewriting labels to match.
+        reduced (bool): Allow reduced-resolution JPEG decoding.
+        num_threads (int): Decode threads (cv2 releases the GIL while decoding).
+
+    Returns:
+        int: Number of images packed.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    target_size = tuple(target_size)
+
+    def load(pair):
+        image_path, label_path = pair
+        prepared = prepare_image(image_path, target_size, letterbox=letterbox, reduced=reduced)
+        if prepared is None:
+            print(f"Warning: Unable to read image at {image_path}. Skipping...")
+            return None
+        image, decoded_size, scale, pad = prepared
+        labels = load_yolo_labels(label_path)
+        if letterbox:
+            labels = letterbox_labels(labels, decoded_size, scale, pad, target_size)
+        return str(Path(image_path).resolve()), image, labels
+
+    paths, offsets, shapes, labels, label_counts = [], [], [], [], []
+    offset = 0
+    with open(cache_dir / IMAGES_FILE, 'wb') as images_file, ThreadPoolExecutor(num_threads) as executor:
+        # executor.map keeps the input order while decoding ahead of the writer
+        for loaded in executor.map(load, pairs):
+            if loaded is None:
+                continue
+            path, image, image_labels = loaded
+            image = np.ascontiguousarray(image, dtype=np.uint8)
+            images_file.write(image.data)
+            paths.append(path)
+            offsets.append(offset)
+            shapes.append(image.shape)
+            labels.append(image_labels)
+            label_counts.append(len(image_labels))
+            offset += image.nbytes
+
+    label_offsets = np.zeros(len(paths) + 1, dtype=np.int64)
+    np.cumsum(label_counts, out=label_offsets[1:])
+    np.savez(
+        cache_dir / INDEX_FILE,
+        offsets=np.array(offsets, dtype=np.int64),
+        shapes=np.array(shapes, dtype=np.int32).reshape(-1, 3),
+        labels=np.concatenate(labels) if labels else np.zeros((0, 5), dtype=np.float32),
+        label_offsets=label_offsets,
+        paths=np.array(paths),
+    )
+    (cache_dir / META_FILE).write_text(json.dumps(
+        {"target_size": target_size, "letterbox": letterbox, "count": len(paths), "color": "bgr"}, indent=1))
+    print(f"Packed {len(paths)} images ({offset / 1e6:.1f} MB) into {cache_dir}")
+    return len(paths)
+
+class TensorCache:
+    """
+    Read-only loader for a cache written by pack_images().
+
+    Images are returned as views into a memory-mapped file, so reading one costs a page
+    fault instead of a JPEG decode, and every process mapping the file shares the same
+    page cache. Views are read-only; copy them before modifying in place.
+
+    Args:
+        cache_dir (Path): Directory written by pack_images().
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        with np.load(self.cache_dir / INDEX_FILE) as index:
+            self.offsets = index["offsets"]
+            self.shapes = index["shapes"]
+            self.labels = index["labels"]
+            self.label_offsets = index["label_offsets"]
+            self.paths = [str(path) for path in index["paths"]]
+        self.meta = json.loads((self.cache_dir / META_FILE).read_text())
+        self._by_path = {path: i for i, path in enumerate(self.paths)}
+        self._data = None
+
+    @property
+    def data(self):
+        # Mapped lazily so the loader can be pickled into DataLoader worker processes
+        if self._data is None:
+            self._data = np.memmap(self.cache_dir / IMAGES_FILE, dtype=np.uint8, mode='r')
+        return self._data
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_data"] = None
+        return state
+
+    def __len__(self):
+        return len(self.paths)
+
+    def image(self, i):
+        """Return image i as a zero-copy (H, W, 3) BGR uint8 view."""
+        shape = self.shapes[i]
+        start = self.offsets[i]
+        return self.data[start:start + int(np.prod(shape))].reshape(shape)
+
+    def image_labels(self, i):
+        """Return the (N, 5) YOLO rows of image i (a view into the label array)."""
+        return self.labels[self.label_offsets[i]:self.label_offsets[i + 1]]
+
+    def __getitem__(self, i):
+        return self.image(i), self.image_labels(i)
+
+    def index_of(self, image_path):
+        """Return the cache index of a source image path, or None if it wasn't packed."""
+        return self._by_path.get(str(Path(image_path).resolve()))
+
+    def batches(self, batch_size):
+        """Yield (indices, list of image views) in cache order."""
+        for start in range(0, len(self), batch_size):
+            indices = list(range(start, min(start + batch_size, len(self))))
+            yield indices, [self.image(i) for i in indices]
+
+try:
+    from ultralytics.data import YOLODataset
+    from ultralytics.models.yolo.detect import DetectionTrainer
+except ImportError:  # packing and reading the cache don't need ultralytics
+    YOLODataset = DetectionTrainer = None
+
+if YOLODataset is not None:
+    class CachedYOLODataset(YOLODataset):
+        """YOLODataset that reads images from its tensor_cache attribute when they were packed."""
+
+        def load_image(self, i, rect_mode=True):
+            index = self.tensor_cache.index_of(self.im_files[i])
+            if index is None:
+                return super().load_image(i, rect_mode)
+            # ultralytics augments in place (e.g. RandomHSV), so hand out a private copy.
+            # Copying a 640x640 frame is still far cheaper than decoding the JPEG again.
+            image = np.array(self.tensor_cache.image(index))
+            return image, image.shape[:2], image.shape[:2]
+
+def attach_to_dataset(dataset, cache):
+    """
+    Make an ultralytics YOLODataset read images from a TensorCache instead of decoding JPEGs.
+
+    Images missing from the cache fall back to the dataset's own loader. Only caches built
+    without letterbox can be attached, because the dataset reads the original label files.
+    """
+    if cache.meta["letterbox"]:
+        raise ValueError("A letterboxed tensor cache can't back a training dataset: its labels differ from the label files")
+    dataset.__class__ = CachedYOLODataset
+    dataset.tensor_cache = cache
+    return dataset
+
+def split_cache_dir(cache_dir, split):
+    """
+    The cache of one split under cache_dir as packed by pack_splits(), or None if that
+    split wasn't packed. A val split falls back to the test cache, as dataset.yaml does.
+    """
+    cache_dir = Path(cache_dir)
+    for name in (split, "test") if split == "val" else (split,):
+        if (cache_dir / name / INDEX_FILE).exists():
+            return cache_dir / name
+    return None
+
+def cached_trainer(cache_dir):
+    """
+    Return a DetectionTrainer class whose datasets read from the tensor caches under cache_dir:
+    the train dataset from cache_dir/train, the val dataset from cache_dir/val (or cache_dir/test).
+    A dataset whose split wasn't packed decodes from disk as usual.
+    """
+
+    class CachedDetectionTrainer(DetectionTrainer):
+        def build_dataset(self, img_path, mode="train", batch=None):
+            dataset = super().build_dataset(img_path, mode, batch)
+            split_dir = split_cache_dir(cache_dir, mode)
+            return dataset if split_dir is None else attach_to_dataset(dataset, TensorCache(split_dir))
+
+    return CachedDetectionTrainer
+
+def pack_splits(split_dir, cache_dir, params, catalog=None):
+    """
+    Pack every split the split stage wrote (train, val, test) into cache_dir/<split>,
+    removing the cache of a split that no longer exists.
+
+    Args:
+        split_dir (Path): Output directory of the split stage.
+        cache_dir (Path): Directory to write the per-split caches to.
+        params (dict): Loaded params.yaml (split, preprocessing and tensor_cache sections).
+        catalog (Catalog): File catalog used in copy mode.
+    """
+    mode = params['split']['mode']
+    for split in ("train", "val", "test"):
+        if not split_source(split_dir, split, mode).exists():
+            shutil.rmtree(Path(cache_dir) / split, ignore_errors=True)
+            continue
+        pairs = split_pairs(split_dir, split, mode, catalog=catalog)
+        pack_images(pairs, Path(cache_dir) / split, target_size=params['preprocessing']['resize'],
+                    letterbox=params['tensor_cache']['letterbox'], reduced=params['preprocessing']['reduced_decode'])
+
+def main():
+    params = load_params()
+    catalog = Catalog(params['catalog']['path'])
+    split_dir = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/split_data")
+
+    # Pack every split once; training and evaluation then read the mapped file
+    pack_splits(split_dir, params['tensor_cache']['dir'], params, catalog=catalog)
+
+if __name__ == "__main__":
+    main()
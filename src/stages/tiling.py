@@ -0,0 +1,171 @@
+import time
+from pathlib import Path
+import numpy as np
+from data_load import load_params
+from catalog import Catalog
+from box_ops import batched_nms, weighted_boxes_fusion
+from inference import iter_predictions, latency_summary, list_images, load_backend, new_timings, resolve_model, split_source
+
+MERGE_METHODS = ("nms", "wbf")
+
+def tile_grid(width, height, tile_size=640, overlap=0.2):
+    """
+    Cover a frame with overlapping square tiles.
+
+    Uses the fewest tiles whose step is at most tile_size * (1 - overlap), spread evenly so
+    the first and last tiles touch the frame edges. Every tile is full size (unless the
+    frame itself is smaller than a tile) and neighbours overlap by at least overlap.
+
+    Returns:
+        np.ndarray: (K, 4) int [x_min, y_min, x_max, y_max] tile windows.
+    """
+    if not 0 <= overlap < 1:
+        raise ValueError(f"Tile overlap must be in [0, 1), got {overlap}")
+    stride = max(int(tile_size * (1 - overlap)), 1)
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        count = int(np.ceil((length - tile_size) / stride)) + 1
+        return np.round(np.linspace(0, length - tile_size, count)).astype(int).tolist()
+
+    xs, ys = starts(width), starts(height)
+    grid = np.array([[x, y, min(x + tile_size, width), min(y + tile_size, height)] for y in ys for x in xs])
+    return grid.reshape(-1, 4)
+
+class TiledBackend:
+    """
+    Wrap a backend so each frame is predicted as overlapping full-resolution tiles.
+
+    All tiles of every frame in a predict() call go to the wrapped backend as one batch.
+    Tile detections are shifted back to frame coordinates and merged across tiles with
+    class-aware NMS or weighted boxes fusion. Overlap is measured as intersection over the
+    smaller box by default, so a lump clipped at a tile edge merges with the complete
+    detection from the neighbouring tile.
+
+    Args:
+        backend: Inference backend (see inference.load_backend()), normally running at
+                 imgsz == tile_size so tiles are not downscaled.
+        tile_size (int): Tile width and height in frame pixels.
+        overlap (float): Fraction of a tile shared with its neighbour.
+        merge (str): "nms" or "wbf".
+        merge_iou (float): Overlap above which boxes are merged.
+        match_metric (str): "ios" (intersection over smaller) or "iou".
+        full_frame (bool): Also predict the whole (downscaled) frame, which catches lumps
+                           larger than a tile.
+    """
+
+    def __init__(self, backend, tile_size=640, overlap=0.2, merge="nms", merge_iou=0.5, match_metric="ios",
+                 full_frame=True):
+        if merge not in MERGE_METHODS:
+            raise ValueError(f"Unknown merge method {merge!r}. Expected one of {MERGE_METHODS}")
+        self.backend = backend
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.merge = merge
+        self.merge_iou = merge_iou
+        self.match_metric = match_metric
+        self.full_frame = full_frame
+        self.name = f"{getattr(backend, 'name', 'backend')}_tiled"
+        self.names = getattr(backend, "names", None)
+        self.tile_count = 0
+
+    def predict(self, images):
+        """Same contract as the wrapped backend: per image, (N, 6) detections in frame pixels."""
+        crops, owners, offsets = [], [], []
+        for i, image in enumerate(images):
+            height, width = image.shape[:2]
+            grid = tile_grid(width, height, self.tile_size, self.overlap)
+            for x_min, y_min, x_max, y_max in grid:
+                crops.append(image[y_min:y_max, x_min:x_max])
+                offsets.append((x_min, y_min))
+            owners.extend([i] * len(grid))
+            if self.full_frame and len(grid) > 1:
+                crops.append(image)
+                owners.append(i)
+                offsets.append((0, 0))
+
+        self.tile_count += len(crops)
+        tile_detections = self.backend.predict(crops)
+
+        owners = np.array(owners)
+        shifts = np.array([[x, y, x, y, 0, 0] for x, y in offsets], dtype=np.float32)
+        counts = [len(detections) for detections in tile_detections]
+        detections = np.concatenate([np.asarray(d, dtype=np.float32).reshape(-1, 6) for d in tile_detections])
+        detections += np.repeat(shifts, counts, axis=0)
+        detection_owners = np.repeat(owners, counts)
+        return [self._merge(detections[detection_owners == i]) for i in range(len(images))]
+
+    def _merge(self, detections):
+        if len(detections) < 2:
+            return detections
+        if self.merge == "wbf":
+            return weighted_boxes_fusion(detections[:, :4], detections[:, 4], detections[:, 5], self.merge_iou,
+                                         self.match_metric)
+        keep = batched_nms(detections[:, :4], detections[:, 4], detections[:, 5], self.merge_iou, self.match_metric)
+        return detections[keep]
+
+def benchmark_tiling(backend, image_paths, configs, batch_size=4, prefetch_threads=4, **options):
+    """
+    Measure throughput of several tile configurations on the same images.
+
+    Args:
+        backend: Inference backend to wrap.
+        image_paths (list of Path): Frames to run on.
+        configs (list of tuple): (tile_size, overlap) pairs. tile_size None runs the
+                                 backend on whole frames for reference.
+        batch_size (int): Frames per predict() call.
+        **options: Other TiledBackend options (merge, merge_iou, match_metric, full_frame).
+
+    Returns:
+        list of dict: Per config, frames/sec, tiles/sec, tiles per frame, detections per
+                      frame and per-frame inference latency.
+    """
+    results = []
+    for tile_size, overlap in configs:
+        tiled = TiledBackend(backend, tile_size, overlap, **options) if tile_size else backend
+        timings = new_timings()
+        frames = detections = 0
+        started = time.perf_counter()
+        for _, _, frame_detections in iter_predictions(tiled, image_paths, batch_size, prefetch_threads, timings=timings):
+            frames += 1
+            detections += len(frame_detections)
+        elapsed = time.perf_counter() - started
+
+        tiles = tiled.tile_count if tile_size else frames
+        result = {
+            "tile_size": tile_size,
+            "overlap": overlap,
+            "frames_per_sec": frames / elapsed if elapsed > 0 else 0.0,
+            "tiles_per_sec": tiles / elapsed if elapsed > 0 else 0.0,
+            "tiles_per_frame": tiles / frames if frames else 0.0,
+            "detections_per_frame": detections / frames if frames else 0.0,
+            "latency": latency_summary(timings["infer_image"]),
+        }
+        results.append(result)
+        print(f"tile {str(tile_size or 'full'):>5} overlap {overlap:.2f}: {result['frames_per_sec']:.2f} frames/s, "
+              f"{result['tiles_per_frame']:.1f} tiles/frame, {result['detections_per_frame']:.1f} detections/frame, "
+              f"p50 {result['latency']['p50_ms']:.0f} ms/frame")
+    return results
+
+def main():
+    params = load_params()
+    tiling = params['tiling']
+    inference = params['inference']
+
+    model_path = resolve_model(params)
+    split_dir = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/split_data")
+
+    image_paths = list_images(split_source(split_dir, "test", params['split']['mode']),
+                              catalog=Catalog(params['catalog']['path']))
+    configs = [tuple(config) for config in tiling['benchmark']]
+    for tile_size in sorted({size for size, _ in configs}, key=lambda size: size or 0):
+        # The model runs at the tile size, so tiles reach it at full resolution
+        backend = load_backend(inference['backend'], model_path, imgsz=tile_size or 640, conf=inference['conf'],
+                               device=inference['device'])
+        benchmark_tiling(backend, image_paths, [config for config in configs if config[0] == tile_size],
+                         batch_size=tiling['batch_size'], merge=tiling['merge'], merge_iou=tiling['merge_iou'],
+                         match_metric=tiling['match_metric'], full_frame=tiling['full_frame'])
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
+from pathlib import Path
 from ultralytics import YOLO
+from data_load import load_params
+from tensor_cache import cached_trainer
+from online_augment import online_augment_trainer
 
-def train_yolov8n(data_yaml, epochs=100, imgsz=640, batch=32, name="yolov8n_train"):
+def train_yolov8n(data_yaml, epochs=100, imgsz=640, batch=32, name="yolov8n_train", tensor_cache=None,
+                  model_path="D:/Users/eniang.eniang/Desktop/coal_size-detector/yolo11n.pt", device=0, project=None,
+                  exist_ok=False, online_augment=False, augment_seed=0):
     """
     Train a YOLOv8n model using the specified dataset.
 
@@ -10,9 +16,25 @@ def train_yolov8n(data_yaml, epochs=100, imgsz=640, batch=32, name="yolov8n_trai
         imgsz (int): Image size for training. Default is 640.
         batch (int): Batch size. Default is 16.
         name (str): Name of the training run. Default is "yolov8n_train".
+        tensor_cache (str): Directory written by tensor_cache.pack_splits(). When set, training
+                            and val images are served from the memory-mapped per-split caches
+                            instead of decoded from JPEG every epoch.
+        model_path (str): Pretrained weights to start from.
+        device: Training device, e.g. 0 for the first GPU or "cpu".
+        project (str): Directory the run is saved under. Default is ultralytics' runs/detect.
+        exist_ok (bool): Reuse project/name instead of creating name2, name3, ... so the
+                         weights always land in the same place.
+        online_augment (bool): Apply the augment_data branches on the fly in the training
+                               data loader instead of training on materialized copies.
+        augment_seed (int): Seed of the online augmentation.
     """
     # Load the YOLOv8n model
-    model = YOLO("D:/Users/eniang.eniang/Desktop/coal_size-detector/yolo11n.pt")  # Load a pretrained YOLOv8n model
+    model = YOLO(model_path)  # Load a pretrained YOLOv8n model
+
+    # Optional trainer swaps: memory-mapped images and/or on-the-fly augmentation
+    trainer = cached_trainer(tensor_cache) if tensor_cache else None
+    if online_augment:
+        trainer = online_augment_trainer(trainer, seed=augment_seed)
 
     # Train the model
     results = model.train(
@@ -21,7 +43,10 @@ def train_yolov8n(data_yaml, epochs=100, imgsz=640, batch=32, name="yolov8n_trai
         imgsz=imgsz,     # Image size
         batch=batch,     # Batch size
         name=name,       # Name of the training run
-        device=0
+        device=device,
+        project=project,
+        exist_ok=exist_ok,
+        trainer=trainer
     )
 
     # Print training results
@@ -33,7 +58,13 @@ def main():
     data_yaml = "D:/Users/eniang.eniang/Desktop/coal_size-detector/dataset.yaml"
 
     # Train the YOLOv8n model
-    train_yolov8n(data_yaml, epochs=100, imgsz=640, batch=64, name="yolov8n_coal_detector")
+    params = load_params()
+    train = params['train']
+    cache_dir = params['tensor_cache']['dir']
+    tensor_cache = cache_dir if params['tensor_cache']['enabled'] and Path(cache_dir).exists() else None
+    train_yolov8n(data_yaml, epochs=train['epochs'], imgsz=train['imgsz'], batch=train['batch'], name=train['name'],
+                  tensor_cache=tensor_cache, model_path=train['model'], device=train['device'], online_augment=train['online_augment'],
+                  augment_seed=params['augmentation']['seed'])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
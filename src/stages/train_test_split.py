@@ -1,23 +1,35 @@
-import shutil
 from pathlib import Path
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import GroupKFold, GroupShuffleSplit, KFold, train_test_split
 import os
+import numpy as np
+import yaml
+from data_load import load_params
+from catalog import IMAGE_SUFFIXES, Catalog
+from transfer import transfer_files
+from shards import write_shards
+from dedup import dedup_sources
 
-def consolidate_data(source_dirs, consolidated_dir):
+def consolidate_data(source_dirs, consolidated_dir, mode="copy", catalog=None, workers=8):
     """
     Consolidate data from multiple directories into a single directory.
 
     Args:
         source_dirs (list of tuples): List of (source_image_dir, source_label_dir, destination_subdir) tuples.
         consolidated_dir (Path): Path to the consolidated directory.
+        mode (str): How files are materialized: "hardlink", "reflink", "symlink" or "copy".
+        catalog (Catalog): Dataset catalog to list files from. Default scans into a new in-memory catalog.
+        workers (int): Number of concurrent file transfers.
     """
+    catalog = catalog or Catalog()
+
     # Create consolidated directories
     consolidated_images_dir = consolidated_dir / "images"
     consolidated_labels_dir = consolidated_dir / "labels"
     consolidated_images_dir.mkdir(parents=True, exist_ok=True)
     consolidated_labels_dir.mkdir(parents=True, exist_ok=True)
 
-    # Copy data from source directories to consolidated directory
+    # Materialize data from source directories to consolidated directory
+    jobs = []
     for source_image_dir, source_label_dir, destination_subdir in source_dirs:
         # Create subdirectories for images and labels
         dest_image_dir = consolidated_images_dir / destination_subdir
@@ -25,17 +37,44 @@ def consolidate_data(source_dirs, consolidated_dir):
         dest_image_dir.mkdir(parents=True, exist_ok=True)
         dest_label_dir.mkdir(parents=True, exist_ok=True)
 
-        # Copy images
-        for image_path in source_image_dir.glob("*.jpg"):
-            shutil.copy(image_path, dest_image_dir / image_path.name)
+        # Images
+        for image_path in catalog.files(source_image_dir, IMAGE_SUFFIXES):
+            jobs.append((image_path, dest_image_dir / image_path.name))
+
+        # Labels
+        for label_path in catalog.files(source_label_dir, (".txt",)):
+            jobs.append((label_path, dest_label_dir / label_path.name))
 
-        # Copy labels
-        for label_path in source_label_dir.glob("*.txt"):
-            shutil.copy(label_path, dest_label_dir / label_path.name)
+    transfer_files(jobs, mode=mode, max_workers=workers, label="Consolidating")
 
+    catalog.invalidate(consolidated_dir)
     print("Data consolidation completed!")
 
-def split_data(consolidated_dir, output_dir, test_size=0.2, random_state=42):
+def consolidate_to_shards(source_dirs, shard_dir, shard_size_mb=256, catalog=None):
+    """
+    Consolidate data from multiple directories into tar shards instead of a file tree.
+
+    Args:
+        source_dirs (list of tuples): List of (source_image_dir, source_label_dir, destination_subdir) tuples.
+        shard_dir (Path): Directory to write the shards and their index to.
+        shard_size_mb (float): Target size of each shard in megabytes.
+        catalog (Catalog): Dataset catalog to list files from. Default scans into a new in-memory catalog.
+
+    Returns:
+        Path: Path to the shard index.
+    """
+    catalog = catalog or Catalog()
+
+    pairs, keys = [], []
+    for source_image_dir, source_label_dir, destination_subdir in source_dirs:
+        for image_path, label_path in catalog.pairs(source_image_dir, source_label_dir, image_suffixes=IMAGE_SUFFIXES):
+            pairs.append((image_path, label_path))
+            keys.append(f"{destination_subdir}/{image_path.stem}")
+
+    return write_shards(pairs, shard_dir, shard_size_mb=shard_size_mb, keys=keys)
+
+def split_data(consolidated_dir, output_dir, test_size=0.2, random_state=42, mode="copy", catalog=None,
+               workers=8, duplicates=None):
     """
     Split the consolidated data into train and test sets.
 
@@ -44,6 +83,12 @@ def split_data(consolidated_dir, output_dir, test_size=0.2, random_state=42):
         output_dir (Path): Path to save the train and test sets.
         test_size (float): Proportion of the dataset to include in the test split.
         random_state (int): Random seed for reproducibility.
+        mode (str): How files are materialized: "hardlink", "reflink", "symlink" or "copy".
+        catalog (Catalog): Dataset catalog to list files from. Default scans into a new in-memory catalog.
+        workers (int): Number of concurrent file transfers.
+        duplicates (DuplicateGroups): Near-duplicate groups from dedup.py. Each group lands on
+                                      one side of the split, and only representatives are kept
+                                      when it collapses.
     """
     # Create output directories
     train_images_dir = output_dir / "images" / "train"
@@ -55,31 +100,200 @@ def split_data(consolidated_dir, output_dir, test_size=0.2, random_state=42):
     test_images_dir.mkdir(parents=True, exist_ok=True)
     test_labels_dir.mkdir(parents=True, exist_ok=True)
 
-    # Get all image and label files
-    image_files = sorted((consolidated_dir / "images").rglob("*.jpg"))
-    label_files = sorted((consolidated_dir / "labels").rglob("*.txt"))
-
-    # Ensure the number of images and labels match
-    if len(image_files) != len(label_files):
-        raise ValueError(f"Mismatch between number of images ({len(image_files)}) and labels ({len(label_files)})")
+    # Get all image and label files, paired by name
+    catalog = catalog or Catalog()
+    pairs = _paired_files(consolidated_dir, catalog, duplicates)
+    image_files, label_files = [p[0] for p in pairs], [p[1] for p in pairs]
 
     # Split the data into train and test sets
-    train_images, test_images, train_labels, test_labels = train_test_split(
-        image_files, label_files, test_size=test_size, random_state=random_state
-    )
+    train_idx, test_idx = _split_indices(image_files, test_size, random_state, duplicates)
+    train_images, test_images = [image_files[i] for i in train_idx], [image_files[i] for i in test_idx]
+    train_labels, test_labels = [label_files[i] for i in train_idx], [label_files[i] for i in test_idx]
+
+    jobs = []
 
-    # Copy train data
+    # Train data
     for image_path, label_path in zip(train_images, train_labels):
-        shutil.copy(image_path, train_images_dir / image_path.name)
-        shutil.copy(label_path, train_labels_dir / label_path.name)
+        jobs.append((image_path, train_images_dir / image_path.name))
+        jobs.append((label_path, train_labels_dir / label_path.name))
 
-    # Copy test data
+    # Test data
     for image_path, label_path in zip(test_images, test_labels):
-        shutil.copy(image_path, test_images_dir / image_path.name)
-        shutil.copy(label_path, test_labels_dir / label_path.name)
+        jobs.append((image_path, test_images_dir / image_path.name))
+        jobs.append((label_path, test_labels_dir / label_path.name))
 
+    transfer_files(jobs, mode=mode, max_workers=workers, label="Splitting")
+
+    catalog.invalidate(output_dir)
     print("Data splitting completed!")
 
+def _write_manifest(manifest_path, image_files):
+    """
+    Write one absolute image path per line (the list-file form YOLO accepts).
+
+    Paths are made absolute without resolving symlinks: YOLO finds each label by swapping
+    /images/ for /labels/, so symlinked files must be listed at their consolidated path.
+    """
+    manifest_path.write_text("".join(f"{Path(image_path).absolute().as_posix()}\n" for image_path in image_files))
+
+def _write_dataset_yaml(yaml_path, splits, names):
+    """Write a YOLO dataset.yaml whose splits point at manifest files."""
+    dataset = {split: manifest_path.absolute().as_posix() for split, manifest_path in splits.items()}
+    dataset["nc"] = len(names)
+    dataset["names"] = dict(names)
+    with open(yaml_path, 'w') as file:
+        yaml.safe_dump(dataset, file, sort_keys=False)
+
+def _paired_files(consolidated_dir, catalog=None, duplicates=None):
+    """Return the consolidated (image, label) pairs, checking every image has a label."""
+    catalog = catalog or Catalog()
+    pairs = catalog.pairs(consolidated_dir / "images", consolidated_dir / "labels", recursive=True,
+                          image_suffixes=IMAGE_SUFFIXES)
+    return duplicates.kept(pairs) if duplicates is not None else pairs
+
+def _split_indices(image_files, test_size, random_state, duplicates=None):
+    """
+    Return (train indices, test indices).
+
+    Without duplicate groups this is train_test_split() over the files. With them, whole
+    groups are assigned (GroupShuffleSplit), so test_size is the share of groups rather
+    than of images.
+    """
+    indices = np.arange(len(image_files))
+    if duplicates is None:
+        return train_test_split(indices, test_size=test_size, random_state=random_state)
+    splitter = GroupShuffleSplit(n_splits=1, test_size=test_size, random_state=random_state)
+    return next(splitter.split(indices, groups=duplicates.group_ids(image_files)))
+
+def write_split_manifests(consolidated_dir, output_dir, test_size=0.2, val_size=0.0, random_state=42, names=None,
+                          catalog=None, duplicates=None):
+    """
+    Split the consolidated data by writing manifest files instead of copying images.
+
+    YOLO finds each label by swapping "images" for "labels" in the image path, which
+    matches the consolidated layout, so nothing has to be copied.
+
+    Args:
+        consolidated_dir (Path): Path to the consolidated directory.
+        output_dir (Path): Directory for train.txt/val.txt/test.txt and dataset.yaml.
+        test_size (float): Proportion of the dataset to include in the test split.
+        val_size (float): Proportion of the dataset to include in a separate val split.
+                          With 0 the test split doubles as the val split.
+        random_state (int): Random seed for reproducibility.
+        names (dict): Class id -> class name. Default is {0: 'large'}.
+        catalog (Catalog): Dataset catalog to list files from. Default scans into a new in-memory catalog.
+        duplicates (DuplicateGroups): Near-duplicate groups; see split_data().
+
+    Returns:
+        Path: Path to the generated dataset.yaml.
+    """
+    names = names or {0: 'large'}
+    output_dir.mkdir(parents=True, exist_ok=True)
+    image_files = [image_path for image_path, _ in _paired_files(consolidated_dir, catalog, duplicates)]
+
+    train_idx, test_idx = _split_indices(image_files, test_size, random_state, duplicates)
+    train_images, test_images = [image_files[i] for i in train_idx], [image_files[i] for i in test_idx]
+    splits = {"train": output_dir / "train.txt"}
+    if val_size:
+        # val_size is relative to the whole dataset, so rescale it to what is left after the test split
+        train_idx, val_idx = _split_indices(train_images, val_size / (1 - test_size), random_state, duplicates)
+        train_images, val_images = [train_images[i] for i in train_idx], [train_images[i] for i in val_idx]
+        splits["val"] = output_dir / "val.txt"
+        _write_manifest(splits["val"], val_images)
+    else:
+        splits["val"] = output_dir / "test.txt"
+    splits["test"] = output_dir / "test.txt"
+    _write_manifest(splits["train"], train_images)
+    _write_manifest(splits["test"], test_images)
+
+    dataset_yaml = output_dir / "dataset.yaml"
+    _write_dataset_yaml(dataset_yaml, splits, names)
+    print(f"Split manifests written to {output_dir}: {len(train_images)} train, {len(test_images)} test")
+    return dataset_yaml
+
+def write_kfold_manifests(consolidated_dir, output_dir, n_folds=5, random_state=42, names=None, catalog=None,
+                          duplicates=None):
+    """
+    Write k-fold cross-validation manifests, one fold_<k> directory per fold.
+
+    Args:
+        consolidated_dir (Path): Path to the consolidated directory.
+        output_dir (Path): Directory to create the fold directories in.
+        n_folds (int): Number of folds.
+        random_state (int): Random seed for reproducibility.
+        names (dict): Class id -> class name. Default is {0: 'large'}.
+        catalog (Catalog): Dataset catalog to list files from. Default scans into a new in-memory catalog.
+        duplicates (DuplicateGroups): Near-duplicate groups; each group stays within one fold.
+
+    Returns:
+        list: Paths to the dataset.yaml of every fold.
+    """
+    names = names or {0: 'large'}
+    image_files = [image_path for image_path, _ in _paired_files(consolidated_dir, catalog, duplicates)]
+
+    dataset_yamls = []
+    if duplicates is None:
+        folds = KFold(n_splits=n_folds, shuffle=True, random_state=random_state).split(image_files)
+    else:
+        # GroupKFold only takes shuffle from scikit-learn 1.6 on; renumbering the groups at random
+        # shuffles which of the equally sized groups land in which fold on any version
+        _, groups = np.unique(duplicates.group_ids(image_files), return_inverse=True)
+        groups = np.random.RandomState(random_state).permutation(groups.max() + 1)[groups]
+        folds = GroupKFold(n_splits=n_folds).split(image_files, groups=groups)
+    for fold, (train_idx, val_idx) in enumerate(folds):
+        fold_dir = output_dir / f"fold_{fold}"
+        fold_dir.mkdir(parents=True, exist_ok=True)
+        splits = {"train": fold_dir / "train.txt", "val": fold_dir / "val.txt"}
+        _write_manifest(splits["train"], [image_files[i] for i in train_idx])
+        _write_manifest(splits["val"], [image_files[i] for i in val_idx])
+        _write_dataset_yaml(fold_dir / "dataset.yaml", splits, names)
+        dataset_yamls.append(fold_dir / "dataset.yaml")
+
+    print(f"{n_folds}-fold manifests written to {output_dir}")
+    return dataset_yamls
+
+def consolidate_and_split(source_dirs, consolidated_dir, output_dir, params, catalog=None):
+    """
+    Consolidate the source folders and split them as configured in params.yaml.
+
+    Args:
+        source_dirs (list of tuples): (source_image_dir, source_label_dir, destination_subdir) tuples.
+        consolidated_dir (Path): Path to the consolidated directory.
+        output_dir (Path): Directory for the split (manifests or a split_data tree).
+        params (dict): Parameters from params.yaml. Uses the storage, split, shards and dedup sections.
+        catalog (Catalog): Dataset catalog to list files from. Default scans into a new in-memory catalog.
+    """
+    # Files are linked rather than copied when the filesystem allows it
+    mode = params['storage']['materialize']
+    workers = params['storage']['transfer_workers']
+    split_params = params['split']
+    catalog = catalog or Catalog()
+
+    # Consolidate data
+    consolidate_data(source_dirs, consolidated_dir, mode=mode, catalog=catalog, workers=workers)
+    if params['shards']['enabled']:
+        consolidate_to_shards(source_dirs, Path(params['shards']['dir']),
+                              shard_size_mb=params['shards']['shard_size_mb'], catalog=catalog)
+
+    # Group near-duplicate frames so each group stays on one side of the split
+    duplicates = None
+    if params['dedup']['enabled']:
+        duplicates = dedup_sources(source_dirs, params['dedup'], catalog=catalog)
+        duplicates.save(params['dedup']['report'])
+
+    # Split data into train and test sets
+    if split_params['mode'] == "manifest":
+        write_split_manifests(consolidated_dir, output_dir, test_size=split_params['test_size'],
+                              val_size=split_params['val_size'], random_state=split_params['random_state'], catalog=catalog,
+                              duplicates=duplicates)
+        if split_params['n_folds']:
+            write_kfold_manifests(consolidated_dir, output_dir, n_folds=split_params['n_folds'],
+                                  random_state=split_params['random_state'], catalog=catalog, duplicates=duplicates)
+    else:
+        split_data(consolidated_dir, output_dir, test_size=split_params['test_size'],
+                   random_state=split_params['random_state'], mode=mode, catalog=catalog,
+                   workers=workers, duplicates=duplicates)
+
 def main():
     # Define source directories
     source_dirs = [
@@ -93,11 +307,8 @@ def main():
     consolidated_dir = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/consolidated_data")
     output_dir = Path("D:/Users/eniang.eniang/Desktop/coal_size-detector/data/split_data")
 
-    # Consolidate data
-    consolidate_data(source_dirs, consolidated_dir)
-
-    # Split data into train and test sets
-    split_data(consolidated_dir, output_dir, test_size=0.2, random_state=42)
+    params = load_params()
+    consolidate_and_split(source_dirs, consolidated_dir, output_dir, params, catalog=Catalog(params['catalog']['path']))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
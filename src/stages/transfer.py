@@ -0,0 +1,114 @@
+import errno
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from materialize import materialize
+
+class TransferStats:
+    """Counters collected by transfer_files()."""
+
+    def __init__(self, total):
+        self.total = total
+        self.files = 0
+        self.bytes = 0
+        self.retries = 0
+        self.failures = []  # (src, dst, exception)
+        self.modes = {}
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def throughput(self):
+        """Return (files/s, MB/s) so far."""
+        elapsed = self.elapsed or (time.perf_counter() - self.started)
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return self.files / elapsed, self.bytes / elapsed / 1e6
+
+    def summary(self, label):
+        files_per_sec, mb_per_sec = self.throughput()
+        return (f"{label}: {self.files}/{self.total} files, {self.bytes / 1e6:.1f} MB "
+                f"({files_per_sec:.0f} files/s, {mb_per_sec:.1f} MB/s), {len(self.failures)} failed, "
+                f"{self.retries} retries, modes {self.modes}")
+
+def _transfer_one(src, dst, mode, retries, retry_delay, stats, lock):
+    for attempt in range(retries + 1):
+        try:
+            used = materialize(src, dst, mode)
+            break
+        except FileNotFoundError:
+            raise
+        except OSError as e:
+            # Transient network-share errors are worth retrying, a bad mode or missing source is not
+            if attempt == retries or e.errno == errno.ENOENT:
+                raise
+            with lock:
+                stats.retries += 1
+            time.sleep(retry_delay * 2 ** attempt)
+    return used, os.stat(src).st_size
+
+def transfer_files(jobs, mode="copy", max_workers=8, retries=3, retry_delay=0.5,
+                   progress_interval=5.0, label="Transfer", strict=True):
+    """
+    Materialize many (src, dst) pairs with a bounded thread pool.
+
+    File I/O releases the GIL, so threads overlap the per-file latency of slow disks and
+    network shares. At most 2 * max_workers files are in flight, so huge job lists don't
+    pile up futures. Each file is retried with exponential backoff on OSError.
+
+    Args:
+        jobs (iterable): (src, dst) pairs. dst may be an existing directory.
+        mode (str): How files are materialized: "hardlink", "reflink", "symlink" or "copy".
+        max_workers (int): Number of transfer threads.
+        retries (int): Extra attempts per file after the first failure.
+        retry_delay (float): Delay in seconds before the first retry, doubled each time.
+        progress_interval (float): Seconds between progress lines. None disables them.
+        label (str): Name shown in progress lines.
+        strict (bool): Re-raise the first failure after every other job has finished.
+
+    Returns:
+        TransferStats: Counts, bytes, throughput and failures of the run.
+    """
+    jobs = list(jobs)
+    stats = TransferStats(len(jobs))
+    lock = threading.Lock()
+    last_report = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        job_iter = iter(jobs)
+        while True:
+            while len(pending) < 2 * max_workers:
+                job = next(job_iter, None)
+                if job is None:
+                    break
+                src, dst = job
+                future = executor.submit(_transfer_one, src, dst, mode, retries, retry_delay, stats, lock)
+                pending[future] = job
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                src, dst = pending.pop(future)
+                try:
+                    used, size = future.result()
+                except Exception as e:
+                    stats.failures.append((src, dst, e))
+                    continue
+                stats.files += 1
+                stats.bytes += size
+                stats.modes[used] = stats.modes.get(used, 0) + 1
+
+            now = time.perf_counter()
+            if progress_interval is not None and now - last_report >= progress_interval:
+                print(stats.summary(label))
+                last_report = now
+
+    stats.elapsed = time.perf_counter() - stats.started
+    if progress_interval is not None:
+        print(stats.summary(label))
+    if strict and stats.failures:
+        src, dst, error = stats.failures[0]
+        raise OSError(f"{len(stats.failures)} of {stats.total} transfers failed, first: {src} -> {dst}") from error
+    return stats
@@ -0,0 +1,180 @@
+import numpy as np
+from pathlib import Path
+
+# One YOLO label row: class_id x_center y_center width height
+YOLO_ROW_FORMAT = "%d %.6f %.6f %.6f %.6f\n"
+
+def parse_yolo_text(text, source="<text>"):
+    """
+    Parse the contents of a YOLO label file into an (N, 5) float32 array.
+
+    Args:
+        text (str): Label file contents.
+        source (str): Name used in error messages.
+
+    Returns:
+        np.ndarray: Rows of [class_id, x_center, y_center, width, height] (normalized).
+    """
+    tokens = text.split()
+    if len(tokens) % 5:
+        raise ValueError(f"Malformed YOLO label in {source}: {len(tokens)} values is not a multiple of 5")
+    return np.array(tokens, dtype=np.float32).reshape(-1, 5)
+
+def load_yolo_labels(label_path):
+    """
+    Read a YOLO label file into an (N, 5) float32 array.
+    """
+    label_path = Path(label_path)
+    if not label_path.exists():
+        raise FileNotFoundError(f"Label file not found at {label_path}. Check the file path.")
+    return parse_yolo_text(label_path.read_text(), source=label_path)
+
+def load_yolo_label_files(label_paths, columns=5, missing_ok=False):
+    """
+    Read many YOLO label files into one contiguous array.
+
+    All files are tokenized into a single list and converted with one NumPy call.
+
+    Args:
+        label_paths (list of Path): Label files to read.
+        columns (int): Values per row, 5 for labels or 6 for prediction files.
+        missing_ok (bool): Treat missing files as empty instead of raising.
+
+    Returns:
+        tuple: (labels, offsets) where labels is an (M, columns) float32 array holding every
+               box and the boxes of label_paths[i] are labels[offsets[i]:offsets[i + 1]].
+    """
+    tokens = []
+    counts = np.zeros(len(label_paths), dtype=np.int64)
+    for i, label_path in enumerate(label_paths):
+        label_path = Path(label_path)
+        if missing_ok and not label_path.exists():
+            continue
+        file_tokens = label_path.read_text().split()
+        if len(file_tokens) % columns:
+            raise ValueError(f"Malformed YOLO label in {label_path}: {len(file_tokens)} values is not a multiple of {columns}")
+        counts[i] = len(file_tokens) // columns
+        tokens.extend(file_tokens)
+
+    offsets = np.zeros(len(label_paths) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    labels = np.array(tokens, dtype=np.float32).reshape(-1, columns)
+    return labels, offsets
+
+def load_yolo_label_dir(label_dir, pattern="*.txt"):
+    """
+    Read every label file in a directory.
+
+    Returns:
+        tuple: (stems, labels, offsets) as in load_yolo_label_files(), with stems[i]
+               naming the file the i-th slice came from.
+    """
+    label_paths = sorted(Path(label_dir).glob(pattern))
+    labels, offsets = load_yolo_label_files(label_paths)
+    return [path.stem for path in label_paths], labels, offsets
+
+def yolo_to_pascal_voc(labels, image_width, image_height):
+    """
+    Convert YOLO rows to pascal_voc boxes (Albumentations format).
+
+    YOLO format: [class_id, x_center, y_center, width, height] (normalized)
+    pascal_voc format: [x_min, y_min, x_max, y_max] (pixels)
+
+    Returns:
+        tuple: (boxes (N, 4) float32, class_ids (N,) float32)
+    """
+    labels = np.asarray(labels, dtype=np.float32).reshape(-1, 5)
+    scale = np.array([image_width, image_height], dtype=np.float32)
+    centers = labels[:, 1:3] * scale
+    half_sizes = labels[:, 3:5] * scale / 2
+    boxes = np.concatenate([centers - half_sizes, centers + half_sizes], axis=1)
+    return boxes, labels[:, 0].copy()
+
+def pascal_voc_to_yolo(boxes, class_ids, image_width, image_height):
+    """
+    Convert pascal_voc boxes back to YOLO rows.
+
+    Returns:
+        np.ndarray: (N, 5) float32 array of [class_id, x_center, y_center, width, height].
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scale = np.array([image_width, image_height], dtype=np.float32)
+    labels = np.empty((len(boxes), 5), dtype=np.float32)
+    labels[:, 0] = np.asarray(class_ids, dtype=np.float32).reshape(-1)
+    labels[:, 1:3] = (boxes[:, :2] + boxes[:, 2:]) / 2 / scale
+    labels[:, 3:5] = (boxes[:, 2:] - boxes[:, :2]) / scale
+    return labels
+
+def yolo_to_pixels(labels, image_width, image_height):
+    """
+    Scale normalized YOLO rows to pixel [class_id, x_center, y_center, width, height].
+    """
+    labels = np.asarray(labels, dtype=np.float32).reshape(-1, 5)
+    scale = np.array([1, image_width, image_height, image_width, image_height], dtype=np.float32)
+    return labels * scale
+
+def pixels_to_yolo(labels, image_width, image_height):
+    """
+    Normalize pixel [class_id, x_center, y_center, width, height] rows to YOLO rows.
+    """
+    labels = np.asarray(labels, dtype=np.float32).reshape(-1, 5)
+    scale = np.array([1, image_width, image_height, image_width, image_height], dtype=np.float32)
+    return labels / scale
+
+def format_yolo_labels(labels):
+    """
+    Serialize YOLO rows to label file text with a single formatting call.
+    """
+    labels = np.asarray(labels, dtype=np.float32).reshape(-1, 5)
+    return (YOLO_ROW_FORMAT * len(labels)) % tuple(labels.ravel().tolist())
+
+def save_yolo_labels(label_path, labels):
+    """
+    Write YOLO rows to a label file.
+    """
+    with open(label_path, 'w') as file:
+        file.write(format_yolo_labels(labels))
+
+def save_yolo_label_files(label_paths, labels, offsets):
+    """
+    Write a contiguous label array (as returned by load_yolo_label_files) back to files.
+    """
+    encoded = format_yolo_labels(labels).encode()
+
+    # Every row is exactly one line, so cut the text on line boundaries
+    line_ends = np.flatnonzero(np.frombuffer(encoded, dtype=np.uint8) == ord("\n")) + 1
+    line_starts = np.concatenate([[0], line_ends])
+    for i, label_path in enumerate(label_paths):
+        start, end = line_starts[offsets[i]], line_starts[offsets[i + 1]]
+        Path(label_path).write_bytes(encoded[start:end])
+
+# One prediction row: class_id x_center y_center width height confidence
+YOLO_PREDICTION_FORMAT = "%d %.6f %.6f %.6f %.6f %.5f\n"
+
+def pixel_xyxy_to_yolo_predictions(detections, image_width, image_height):
+    """
+    Convert (N, 6) [x_min, y_min, x_max, y_max, confidence, class_id] pixel detections to
+    (N, 6) normalized [class_id, x_center, y_center, width, height, confidence] rows.
+    """
+    detections = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+    rows = np.empty_like(detections)
+    rows[:, 0] = detections[:, 5]
+    rows[:, 1:5] = pascal_voc_to_yolo(detections[:, :4], detections[:, 5], image_width, image_height)[:, 1:]
+    rows[:, 5] = detections[:, 4]
+    return rows
+
+def save_yolo_predictions(label_path, rows):
+    """Write (N, 6) prediction rows (YOLO label format plus a confidence column)."""
+    rows = np.asarray(rows, dtype=np.float32).reshape(-1, 6)
+    with open(label_path, 'w') as file:
+        file.write((YOLO_PREDICTION_FORMAT * len(rows)) % tuple(rows.ravel().tolist()))
+
+def load_yolo_predictions(label_path):
+    """Read a prediction file into an (N, 6) float32 array (missing file = no detections)."""
+    label_path = Path(label_path)
+    if not label_path.exists():
+        return np.zeros((0, 6), dtype=np.float32)
+    tokens = label_path.read_text().split()
+    if len(tokens) % 6:
+        raise ValueError(f"Malformed prediction file {label_path}: {len(tokens)} values is not a multiple of 6")
+    return np.array(tokens, dtype=np.float32).reshape(-1, 6)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The stage modules import each other by bare name, as when run from src/stages
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "stages"))
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+from dedup import pairs_brute_force, pairs_multi_index
+
+@pytest.mark.parametrize("max_distance", [0, 3, 6, 10])
+def test_multi_index_matches_brute_force(max_distance):
+    rng = np.random.default_rng(0)
+    # Random hashes plus near copies with a few flipped bits, so there are pairs on both sides of max_distance
+    bases = rng.integers(0, np.iinfo(np.uint64).max, size=200, dtype=np.uint64, endpoint=True)
+    flips = [np.bitwise_or.reduce(np.uint64(1) << rng.choice(64, size=k, replace=False).astype(np.uint64))
+             for k in rng.integers(1, 12, size=200)]
+    hashes = np.concatenate([bases, bases ^ np.array(flips, dtype=np.uint64), bases[:5]])
+
+    expected = pairs_brute_force(hashes, max_distance)
+    actual = pairs_multi_index(hashes, max_distance)
+
+    assert len(expected[0]) > 0
+    np.testing.assert_array_equal(actual[0], expected[0])
+    np.testing.assert_array_equal(actual[1], expected[1])
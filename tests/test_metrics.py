@@ -0,0 +1,13 @@
+import numpy as np
+from metrics import match_pairs
+
+def test_match_pairs_is_greedy_by_iou():
+    # P0-G0 0.90, P1-G0 0.85, P1-G1 0.80: P0 takes G0, so P1 must still get G1
+    pred_idx = np.array([0, 1, 1])
+    gt_idx = np.array([0, 0, 1])
+    iou = np.array([0.90, 0.85, 0.80])
+
+    correct, matched = match_pairs(pred_idx, gt_idx, iou, n_pred=2, n_gt=2, iou_thresholds=np.array([0.5, 0.82]))
+
+    np.testing.assert_array_equal(correct, [[True, True], [True, False]])
+    np.testing.assert_array_equal(matched, [[True, True], [True, False]])